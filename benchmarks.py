@@ -0,0 +1,98 @@
+import sys
+import timeit
+
+import signal_slot
+import models_registry
+
+# Micro-benchmarks for code in the GUI hot path. Run one of them
+# with, say:
+#
+# % python benchmarks.py signals
+
+
+def signals():
+    # cost of emitting a signal, such as the 'changed' signal of
+    # a model manager, with 1, 10 and 100 slots connected to it.
+    print("%8s %14s" % ("slots", "usec/emit"))
+    for slots, usec in signal_slot.benchmark(slots=(1, 10, 100)):
+        print("%8d %14.2f" % (slots, usec))
+
+
+# Builds n components, cycling over the component types in the registry.
+def _components(n):
+    names = sorted(models_registry.registry.keys())
+    return [models_registry.registry[names[i % len(names)]].copy() for i in range(n)]
+
+
+def names(n=1000):
+    # per-component cost of getting the name and module path of
+    # a component, as done when building the tree of components or
+    # writing them to a file. 'parse' is the cost of parsing the
+    # class string, as it was done at every call before the lookup
+    # was memoized.
+    components = _components(n)
+
+    def parse():
+        for component in components:
+            models_registry._parse_class(component.__class__)
+
+    def lookup():
+        for component in components:
+            models_registry.get_component_name(component)
+            models_registry.get_component_path(component)
+
+    print("%8s %14s" % ("", "usec/component"))
+    for label, function in [("parse", parse), ("lookup", lookup)]:
+        elapsed = min(timeit.repeat(function, number=1, repeat=5))
+        print("%8s %14.2f" % (label, 1.e6 * elapsed / n))
+
+
+def tree(n=1000):
+    # per-component cost of building the tree of active components
+    # with n components. Needs PyQt.
+    from PyQt4.QtGui import QApplication
+    import sp_widget
+
+    app = QApplication.instance() or QApplication([])
+    components = _components(n)
+
+    def build():
+        sp_widget.ActiveComponentsModel(components, name="Active components")
+
+    elapsed = min(timeit.repeat(build, number=1, repeat=5))
+    print("%8s %14s" % ("", "usec/component"))
+    print("%8s %14.2f" % ("tree", 1.e6 * elapsed / n))
+
+
+def kernels(n=200, points=(200, 4000)):
+    # per-component cost of evaluating a sum of n components, by
+    # calling them as astropy models, and with their NumPy kernels.
+    import numpy as np
+    import sp_eval
+
+    spectrum = sp_eval.CompiledSpectrum(_components(n))
+    print("%8s %14s %14s" % ("points", "astropy", "fast"))
+    for size in points:
+        wave = np.linspace(1., 10., size)
+        usec = [1.e6 * min(timeit.repeat(lambda: spectrum(wave, fast), number=1, repeat=5)) / n
+                for fast in (False, True)]
+        print("%8d %14.2f %14.2f" % (size, usec[0], usec[1]))
+
+
+_benchmarks = {
+    'signals': signals,
+    'names':   names,
+    'tree':    tree,
+    'kernels': kernels,
+}
+
+
+# Benchmarks are picked by name. A trailing "()" is accepted,
+# as in the command lines written in the README.
+if __name__ == "__main__":
+    name = sys.argv[1] if len(sys.argv) > 1 else ''
+    if name.endswith('()'):
+        name = name[:-2]
+    if name not in _benchmarks:
+        sys.exit("usage: python benchmarks.py <%s>" % '|'.join(sorted(_benchmarks)))
+    _benchmarks[name]()
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+import models_registry
+
+# Parameter values for the components in the models registry, used to
+# check their kernels (sp_kernels) and derivatives (sp_derivs). They stay
+# away from the points where a component or its derivatives are not
+# defined, such as the edges of a box.
+sample_values = {
+    'Box1D':                      (1.5, 5.055, 2.),
+    'Gaussian1D':                 (1.5, 5., 0.7),
+    'GaussianAbsorption1D':       (0.5, 5., 0.7),
+    'Lorentz1D':                  (1.5, 5., 0.7),
+    'MexicanHat1D':               (1.5, 5., 0.7),
+    'Trapezoid1D':                (1.5, 5.055, 2., 1.3),
+    'ExponentialCutoffPowerLaw1D':(1.5, 3., 1.2, 7.),
+    'BrokenPowerLaw1D':           (1.5, 4.055, 1.2, 2.1),
+    'LogParabola1D':              (1.5, 3., 1.2, 0.3),
+    'PowerLaw1D':                 (1.5, 3., 1.2),
+    'Linear1D':                   (0.3, 1.2),
+    'Const1D':                    (1.5,),
+    'Redshift':                   (0.3,),
+    'Scale':                      (1.5,),
+    'Shift':                      (0.3,),
+    'Sine1D':                     (1.5, 0.3, 0.2),
+    'Chebyshev1D':                (0.5, 0.2),
+    'Legendre1D':                 (0.5, 0.2),
+    'Polynomial1D':               (0.5, 0.2),
+}
+
+
+@pytest.fixture
+def sample_component():
+    ''' Builds a copy of a component in the models
+    registry, set with its sample parameter values. '''
+    def build(name):
+        component = models_registry.registry[name].copy()
+        values = sample_values[name]
+        component.parameters = np.array(values[:len(component.param_names)], dtype=np.float64)
+        return component
+    return build
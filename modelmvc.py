@@ -10,7 +10,7 @@ from glue.external.echo import callback_property, add_callback
 from PyQt4.QtCore import *
 from PyQt4.QtGui import *
 
-from astropy.modeling import Fittable1DModel, Parameter, models
+from astropy.modeling import models
 
 from sp_model_manager import SpectralModelManager
 
@@ -314,21 +314,28 @@ class ModelEventHandler(object):
 class ModelBrowser(QObject):
 
     """
-    A way to view, interact with, and fit models to a 1D spectrum
+    A way to view, interact with, and fit models to a 1D spectrum.
+
+    Fits are unweighted, unless 'weighted' is set, in which case
+    the data points are weighted by 1/dy.
     """
 
-    def __init__(self, x, y, dy, initial_models=None):
+    def __init__(self, x, y, dy, initial_models=None, weighted=False):
 
         QObject.__init__(self)
         
         self.x = x
         self.y = y
         self.dy = dy
+        self.weighted = weighted
 
         if initial_models is None:
             initial_models = [models.Const1D(0.0)]
         self.models = initial_models
 
+        # handle to the background fit in progress, if any.
+        self._fit_handle = None
+
         self.ui = ModelBrowserUI(self, self.models, self.x, self.y)
         self.plot, self.resid = _build_axes(self.ui.canvas.fig)
         self._draw(preserve_limits=False)
@@ -442,83 +449,24 @@ class ModelBrowser(QObject):
             self.ui.window.raise_()
 
     def fit(self):
-        from astropy.modeling.fitting import LevMarLSQFitter
+        # the fit button doubles as a cancel button while a fit runs.
+        if self._fit_handle is not None:
+            self._fit_handle.cancel()
+            return
 
         components = self.ui.manager.components
         if len(components) > 0:
-            model = superposition_model(*components)
-
-            fitter = LevMarLSQFitter()
-            model = fitter(model, self.x, self.y)
-            self.models = model.terms()
-
-            self.ui.manager.modifyModel(self.models)
-
-            self._draw()
-
-
-def superposition_model(*models):
-    """
-    An abomination to create a fittable superposition of astropy models
-    """
-
-    ps = []
-    params = {}
-    i = 0
-    for m in models:
-        for p in m.param_names:
-            ps.append(Parameter())
-            params['p_%i' % i] = ps[-1]
-            i += 1
-
-    def __init__(self, *args, **kwargs):
-        for i, a in enumerate(args):
-            kwargs['p_%i' % i] = a
-        super(type(self), self).__init__(**kwargs)
-
-    @staticmethod
-    def eval(x, *args):
-        result = 0
-        i = 0
-        for m in models:
-            np = len(m.param_names)
-            result += m.eval(x, *args[i:i + np])
-            i += np
-        return result
-
-    @staticmethod
-    def fit_deriv(x, *args):
-        result = []
-        i = 0
-        for m in models:
-            np = len(m.param_names)
-            result += list(m.fit_deriv(x, *args[i:i + np]))
-            i += np
-        return result
-
-    def terms(self):
-        i = 0
-        result = []
-        for m in models:
-            np = len(m.param_names)
-            m = m.copy()
-            for j in range(i, i + np):
-                src = self.param_names[j]
-                target = m.param_names[j - i]
-                setattr(m, target, getattr(self, src))
-            i += np
-            result.append(m)
-        return result
-
-    params['__init__'] = __init__
-    params['eval'] = eval
-    params['fit_deriv'] = fit_deriv
-    params['terms'] = terms
-
-    result = type('Superposition', (Fittable1DModel,), params)
+            # the tree and the plot are updated by the model manager
+            # as the fit progresses, via the 'changed' signal.
+            dy = self.dy if self.weighted else None
+            self._fit_handle = self.ui.manager.startFit(self.x, self.y, dy)
+            self.ui.fit.setText('Cancel')
+            self.ui.fit.setToolTip("Cancel the fit in progress")
 
-    args = sum((m.parameters.tolist() for m in models), [])
-    return result(*args)
+    def _fit_finished(self, result):
+        self._fit_handle = None
+        self.ui.fit.setText('Fit')
+        self.ui.fit.setToolTip("Fit model to spectrum")
 
 
 class ModelBrowserUI(object):
@@ -534,6 +482,7 @@ class ModelBrowserUI(object):
         # in a distinct color.
         self.manager.changed.connect(browser._sync_model_list)
         self.manager.selected.connect(browser._display_selected_model)
+        self.manager.fitFinished.connect(browser._fit_finished)
         # the model manager needs to know the actual
         # data being plotted and fitted.
         self.manager.setArrays(x, y)
@@ -1,43 +1,233 @@
+import os
+import json
+import inspect
+import weakref
+import importlib
+import collections
 
-# this should (perhaps?) be replaced by introspection from
-# the astropy.modeling.Model registry. For now, we directly
-# store hard-coded instances.
-
-# import astropy.modeling.functional_models as models
-import astropy.modeling.models as models
-
-registry = {
-    'Box1D' :                     models.Box1D(1.0, 1.0, 1.0),
-    'Gaussian1D':                 models.Gaussian1D(1.0, 1.0, 1.0),
-    'GaussianAbsorption1D':       models.GaussianAbsorption1D(1.0, 1.0, 1.0),
-    'Lorentz1D':                  models.Lorentz1D(1.0, 1.0, 1.0),
-    'MexicanHat1D':               models.MexicanHat1D(1.0, 1.0, 1.0),
-    'Trapezoid1D':                models.Trapezoid1D(1.0, 1.0, 1.0, 1.0),
-    'ExponentialCutoffPowerLaw1D':models.ExponentialCutoffPowerLaw1D(1.0, 1.0, 1.0, 1.0),
-    'BrokenPowerLaw1D':           models.BrokenPowerLaw1D(1.0, 1.0, 1.0, 1.0),
-    'LogParabola1D' :             models.LogParabola1D(1.0, 1.0, 1.0, 1.0),
-    'PowerLaw1D' :                models.PowerLaw1D(1.0, 1.0, 1.0),
-    'Linear1D':                   models.Linear1D(1.0, 0.0),
-    'Const1D':                    models.Const1D(0.0),
-    'Redshift':                   models.Redshift(0.0),
-    'Scale':                      models.Scale(1.0),
-    'Shift':                      models.Shift(0.0),
-    'Sine1D' :                    models.Sine1D(1.0, 1.0),
-    'Chebyshev1D':                models.Chebyshev1D(1),
-    'Legendre1D' :                models.Legendre1D(1),
-    'Polynomial1D' :              models.Polynomial1D(1),
-}
+# Registry of the spectral components offered by the GUI. Components
+# are stored as factories: importing this module does not import
+# astropy.modeling, nor build any component instance. A prototype
+# instance of each component is built the first time it is looked
+# up, and re-used from then on.
+#
+# The hard-coded entries below can be complemented with the
+# Fittable1DModel subclasses found in astropy.modeling.models, by
+# calling discover(). The catalog of discovered classes is cached
+# on disk, so introspection only runs once per astropy version.
 
 
-def get_component_name(function):
-    # there must be a better way of getting the class' name......
-    class_string = str(function.__class__)
-    return class_string.split('\'>')[0].split(".")[-1]
+# Factory that imports a model class and builds an instance.
+def _factory(module_path, class_name, *args):
+    def build():
+        module = importlib.import_module(module_path)
+        return getattr(module, class_name)(*args)
+    return build
 
 
-def get_component_path(function):
-    class_string = str(function.__class__)
+class LazyRegistry(collections.Mapping):
+    """ Dict-like registry of spectral component prototypes.
+
+    Keys are component names, values are prototype instances of the
+    components, built on first access. Prototypes are shared, so they
+    should be copied before being modified or added to a model.
+
+    """
+    def __init__(self):
+        self._factories = collections.OrderedDict()
+        self._prototypes = {}
+
+        # index from class name to registry key, and reverse
+        # index from component class to registry key.
+        self._class_keys = {}
+        self._keys = weakref.WeakKeyDictionary()
+
+    def register(self, name, factory, class_name=None):
+        ''' Registers a component, given a function that
+        builds a prototype instance of it, and the name of
+        the prototype class, if not the same as the key. '''
+        self._factories[name] = factory
+        self._prototypes.pop(name, None)
+        self._class_keys[class_name or name] = name
+        self._keys.clear()
+
+    def __getitem__(self, name):
+        try:
+            return self._prototypes[name]
+        except KeyError:
+            prototype = self._factories[name]()
+            self._prototypes[name] = prototype
+            return prototype
+
+    def key_of(self, component):
+        ''' Gets the registry key of the class of a component,
+        or None if the class is not in the registry. '''
+        cls = component.__class__
+        try:
+            return self._keys[cls]
+        except KeyError:
+            pass
+        # classes in other modules may have the same name, so the
+        # class of the prototype is checked as well.
+        key = self._class_keys.get(get_component_name(component))
+        if key is not None and self[key].__class__ is not cls:
+            key = None
+        self._keys[cls] = key
+        return key
+
+    def __contains__(self, name):
+        return name in self._factories
+
+    def __iter__(self):
+        return iter(self._factories)
+
+    def __len__(self):
+        return len(self._factories)
+
+
+registry = LazyRegistry()
+
+for _name, _args in [
+    ('Box1D',                      (1.0, 1.0, 1.0)),
+    ('Gaussian1D',                 (1.0, 1.0, 1.0)),
+    ('GaussianAbsorption1D',       (1.0, 1.0, 1.0)),
+    ('Lorentz1D',                  (1.0, 1.0, 1.0)),
+    ('MexicanHat1D',               (1.0, 1.0, 1.0)),
+    ('Trapezoid1D',                (1.0, 1.0, 1.0, 1.0)),
+    ('ExponentialCutoffPowerLaw1D',(1.0, 1.0, 1.0, 1.0)),
+    ('BrokenPowerLaw1D',           (1.0, 1.0, 1.0, 1.0)),
+    ('LogParabola1D',              (1.0, 1.0, 1.0, 1.0)),
+    ('PowerLaw1D',                 (1.0, 1.0, 1.0)),
+    ('Linear1D',                   (1.0, 0.0)),
+    ('Const1D',                    (0.0,)),
+    ('Redshift',                   (0.0,)),
+    ('Scale',                      (1.0,)),
+    ('Shift',                      (0.0,)),
+    ('Sine1D',                     (1.0, 1.0)),
+    ('Chebyshev1D',                (1,)),
+    ('Legendre1D',                 (1,)),
+    ('Polynomial1D',               (1,)),
+]:
+    registry.register(_name, _factory('astropy.modeling.models', _name, *_args))
+
+
+# Location of the cached catalog of discovered components. It
+# can be moved with the MODELGUI_CATALOG environment variable.
+catalog_file = os.environ.get('MODELGUI_CATALOG',
+                              os.path.join(os.path.expanduser('~'), '.modelgui', 'catalog.json'))
+
+
+# Finds the Fittable1DModel subclasses in astropy.modeling.models
+# that can be built with their default parameter values. Returns a
+# catalog: a list of (component name, module path) pairs.
+def _introspect():
+    from astropy.modeling import models, Fittable1DModel
+
+    catalog = []
+    for name, cls in sorted(vars(models).items()):
+        if not inspect.isclass(cls) or cls.__name__ != name or \
+           not issubclass(cls, Fittable1DModel):
+            continue
+        try:
+            cls()
+        except Exception:
+            continue
+        catalog.append((str(name), str(cls.__module__)))
+    return catalog
+
+
+def _read_catalog(fname, version):
+    try:
+        with open(fname) as f:
+            cached = json.load(f)
+        if cached['astropy'] == version:
+            return [(str(name), str(path)) for name, path in cached['components']]
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+# Writes the catalog to a temporary file first, and moves it in place
+# once complete, so concurrent processes never read a partial file.
+# The cache is an optimization only: failing to write it is ignored.
+def _write_catalog(fname, version, catalog):
+    try:
+        directory = os.path.dirname(fname)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        temporary = '%s.%d' % (fname, os.getpid())
+        with open(temporary, 'w') as f:
+            json.dump({'astropy': version, 'components': catalog}, f, indent=1)
+        os.rename(temporary, fname)
+    except (IOError, OSError):
+        pass
+
+
+def discover(fname=None):
+    """ Adds to the registry the spectral components found in
+    astropy.modeling.models.
+
+    All Fittable1DModel subclasses that can be built with their default
+    parameter values are added, except for the ones that are already
+    in the registry. The catalog of classes found is cached on disk,
+    and re-used for as long as the astropy version does not change.
+
+    Parameters
+    ----------
+    fname: str, optional
+      the catalog file. Defaults to the value of module variable
+      catalog_file. An empty string disables the cache.
+
+    Returns
+    -------
+    A list with the names of the components added to the registry.
+
+    """
+    import astropy
+
+    if fname is None:
+        fname = catalog_file
+    catalog = _read_catalog(fname, astropy.__version__) if fname else None
+    if catalog is None:
+        catalog = _introspect()
+        if fname:
+            _write_catalog(fname, astropy.__version__, catalog)
+
+    result = []
+    for name, module_path in catalog:
+        if name not in registry:
+            registry.register(name, _factory(module_path, name))
+            result.append(name)
+    return result
+
+
+# Gets the name and the module path of a component class from its
+# string representation.
+def _parse_class(cls):
+    class_string = str(cls)
+    name = class_string.split('\'>')[0].split(".")[-1]
     module_path = class_string.split('\'')[1]
     index = module_path.rfind('.')
-    module_path = module_path[:index]
-    return module_path
+    return name, module_path[:index]
+
+
+# Names and module paths of the component classes seen so far. Each
+# compound model expression makes a class of its own, so classes are
+# held by weak reference, and forgotten when no longer in use.
+_class_names = weakref.WeakKeyDictionary()
+
+
+def _lookup_class(cls):
+    try:
+        return _class_names[cls]
+    except KeyError:
+        result = _class_names[cls] = _parse_class(cls)
+        return result
+
+
+def get_component_name(function):
+    return _lookup_class(function.__class__)[0]
+
+
+def get_component_path(function):
+    return _lookup_class(function.__class__)[1]
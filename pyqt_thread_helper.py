@@ -1,3 +1,6 @@
+import logging
+import traceback
+import collections
 import threading
 
 """
@@ -12,7 +15,8 @@ loop in a separate thread.
 
 Rules when using multiple threads:
 - Don't directly run code that accesses PyQt.  Instead, call queueCommand
-  to queue a command to run on the thread dedicated to PyQt apps.
+  to queue a command to run on the thread dedicated to PyQt apps. It
+  returns a CommandFuture, which can be used to wait for the result.
 - Don't import PyQt4 from any code that isn't running on the PyQt thread.
 - Don't create QtGui.QApplication's.  Instead, call getApplication.
 - Don't write/print anything to stdout/stderr (at least not when there's a
@@ -24,33 +28,131 @@ Rules when using multiple threads:
 # ends.
 use_separate_thread = True
 
-__command_queue = []
+# Commands wait in a FIFO queue. The PyQt thread runs all the commands
+# that are in the queue each time it wakes up. Once the QApplication
+# exists, the PyQt thread may be stuck in its event loop (started by a
+# command), so commands are also run from the event loop: a signal is
+# sent to a QObject that lives in the PyQt thread, and Qt delivers it
+# there.
+__command_queue = collections.deque()
 __command_queue_lock = threading.RLock()
 __command_queue_event = threading.Event()
 
 __pyqt_thread = None
 __pyqt_app = None
+__pyqt_pump = None
+
+_log = logging.getLogger(__name__)
+
+
+class CommandTimeout(Exception):
+    """Raised when the result of a queued command is not ready in time."""
+
+
+class CommandFuture(object):
+    """The result of a command queued to run on the PyQt thread.
+
+    An exception raised by the command is kept in the future. If it
+    was never retrieved, with result() or exception(), by the time
+    the future is garbage-collected, it is logged as an error to the
+    logger of this module, so failures of fire-and-forget commands
+    do not go unnoticed."""
+    def __init__(self):
+        self._event = threading.Event()
+        self._result = None
+        self._exception = None
+        self._traceback = None
+        self._retrieved = False
+
+    def done(self):
+        """Returns True if the command was run."""
+        return self._event.is_set()
+
+    def result(self, timeout=None):
+        """Waits for the command to run, and returns what it returned.
+        Exceptions raised by the command are raised here again."""
+        exception = self.exception(timeout)
+        if exception is not None:
+            raise exception
+        return self._result
+
+    def exception(self, timeout=None):
+        """Waits for the command to run, and returns the exception it
+        raised, or None. Raises CommandTimeout if the command is not
+        run after timeout seconds."""
+        if not self._event.wait(timeout):
+            raise CommandTimeout("Command not run after %s seconds." % timeout)
+        self._retrieved = True
+        return self._exception
+
+    # Exceptions that are not an Exception (SystemExit, say) are kept
+    # too, but go on up the PyQt thread. Waiters are woken up anyway.
+    # The traceback is kept as text: keeping the traceback object would
+    # make a reference cycle through this frame, and futures in a cycle
+    # are never collected.
+    def _run(self, callable, arguments):
+        try:
+            self._result = callable(*arguments)
+        except BaseException as e:
+            self._exception = e
+            self._traceback = traceback.format_exc()
+            if not isinstance(e, Exception):
+                raise
+        finally:
+            self._event.set()
+
+    def __del__(self):
+        if isinstance(self._exception, Exception) and not self._retrieved:
+            _log.error("Exception in a queued PyQt command that nobody retrieved:\n%s",
+                       self._traceback)
+
 
 def queueCommand(callable, arguments=()):
-    """Queue up a command to run on the PyQt thread."""
+    """Queue up a command to run on the PyQt thread.
+
+    Commands run in the order they were queued. Returns a CommandFuture
+    that can be used to wait for the command and get its result."""
+    future = CommandFuture()
     if use_separate_thread == False:
-        callable(*arguments)
-        return
+        future._run(callable, arguments)
+        return future
 
     # Start up the PyQt thread if it's not already running.
     global __pyqt_thread
 
-    if __pyqt_thread is None:
-        __pyqt_thread = threading.Thread(target=__pyQtThreadMain, name="pyqt_thread")
-        __pyqt_thread.setDaemon(True)
-        __pyqt_thread.start()
+    with __command_queue_lock:
+        if __pyqt_thread is None:
+            __pyqt_thread = threading.Thread(target=__pyQtThreadMain, name="pyqt_thread")
+            __pyqt_thread.setDaemon(True)
+            __pyqt_thread.start()
+
+        __command_queue.append((future, callable, arguments))
+
+        # Signal the PyQt thread to run the task.
+        __command_queue_event.set()
+        pump = __pyqt_pump
+
+    if pump is not None:
+        pump[0].emit(pump[1])
 
-    __command_queue_lock.acquire()
-    __command_queue.append((callable, arguments))
-    __command_queue_lock.release()
+    return future
 
-    # Signal the PyQt thread to run the task.
-    __command_queue_event.set()
+def queueCommands(commands):
+    """Queue up a batch of (callable, arguments) commands to run on the
+    PyQt thread, and return a list with their CommandFuture's."""
+    return [queueCommand(callable, arguments) for callable, arguments in commands]
+
+def __runCommands():
+    """Run all queued commands, in order, until the queue is empty."""
+    while True:
+        # the event is cleared only when the queue is found empty,
+        # so no command can be left waiting for the next wakeup.
+        with __command_queue_lock:
+            if not __command_queue:
+                __command_queue_event.clear()
+                return
+            future, callable, arguments = __command_queue.popleft()
+        future._run(callable, arguments)
 
 def __pyQtThreadMain():
     """This function is the starting point for the PyQt thread."""
@@ -64,15 +166,8 @@ def __pyQtThreadMain():
         # Wait for the main thread to signal us.
         __command_queue_event.wait()
 
-        # Remove the command from the stack and reset the event.
-        __command_queue_lock.acquire()
-        command = __command_queue.pop()
-        __command_queue_event.clear()
-        __command_queue_lock.release()
-
-        # Run the command.
-        if command[0]:
-            command[0].__call__(*command[1])
+        # Run everything that was queued so far.
+        __runCommands()
 
 def getApplication():
     """Return the QtGui.QApplication.  Use this function instead of creating
@@ -84,6 +179,16 @@ def getApplication():
 
     # We're careful not to create more than one QApplication.
     global __pyqt_app
+    global __pyqt_pump
     if __pyqt_app is None:
         __pyqt_app = QtGui.QApplication(['Model Manager'])
+
+        # commands queued from now on are also run by the event loop.
+        # The signal is built here too, so other threads
+        # can send it without touching the PyQt4 modules.
+        pump = QtCore.QObject()
+        signal = QtCore.SIGNAL("runCommands")
+        pump.connect(pump, signal, __runCommands)
+        with __command_queue_lock:
+            __pyqt_pump = (pump, signal)
     return __pyqt_app
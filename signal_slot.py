@@ -13,65 +13,181 @@ License: MIT
 from __future__ import print_function
 # import six
 import inspect
+import threading
+import timeit
+import traceback
 import warnings
-from weakref import WeakSet, WeakKeyDictionary
+import weakref
+try:
+    import Queue
+except ImportError:
+    import queue as Queue
 
 # from debug import msg_debug
 
 class Signal(object):
-    def __init__(self):
-        self._functions = WeakSet()
-        self._methods = WeakKeyDictionary()
+    """ A signal that calls the slots connected to it when called.
+
+    Slots are held by weak reference, so connecting a function or a
+    bound method to a signal does not keep it (or its object) alive.
+    The slots are called from a tuple that is built when the set of
+    slots changes (on connect, disconnect, or when a slot is garbage
+    collected), so emitting a signal does not copy any containers.
+
+    Parameters
+    ----------
+    queue: callable, optional
+      if provided, slots are not called by the emitting code. Instead,
+      each emission is passed to queue as a callable and a tuple of
+      arguments, to be run later, perhaps on another thread. The
+      signature is the one of pyqt_thread_helper.queueCommand, so
+      that function can be used to deliver signals on the PyQt thread.
+      See also WorkerQueue. Slots get called with the slots that were
+      connected when the signal was emitted.
+
+    """
+    def __init__(self, queue=None):
+        self._slots = {}
+        self._snapshot = ()
+        self._queue = queue
 
     def __call__(self, *args, **kargs):
-        # Call handler functions
-        to_be_removed = []
-        for func in self._functions.copy():
+        if self._queue is None:
+            self._deliver(self._snapshot, args, kargs)
+        else:
+            self._queue(self._deliver, (self._snapshot, args, kargs))
+
+    # Calls the slots in a snapshot. Each entry holds a weak reference
+    # to a function, with no unbound function; or a weak reference to
+    # an object, with the unbound function of the method to call on it.
+    def _deliver(self, snapshot, args, kargs):
+        for reference, func in snapshot:
+            target = reference()
+            if target is None:
+                continue
             try:
-                func(*args, **kargs)
+                if func is None:
+                    target(*args, **kargs)
+                else:
+                    func(target, *args, **kargs)
             except RuntimeError:
-                Warning.warn('Signals func->RuntimeError: func "{}" will be removed.'.format(func))
-                to_be_removed.append(func)
-
-        for remove in to_be_removed:
-            self._functions.discard(remove)
-
-        # Call handler methods
-        to_be_removed = []
-        emitters = self._methods.copy()
-        for obj, funcs in emitters.items():
-            print ('obj is type "{}"'.format(type(obj)))
-            for func in funcs.copy():
-                try:
-                    func(obj, *args, **kargs)
-                except RuntimeError:
-                    warnings.warn('Signals methods->RuntimeError, obj.func "{}.{}" will be removed'.format(obj, func))
-                    to_be_removed.append((obj, func))
-
-        for obj, func in to_be_removed:
-            self._methods[obj].discard(func)
+                warnings.warn('Signals slot->RuntimeError: slot "{}" will be removed.'.format(
+                              target if func is None else func))
+                self._remove(self._key(target, func))
 
-    def connect(self, slot):
-        if inspect.ismethod(slot):
-            if slot.__self__ not in self._methods:
-                self._methods[slot.__self__] = set()
+    @staticmethod
+    def _key(target, func):
+        return id(target) if func is None else (id(target), func)
+
+    def _update(self):
+        self._snapshot = tuple(entry for entry in self._slots.values()
+                               if entry[0]() is not None)
 
-            self._methods[slot.__self__].add(slot.__func__)
+    def _remove(self, key):
+        if self._slots.pop(key, None) is not None:
+            self._update()
 
+    def connect(self, slot):
+        if inspect.ismethod(slot):
+            target, func = slot.__self__, slot.__func__
         else:
-            self._functions.add(slot)
+            target, func = slot, None
+        key = self._key(target, func)
+        if key not in self._slots:
+            self._slots[key] = (self._reference(target, key), func)
+            self._update()
+
+    # Weak reference that drops its slot when the target is collected.
+    # The callback holds the signal by weak reference too, so slots do
+    # not keep signals alive.
+    def _reference(self, target, key):
+        signal = weakref.ref(self)
+        def collected(reference):
+            self = signal()
+            if self is not None and self._slots.get(key, (None,))[0] is reference:
+                self._remove(key)
+        return weakref.ref(target, collected)
 
     def disconnect(self, slot):
         if inspect.ismethod(slot):
-            if slot.__self__ in self._methods:
-                self._methods[slot.__self__].remove(slot.__func__)
+            self._remove(self._key(slot.__self__, slot.__func__))
         else:
-            if slot in self._functions:
-                self._functions.remove(slot)
+            self._remove(self._key(slot, None))
 
     def clear(self):
-        self._functions.clear()
-        self._methods.clear()
+        self._slots.clear()
+        self._snapshot = ()
+
+
+class WorkerQueue(object):
+    """ Runs callables in order, on a worker thread of its own.
+
+    Instances can be passed as the 'queue' of a Signal, so its slots
+    are called on the worker thread, and the emitting code does not
+    wait for them to finish. The thread is started by the first call.
+
+    """
+    def __init__(self, name="signal_worker"):
+        self._name = name
+        self._queue = Queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def __call__(self, callable, arguments=()):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self._name)
+                self._thread.setDaemon(True)
+                self._thread.start()
+        self._queue.put((callable, arguments))
+
+    def join(self):
+        ''' Waits until all callables queued so far were run. '''
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            callable, arguments = self._queue.get()
+            try:
+                callable(*arguments)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                self._queue.task_done()
+
+
+def benchmark(slots=(1, 10, 100), emits=10000):
+    """ Times the emission of a signal with a number of slots
+    connected to it, half of them functions and half methods.
+
+    Returns
+    -------
+    A list of (number of slots, microseconds per emission) pairs.
+
+    """
+    class Listener(object):
+        def handler(self, value):
+            pass
+
+    result = []
+    for n in slots:
+        signal = Signal()
+        keep = []
+        for i in range(n):
+            if i % 2:
+                listener = Listener()
+                signal.connect(listener.handler)
+            else:
+                listener = lambda value: None
+                signal.connect(listener)
+            keep.append(listener)
+
+        start = timeit.default_timer()
+        for i in range(emits):
+            signal(i)
+        elapsed = timeit.default_timer() - start
+        result.append((n, 1.e6 * elapsed / emits))
+    return result
 
 
 class SignalsErrorBase(Exception):
@@ -0,0 +1,324 @@
+import collections
+
+import numpy as np
+
+import sp_eval
+
+# Astropy builds compound models one binary operator at a time, so
+# adding components one after the other with + makes a left-deep tree
+# of operators. A new model class is built at each step, and its depth
+# grows with the number of components: building, evaluating and
+# formatting the model get slower with every component added, and
+# models with many hundreds of components hit the recursion limit.
+#
+# Spectral models are most often plain sums of components. A
+# SummedCompoundModel holds the components of a sum in a flat list.
+# Appending a component takes constant time, and the sum is evaluated
+# in a single loop over the components. It is not an astropy model:
+# it provides the parts of the compound model interface that this
+# package uses (and a few more), and can be turned into an astropy
+# compound model with to_compound when needed.
+
+
+# The fixed flags, ties or bounds of all parameters in a summed
+# model, keyed by the names astropy gives to the parameters of a
+# compound model (the parameter name with the index of the component
+# appended). Entries are read from, and written to, the components.
+class _ConstraintView(collections.MutableMapping):
+    def __init__(self, model, kind):
+        self._model = model
+        self._kind = kind
+
+    def __getitem__(self, name):
+        component, param_name = self._model._parameter(name)
+        return getattr(component, self._kind)[param_name]
+
+    def __setitem__(self, name, value):
+        component, param_name = self._model._parameter(name)
+        getattr(component, self._kind)[param_name] = value
+
+    def __delitem__(self, name):
+        raise TypeError("Parameters cannot be removed.")
+
+    def __iter__(self):
+        return iter(self._model.param_names)
+
+    def __len__(self):
+        return len(self._model.param_names)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class SummedCompoundModel(object):
+    """ Compound model that is the sum of its components.
+
+    The components are kept in a flat list, as they are: indexing the
+    model, or iterating over it, returns the component instances
+    themselves, not copies. The model can be used, as an astropy
+    compound model would, to compute fluxes, to get and set parameter
+    values, fixed flags, ties and bounds with their compound model
+    names (as in amplitude_0), and to get components by index or name.
+
+    Parameters
+    ----------
+    components: list, optional
+      The components to be added up, in order.
+    name: str, optional
+      The model name.
+
+    """
+    inputs = ('x',)
+    outputs = ('y',)
+    n_inputs = 1
+    n_outputs = 1
+
+    def __init__(self, components=(), name=None):
+        self._submodels = []
+        self._names = {}
+        self._param_map = None
+        self.name = name
+        for component in components:
+            self.append(component)
+
+    def append(self, component):
+        ''' Adds a component to the end of the sum. '''
+        if isinstance(component, SummedCompoundModel):
+            for c in component:
+                self.append(c)
+            return
+        if component.name is not None and component.name not in self._names:
+            self._names[component.name] = len(self._submodels)
+        self._submodels.append(component)
+        self._param_map = None
+
+    def n_submodels(self):
+        return len(self._submodels)
+
+    @property
+    def submodel_names(self):
+        return tuple(c.name if c.name is not None else 'None_%d' % i
+                     for i, c in enumerate(self._submodels))
+
+    def _format_expression(self):
+        return ' + '.join('[%d]' % i for i in range(len(self._submodels)))
+
+    # Maps the compound model names of the parameters to the
+    # (component, parameter name) they refer to. Built when
+    # first needed after a component was appended.
+    def _parameters_map(self):
+        if self._param_map is None:
+            self._param_map = collections.OrderedDict()
+            for i, component in enumerate(self._submodels):
+                for param_name in component.param_names:
+                    self._param_map['%s_%d' % (param_name, i)] = (component, param_name)
+        return self._param_map
+
+    def _parameter(self, name):
+        try:
+            return self._parameters_map()[name]
+        except KeyError:
+            raise KeyError("%r is not a parameter of this model." % name)
+
+    @property
+    def param_names(self):
+        return tuple(self._parameters_map())
+
+    @property
+    def parameters(self):
+        if len(self._submodels) == 0:
+            return np.zeros(0)
+        return np.concatenate([np.ravel(c.parameters) for c in self._submodels])
+
+    @parameters.setter
+    def parameters(self, values):
+        values = np.ravel(values)
+        if len(values) != len(self._parameters_map()):
+            raise ValueError("Expected %d parameter values, got %d."
+                             % (len(self._parameters_map()), len(values)))
+        i = 0
+        for component in self._submodels:
+            n = len(component.param_names)
+            component.parameters = values[i:i + n]
+            i += n
+
+    @property
+    def fixed(self):
+        return _ConstraintView(self, 'fixed')
+
+    @property
+    def tied(self):
+        return _ConstraintView(self, 'tied')
+
+    @property
+    def bounds(self):
+        return _ConstraintView(self, 'bounds')
+
+    # parameters can be reached as attributes of the model, with
+    # their compound model names, as in astropy compound models.
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            component, param_name = self._parameter(name)
+        except KeyError:
+            raise AttributeError(name)
+        return getattr(component, param_name)
+
+    def __setattr__(self, name, value):
+        if not name.startswith('_') and name != 'name' and \
+           self.__dict__.get('_submodels') and name in self._parameters_map():
+            component, param_name = self._param_map[name]
+            setattr(component, param_name, value)
+        else:
+            super(SummedCompoundModel, self).__setattr__(name, value)
+
+    def __call__(self, x):
+        x = np.asarray(x, dtype=np.float64)
+        result = np.zeros(x.shape)
+        for component in self._submodels:
+            result += component(x)
+        return result[()]
+
+    def evaluate(self, x, *params):
+        ''' Computes the sum with the given parameter values,
+        in the order of param_names. '''
+        x = np.asarray(x, dtype=np.float64)
+        result = np.zeros(x.shape)
+        i = 0
+        for component in self._submodels:
+            n = len(component.param_names)
+            result += component.evaluate(x, *params[i:i + n])
+            i += n
+        return result
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return SummedCompoundModel(self._submodels[index])
+        if isinstance(index, basestring):
+            return self._submodels[self._find(index)]
+        return self._submodels[index]
+
+    # Finds a component by name. Components can be renamed after
+    # they were appended, so the index is rebuilt when found stale.
+    def _find(self, name):
+        i = self._names.get(name)
+        if i is None or self._submodels[i].name != name:
+            self._names = {}
+            for i, component in reversed(list(enumerate(self._submodels))):
+                if component.name is not None:
+                    self._names[component.name] = i
+            i = self._names.get(name)
+            if i is None:
+                raise IndexError("No component named %r." % name)
+        return i
+
+    def __iter__(self):
+        return iter(self._submodels)
+
+    # as in astropy models, the length is the number of
+    # models in the model set, always one here.
+    def __len__(self):
+        return 1
+
+    def __add__(self, other):
+        result = SummedCompoundModel(self._submodels)
+        result.append(other)
+        return result
+
+    def __radd__(self, other):
+        result = SummedCompoundModel([other])
+        result.append(self)
+        return result
+
+    def __iadd__(self, other):
+        self.append(other)
+        return self
+
+    def copy(self):
+        return SummedCompoundModel([c.copy() for c in self._submodels], name=self.name)
+
+    def to_compound(self):
+        """ Builds the equivalent astropy compound model.
+
+        Components are added up as a balanced tree, so its depth grows
+        with the logarithm of the number of components. Evaluation of
+        the result returns the same values as the summed model, although
+        the order of the additions can differ in the last bits.
+
+        Returns
+        -------
+        astropy compound model, a single component, or None if
+        the model has no components.
+
+        """
+        level = list(self._submodels)
+        if len(level) == 0:
+            return None
+        while len(level) > 1:
+            pairs = [level[i] + level[i + 1] for i in range(0, len(level) - 1, 2)]
+            if len(level) % 2:
+                pairs.append(level[-1])
+            level = pairs
+        return level[0]
+
+    def __repr__(self):
+        return "<SummedCompoundModel(%s)>" % ', '.join(repr(c) for c in self._submodels)
+
+    def __str__(self):
+        return "Model: SummedCompoundModel\nName: %s\nComponents: %d\nExpression: %s" % \
+               (self.name, len(self._submodels), self._format_expression())
+
+
+def add(model, component):
+    """ Adds a component to a model.
+
+    Models that are sums of components come back as a
+    SummedCompoundModel. A SummedCompoundModel gets the component
+    appended in place. Any other kind of compound model is added
+    to as usual, with the astropy + operator.
+
+    Parameters
+    ----------
+    model: SummedCompoundModel, astropy model, list, or None
+      The model. Lists and None are taken as the sum of their
+      elements, and an empty sum, respectively.
+    component: astropy model
+      The component.
+
+    Returns
+    -------
+    The model with the component added.
+
+    """
+    if model is None:
+        return component
+    if isinstance(model, SummedCompoundModel):
+        model.append(component)
+        return model
+    if isinstance(model, (list, tuple)):
+        return SummedCompoundModel(list(model) + [component])
+    if sp_eval.is_summed(model):
+        components = list(model) if hasattr(model, '_submodels') else [model]
+        return SummedCompoundModel(components + [component])
+    return model + component
+
+
+def flatten(model):
+    """ Gets a model that is a sum of components as a flat sum.
+
+    Parameters
+    ----------
+    model: astropy model, or SummedCompoundModel
+      The model.
+
+    Returns
+    -------
+    A SummedCompoundModel with the components of astropy compound
+    models that are plain sums. Any other model is returned as is.
+
+    """
+    if isinstance(model, SummedCompoundModel) or not hasattr(model, '_submodels') or \
+       not sp_eval.is_summed(model):
+        return model
+    return SummedCompoundModel(list(model))
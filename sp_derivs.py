@@ -0,0 +1,216 @@
+import numpy as np
+
+import models_registry
+
+# Analytic derivatives of the spectral components in the models
+# registry, with respect to their parameters. Not all astropy models
+# provide a fit_deriv method (and a few of those that do are not quite
+# right), in which case the fitters fall back to estimating the
+# Jacobian by finite differences. That costs one extra evaluation of
+# the whole model per free parameter, at every iteration.
+#
+# Each function takes the spectral coordinates followed by the model
+# parameters, in the same order as in the model's param_names, and
+# returns a list with one derivative array per parameter. All of them
+# broadcast, so they can be called with columns of parameter values to
+# get the derivatives of many components of the same type at once.
+#
+# Derivatives with respect to the position and width of Box1D are delta
+# functions at the box edges. As in astropy, they are taken to be zero.
+
+
+def _gaussian1d(x, amplitude, mean, stddev):
+    d = x - mean
+    g = np.exp(-0.5 * d * d / (stddev * stddev))
+    d_amplitude = g
+    d_mean = amplitude * g * d / (stddev * stddev)
+    d_stddev = amplitude * g * d * d / (stddev * stddev * stddev)
+    return [d_amplitude, d_mean, d_stddev]
+
+
+def _gaussian_absorption1d(x, amplitude, mean, stddev):
+    return [-d for d in _gaussian1d(x, amplitude, mean, stddev)]
+
+
+def _lorentz1d(x, amplitude, x_0, fwhm):
+    d = x - x_0
+    gamma = fwhm / 2.
+    denominator = gamma * gamma + d * d
+    d_amplitude = gamma * gamma / denominator
+    d_x_0 = amplitude * gamma * gamma * 2. * d / (denominator * denominator)
+    d_fwhm = amplitude * gamma * d * d / (denominator * denominator)
+    return [d_amplitude, d_x_0, d_fwhm]
+
+
+def _mexican_hat1d(x, amplitude, x_0, sigma):
+    d = x - x_0
+    u = d * d / (sigma * sigma)
+    e = np.exp(-u / 2.)
+    d_u = amplitude * e * (u - 3.) / 2.
+    d_amplitude = (1. - u) * e
+    d_x_0 = d_u * (-2. * d / (sigma * sigma))
+    d_sigma = d_u * (-2. * u / sigma)
+    return [d_amplitude, d_x_0, d_sigma]
+
+
+def _box1d(x, amplitude, x_0, width):
+    inside = np.logical_and(x >= x_0 - width / 2., x <= x_0 + width / 2.)
+    d_amplitude = np.where(inside, 1., 0.) * np.ones_like(amplitude)
+    zeros = np.zeros_like(d_amplitude)
+    return [d_amplitude, zeros, zeros]
+
+
+def _trapezoid1d(x, amplitude, x_0, width, slope):
+    x2 = x_0 - width / 2.
+    x3 = x_0 + width / 2.
+    x1 = x2 - amplitude / slope
+    x4 = x3 + amplitude / slope
+    rising = np.logical_and(x >= x1, x < x2)
+    plateau = np.logical_and(x >= x2, x < x3)
+    falling = np.logical_and(x >= x3, x < x4)
+    zeros = np.zeros(np.broadcast(x, amplitude, x_0, width, slope).shape)
+    d_amplitude = np.where(rising | plateau | falling, 1., zeros)
+    d_x_0 = np.select([rising, falling], [-slope + zeros, slope + zeros], 0.)
+    d_width = np.where(rising | falling, slope / 2. + zeros, zeros)
+    d_slope = np.select([rising, falling], [x - x2 + zeros, x3 - x + zeros], 0.)
+    return [d_amplitude, d_x_0, d_width, d_slope]
+
+
+def _power_law1d(x, amplitude, x_0, alpha):
+    xx = x / x_0
+    f = xx ** (-alpha)
+    d_amplitude = f
+    d_x_0 = amplitude * alpha * f / x_0
+    d_alpha = -amplitude * f * np.log(xx)
+    return [d_amplitude, d_x_0, d_alpha]
+
+
+def _broken_power_law1d(x, amplitude, x_break, alpha_1, alpha_2):
+    below = x < x_break
+    alpha = np.where(below, alpha_1, alpha_2)
+    xx = x / x_break
+    f = amplitude * xx ** (-alpha)
+    d_amplitude = f / amplitude
+    d_x_break = f * alpha / x_break
+    d_alpha = -f * np.log(xx)
+    d_alpha_1 = np.where(below, d_alpha, 0.)
+    d_alpha_2 = np.where(below, 0., d_alpha)
+    return [d_amplitude, d_x_break, d_alpha_1, d_alpha_2]
+
+
+def _exponential_cutoff_power_law1d(x, amplitude, x_0, alpha, x_cutoff):
+    xx = x / x_0
+    f = amplitude * xx ** (-alpha) * np.exp(-x / x_cutoff)
+    d_amplitude = f / amplitude
+    d_x_0 = f * alpha / x_0
+    d_alpha = -f * np.log(xx)
+    d_x_cutoff = f * x / (x_cutoff * x_cutoff)
+    return [d_amplitude, d_x_0, d_alpha, d_x_cutoff]
+
+
+def _log_parabola1d(x, amplitude, x_0, alpha, beta):
+    xx = x / x_0
+    log_xx = np.log(xx)
+    f = amplitude * xx ** (-alpha - beta * log_xx)
+    d_amplitude = f / amplitude
+    d_x_0 = f * (alpha + 2. * beta * log_xx) / x_0
+    d_alpha = -f * log_xx
+    d_beta = -f * log_xx * log_xx
+    return [d_amplitude, d_x_0, d_alpha, d_beta]
+
+
+def _linear1d(x, slope, intercept):
+    ones = np.ones(np.broadcast(x, slope, intercept).shape)
+    return [x * ones, ones]
+
+
+def _const1d(x, amplitude):
+    return [np.ones(np.broadcast(x, amplitude).shape)]
+
+
+# astropy versions before 1.1 have no phase parameter in Sine1D.
+def _sine1d(x, amplitude, frequency, phase=None):
+    argument = 2. * np.pi * frequency * x
+    if phase is not None:
+        argument = argument + 2. * np.pi * phase
+    d_amplitude = np.sin(argument)
+    d_phase = amplitude * np.cos(argument) * 2. * np.pi
+    result = [d_amplitude, d_phase * x]
+    if phase is not None:
+        result.append(d_phase)
+    return result
+
+
+def _redshift(x, z):
+    return [x * np.ones_like(z)]
+
+
+def _scale(x, factor):
+    return [x * np.ones_like(factor)]
+
+
+def _shift(x, offset):
+    return [np.ones(np.broadcast(x, offset).shape)]
+
+
+_derivatives = {
+    'Box1D':                      _box1d,
+    'Gaussian1D':                 _gaussian1d,
+    'GaussianAbsorption1D':       _gaussian_absorption1d,
+    'Lorentz1D':                  _lorentz1d,
+    'MexicanHat1D':               _mexican_hat1d,
+    'Trapezoid1D':                _trapezoid1d,
+    'ExponentialCutoffPowerLaw1D':_exponential_cutoff_power_law1d,
+    'BrokenPowerLaw1D':           _broken_power_law1d,
+    'LogParabola1D':              _log_parabola1d,
+    'PowerLaw1D':                 _power_law1d,
+    'Linear1D':                   _linear1d,
+    'Const1D':                    _const1d,
+    'Redshift':                   _redshift,
+    'Scale':                      _scale,
+    'Shift':                      _shift,
+    'Sine1D':                     _sine1d,
+}
+
+
+# Polynomial derivatives are just the basis functions, evaluated on the
+# polynomial domain/window mapping of each instance. Astropy gets these
+# right, so polynomials use their own fit_deriv. These come row-wise
+# (one row per data point), and must be transposed.
+def _own_derivative(component):
+    def derivative(x, *params):
+        result = np.asarray(component.fit_deriv(x, *params))
+        if not component.col_fit_deriv:
+            result = result.T
+        return result
+    return derivative
+
+
+def derivative(component):
+    """ Gets the analytic derivative of a spectral component.
+
+    Parameters
+    ----------
+    component: astropy model
+      The spectral component.
+
+    Returns
+    -------
+    A function that takes the spectral coordinates followed by the
+    component parameters, and returns one derivative per parameter.
+    None if no analytic derivative is known for the component.
+
+    """
+    name = models_registry.get_component_name(component)
+    if name in _derivatives:
+        return _derivatives[name]
+    if getattr(component, 'fit_deriv', None) is not None:
+        return _own_derivative(component)
+    return None
+
+
+# Checks if the derivative of a component can be called with columns of
+# parameter values, on behalf of many components of the same type.
+def is_shared(component):
+    return models_registry.get_component_name(component) in _derivatives
+
@@ -0,0 +1,369 @@
+import re
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+import models_registry
+import sp_kernels
+
+# Code in this module turns the active model held by a model manager
+# into a callable that can be evaluated repeatedly. The callable is
+# built once per structural change in the model (components added,
+# deleted, moved or read from file), so repeated evaluations of an
+# unchanged model skip both the walk over the rows in the tree of
+# active components and the rebuild of the summed compound model.
+
+
+# Matches the operands ([0], [1], etc) in the string returned
+# by the _format_expression method of astropy compound models.
+_operand = re.compile(r'\[[0-9]+\]')
+
+
+# Checks if a model is a plain sum of its components. Single
+# components are taken as a sum with one term. Parenthesis do
+# not change anything in a sum, so they are ignored.
+def is_summed(model):
+    if not hasattr(model, '_format_expression'):
+        return True
+    operators = _operand.sub('', model._format_expression())
+    for character in '+() ':
+        operators = operators.replace(character, '')
+    return len(operators) == 0
+
+
+# Builds a key that identifies the contents of an array of spectral
+# coordinates. It is computed once per evaluation, and shared by the
+# lookups of all components in the flux cache.
+def fingerprint(wave):
+    wave = np.ascontiguousarray(wave)
+    return wave.shape, wave.dtype.str, hashlib.sha1(wave).hexdigest()
+
+
+# Packs a set of grids of spectral coordinates into a single array, so
+# they can be evaluated in one pass. Grids can come either as a list
+# of arrays, or already concatenated in a single array, in which case
+# 'offsets' holds the index where each grid starts. Returns the packed
+# array and the index bounds of each grid in it.
+def pack_grids(waves, offsets=None, dtype=np.float64):
+    if offsets is None:
+        waves = [np.asarray(wave, dtype=dtype).ravel() for wave in waves]
+        sizes = [len(wave) for wave in waves]
+        bounds = np.concatenate(([0], np.cumsum(sizes))).astype(int)
+        packed = np.concatenate(waves) if len(waves) > 0 else np.zeros(0, dtype=dtype)
+    else:
+        packed = np.asarray(waves, dtype=dtype).ravel()
+        bounds = np.append(np.asarray(offsets, dtype=int), len(packed))
+        if len(bounds) > 1 and (bounds[0] != 0 or np.any(np.diff(bounds) < 0)):
+            raise ValueError("offsets must start at 0 and increase monotonically.")
+    return packed, bounds
+
+
+# Splits an array packed with pack_grids into views, one per grid.
+def unpack_grids(packed, bounds):
+    return [packed[bounds[i]:bounds[i+1]] for i in range(len(bounds) - 1)]
+
+
+# Line profile components are effectively zero outside a few widths
+# from their center. When a support window is set, these components
+# are evaluated only inside a window with a half-width of N times the
+# component's width parameter. The functions below return the center
+# and half-width of that window, given a component and N.
+#
+# Truncation errors, relative to the peak value, at N widths:
+#
+#   Gaussian1D     width = stddev   exp(-N**2/2)           N=5: 3.7e-6   N=8: 1.3e-14
+#   MexicanHat1D   width = sigma    (N**2-1)*exp(-N**2/2)  N=5: 8.9e-5   N=8: 8.0e-13
+#   Lorentz1D      width = fwhm     1/(1+4*N**2)           N=5: 9.9e-3   N=50: 1.0e-4
+#   Box1D          exact, the window is the box itself regardless of N.
+#   Trapezoid1D    exact, the window is the trapezoid base regardless of N.
+#
+# Lorentzian wings decay slowly, so they need much larger N than the
+# other profiles for the same tolerance. Components not listed here are
+# always evaluated over the full array of spectral coordinates.
+_supports = {
+    'Gaussian1D':   lambda c, n: (c.mean.value, n * abs(c.stddev.value)),
+    'MexicanHat1D': lambda c, n: (c.x_0.value, n * abs(c.sigma.value)),
+    'Lorentz1D':    lambda c, n: (c.x_0.value, n * abs(c.fwhm.value)),
+    'Box1D':        lambda c, n: (c.x_0.value, abs(c.width.value) / 2.),
+    'Trapezoid1D':  lambda c, n: (c.x_0.value, abs(c.width.value) / 2. + abs(c.amplitude.value / c.slope.value)),
+}
+
+
+# Fluxes can be computed, cached and returned in single precision
+# (float32), to halve the memory taken by large spectra. Components are
+# then evaluated on float32 spectral coordinates, and their fluxes are
+# kept in float32, but they are added up in a float64 buffer that is
+# rounded to float32 only once, at the end. With eps = 6.0e-8 (the
+# float32 relative precision), the errors to expect are:
+#
+#   all components     each flux value is rounded, to eps relative to
+#                      itself. The sum is accurate to eps times the sum
+#                      of the absolute values of the components, so
+#                      components that cancel (an absorption line over
+#                      a continuum, say) lose digits in proportion.
+#   Gaussian1D, GaussianAbsorption1D, Lorentz1D, MexicanHat1D
+#                      x - center is off by up to eps*|x|, so the
+#                      profile is off by up to about 2*eps*|x|/width,
+#                      relative to its peak. At x = 5000, width = 1:
+#                      6e-4. Narrow lines at large x suffer the most.
+#   Box1D, Trapezoid1D edges move by up to eps*|x|, so grid points that
+#                      close to an edge may fall on either side of it.
+#   PowerLaw1D, BrokenPowerLaw1D, ExponentialCutoffPowerLaw1D, LogParabola1D
+#                      relative error of about eps*(|alpha| + 2*|beta|*
+#                      |log(x/x_0)| + |x/x_cutoff|) plus rounding.
+#   Linear1D, Const1D, Redshift, Scale, Shift
+#                      eps relative to the largest term.
+#   Sine1D             phase off by up to 2*pi*|frequency*x|*eps.
+#   Chebyshev1D, Legendre1D, Polynomial1D
+#                      series are summed in float64, but on coordinates
+#                      rounded to float32: |dp/dx|*eps*|x| absolute.
+#
+# Parameter values are always kept in float64.
+_precisions = (np.float32, np.float64)
+
+
+# Finds the runs of non-decreasing values in an array of spectral
+# coordinates. A sorted array has a single run; grids packed with
+# pack_grids have (at least) one run per grid.
+def sorted_runs(wave):
+    breaks = np.nonzero(wave[1:] < wave[:-1])[0] + 1
+    bounds = np.concatenate(([0], breaks, [len(wave)]))
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+# Arrays of spectral coordinates with more sorted runs than this are
+# sorted before line profiles get their support windows searched.
+max_runs = 64
+
+
+# Gets an array of spectral coordinates ready for the search of support
+# windows. Arrays with few sorted runs (sorted arrays, or grids packed
+# with pack_grids) are searched run by run. Any other array, such as a
+# descending grid, would be split into one run per point; it is sorted
+# instead. Returns the array to evaluate components on, its sorted
+# runs, and the indices that sorted it, or None if it was not sorted.
+# Fluxes computed on a sorted array go back in place with unsort.
+def sort_grid(wave):
+    runs = sorted_runs(wave)
+    if len(runs) <= max_runs:
+        return wave, runs, None
+    if np.all(wave[1:] <= wave[:-1]):
+        order = np.arange(len(wave) - 1, -1, -1)
+    else:
+        order = np.argsort(wave, kind='mergesort')
+    return wave[order], [(0, len(wave))], order
+
+
+def unsort(values, order):
+    if order is None:
+        return values
+    result = np.empty_like(values)
+    result[order] = values
+    return result
+
+
+# Finds the index ranges (first index, last index + 1) of the array
+# of spectral coordinates where a component has to be evaluated. That
+# is the full array, unless a support window is set and the component
+# is a line profile. In that case, the window is located by a binary
+# search in each sorted run of the array.
+def support_ranges(component, wave, nwidths=None, runs=None):
+    name = models_registry.get_component_name(component)
+    if nwidths is None or name not in _supports:
+        return [(0, len(wave))]
+
+    if runs is None:
+        runs = sorted_runs(wave)
+    center, halfwidth = _supports[name](component, nwidths)
+
+    result = []
+    for start, end in runs:
+        lo = start + np.searchsorted(wave[start:end], center - halfwidth, side='left')
+        hi = start + np.searchsorted(wave[start:end], center + halfwidth, side='right')
+        if hi > lo:
+            result.append((lo, hi))
+    return result
+
+
+# Evaluates a component, and returns the result as a list of pieces
+# (first index, last index + 1, flux values) that have to be added into
+# the output array. Components with no support window, or evaluated
+# with no support window set, come out as a single, full-length piece.
+# With 'fast' set, components are evaluated with their NumPy kernel.
+def evaluate_pieces(component, wave, nwidths=None, runs=None, fast=False):
+    if fast:
+        evaluate = lambda x: sp_kernels.evaluate(component, x)
+    else:
+        evaluate = lambda x: np.asarray(component(x))
+    ranges = support_ranges(component, wave, nwidths, runs)
+    if ranges == [(0, len(wave))]:
+        return [(0, len(wave), evaluate(wave))]
+    return [(lo, hi, evaluate(wave[lo:hi])) for lo, hi in ranges]
+
+
+class FluxCache(object):
+    """ Bounded cache with the flux values of individual components.
+
+    Entries are keyed by component, parameter values, and a key that
+    identifies the array of spectral coordinates and the way it was
+    evaluated. Entries hold the pieces built by evaluate_pieces. When a single
+    parameter in a single component is edited, only that component
+    misses the cache; the cached fluxes of all other components are
+    re-used as they are. The least recently used entries are evicted
+    when the flux values held grow beyond the maximum size in bytes.
+
+    A cyclic scan over more components than fit in the cache would
+    evict every entry before it is used again, so evaluations whose
+    fluxes do not fit in the cache as a whole bypass it (see fits).
+
+    Cached flux pieces are shared, and thus are made read-only.
+
+    Parameters
+    ----------
+    maxbytes: int, optional
+      maximum size, in bytes, of the flux values held in the cache.
+      Zero disables caching altogether.
+
+    """
+    def __init__(self, maxbytes=64 * 2**20):
+        self.maxbytes = maxbytes
+        self.nbytes = 0
+        self._entries = OrderedDict()
+
+    def fits(self, ncomponents, nbytes):
+        ''' Tells if the fluxes of a number of components, each one
+        taking up to a number of bytes, can be held in the cache. '''
+        return ncomponents * nbytes <= self.maxbytes
+
+    def pieces(self, component, wave_key, evaluate):
+        # the component class is part of the key so a component that
+        # happens to be allocated at the id of a dead one can never
+        # pick up an entry that doesn't belong to it.
+        key = (id(component), component.__class__, component._parameters.tobytes(), wave_key)
+        try:
+            result = self._entries.pop(key)
+        except KeyError:
+            result = evaluate(component)
+            for piece in result:
+                piece[2].flags.writeable = False
+            self.nbytes += _nbytes(result)
+        self._entries[key] = result
+        while self.nbytes > self.maxbytes and self._entries:
+            self.nbytes -= _nbytes(self._entries.popitem(last=False)[1])
+        return result
+
+    def retain(self, components):
+        ''' Evicts the entries of all components but the given ones. '''
+        ids = set(id(component) for component in components)
+        for key in [key for key in self._entries if key[0] not in ids]:
+            self.nbytes -= _nbytes(self._entries.pop(key))
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _nbytes(pieces):
+    return sum(piece[2].nbytes for piece in pieces)
+
+
+class CompiledSpectrum(object):
+    """ Callable that evaluates the model held by a model manager.
+
+    When the model is a sum of components (the usual case), the
+    components themselves are evaluated and added up. This reads
+    their current parameter values at each call, so a compiled
+    spectrum needs to be re-built only when the model structure
+    changes. Any other kind of compound model is evaluated as is.
+
+    When called with fast=True, components are evaluated with their
+    NumPy kernels from module sp_kernels, which skip the overhead of
+    calling astropy models. Components with no kernel are called.
+
+    Parameters
+    ----------
+    components: list
+      the spectral components in the active tree, in tree order.
+    compound_model: astropy compound model, list, or None
+      the compound model associated with the components. Lists
+      and None are taken to stand for the sum of the components.
+    cache: FluxCache, optional
+      cache for the fluxes of individual components. If not provided,
+      or too small for the fluxes of all components, every component
+      is evaluated at every call.
+    nwidths: float, optional
+      half-width of the support window of line profile components,
+      in units of their width parameter. Line profiles are evaluated
+      only inside their window, located by binary search in the array
+      of spectral coordinates. See the table above for the associated
+      tolerances. If not provided, all components are evaluated over
+      the full array of spectral coordinates.
+    dtype: numpy dtype, optional
+      precision of the spectral coordinates the components are
+      evaluated on, of the cached fluxes, and of the result. Either
+      numpy.float64 (the default) or numpy.float32. Fluxes are added
+      up in float64 in either case. See the table above for the
+      tolerances in float32.
+
+    """
+    def __init__(self, components, compound_model=None, cache=None, nwidths=None, dtype=np.float64):
+        self.components = tuple(components)
+        self.cache = cache
+        self.nwidths = nwidths
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in _precisions:
+            raise ValueError("Precision must be float32 or float64, not %s." % self.dtype)
+
+        self.model = None
+        if len(self.components) > 0 and compound_model is not None and \
+           not isinstance(compound_model, list) and not is_summed(compound_model):
+            self.model = compound_model
+
+    def __call__(self, wave, fast=False):
+        if self.dtype != np.float64:
+            wave = np.asarray(wave, dtype=self.dtype)
+        if self.model is not None:
+            return np.asarray(self.model(wave)).astype(self.dtype, copy=False)
+
+        wave = np.asarray(wave)
+        result = np.zeros(len(wave))
+        if len(self.components) == 0:
+            return result.astype(self.dtype, copy=False)
+
+        # sorted runs are searched once, and shared by all components.
+        runs = order = None
+        if self.nwidths is not None:
+            wave, runs, order = sort_grid(wave)
+
+        # the cache is bypassed when the fluxes of all components can't
+        # be held in it at once.
+        cached = self.cache is not None and \
+                 self.cache.fits(len(self.components), len(wave) * self.dtype.itemsize)
+
+        # with no cache, kernels add their flux straight into the result.
+        if fast and not cached:
+            if self.dtype == np.float64:
+                wave = np.asarray(wave, dtype=np.float64)
+            for component in self.components:
+                for lo, hi in support_ranges(component, wave, self.nwidths, runs):
+                    sp_kernels.evaluate(component, wave[lo:hi], result[lo:hi])
+            return unsort(result, order).astype(self.dtype, copy=False)
+
+        def evaluate(component):
+            pieces = evaluate_pieces(component, wave, self.nwidths, runs, fast)
+            return [(lo, hi, flux.astype(self.dtype, copy=False)) for lo, hi, flux in pieces]
+
+        if cached:
+            wave_key = (fingerprint(wave), self.nwidths, fast, self.dtype.str)
+            for component in self.components:
+                for lo, hi, flux in self.cache.pieces(component, wave_key, evaluate):
+                    result[lo:hi] += flux
+        else:
+            for component in self.components:
+                for lo, hi, flux in evaluate(component):
+                    result[lo:hi] += flux
+        return unsort(result, order).astype(self.dtype, copy=False)
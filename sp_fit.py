@@ -0,0 +1,703 @@
+import time
+import threading
+import multiprocessing
+
+import numpy as np
+
+from astropy.modeling import Fittable1DModel, Parameter
+
+import sp_eval
+import sp_derivs
+import sp_ties
+
+# Headless fitting engine. Code in this module fits a set of spectral
+# components to arrays of spectral coordinates and flux values, and
+# depends on neither PyQt nor any other GUI toolkit. It can be used
+# from scripts and servers with no display, and it is also the code
+# path used by the 'Fit' button in the GUI.
+
+
+class FitResult(object):
+    """ Outcome of a fit.
+
+    Attributes
+    ----------
+    components: list
+      Copies of the input components, with the fitted parameter values.
+    chi2: float
+      Sum of the squared (weighted, if errors were given) residuals.
+    dof: int
+      Degrees of freedom: number of data points minus number of
+      free (not fixed and not tied) parameters.
+    reduced_chi2: float
+      chi2 / dof, or NaN if there are no degrees of freedom left.
+    nfev: int
+      Number of function evaluations performed by the fitter.
+    success: boolean
+      True when the fitter reports convergence.
+    message: str
+      Message reported by the fitter.
+    fit_info: dict
+      Full fit information as reported by the fitter.
+
+    """
+    def __init__(self, components, model, x, y, weights, fit_info):
+        self.components = components
+        self.fit_info = fit_info
+
+        residuals = y - model(x)
+        if weights is not None:
+            residuals = residuals * weights
+        self.chi2 = float(np.sum(residuals * residuals))
+
+        nfree = len(model.param_names) - sum(1 for name in model.param_names
+                                             if model.fixed[name] or model.tied[name])
+        self.dof = len(x) - nfree
+        self.reduced_chi2 = self.chi2 / self.dof if self.dof > 0 else float('nan')
+
+        self.nfev = fit_info.get('nfev', 0)
+        self.message = fit_info.get('message', '')
+        self.success = fit_info.get('ierr') in (1, 2, 3, 4)
+
+
+# Default half-width, in units of the component width, of the support
+# window used to build sparse Jacobians. See sp_eval for tolerances.
+SPARSE_NWIDTHS = 8.
+
+
+class FitCancelled(Exception):
+    ''' Raised by a fit that was cancelled through its FitProgress. '''
+
+
+class FitProgress(object):
+    """ Monitors a fit while it runs, and lets it be cancelled.
+
+    A FitProgress instance passed to function fit is called by the
+    fit engine at each model evaluation. At a throttled rate, it hands
+    the current parameter values, in the form of copies of the model
+    components, to a callback. It can be cancelled from any thread,
+    in which case the fit stops at the next model evaluation, raising
+    FitCancelled.
+
+    Parameters
+    ----------
+    callback: callable, optional
+      Called with a list of component copies set with the current
+      parameter values. It runs in the thread that runs the fit.
+    interval: float, optional
+      Minimum time, in seconds, between calls to the callback.
+
+    """
+    def __init__(self, callback=None, interval=0.25):
+        self.callback = callback
+        self.interval = interval
+        self.nfev = 0
+        self._cancelled = threading.Event()
+        self._last = 0.
+        self._components = []
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    # called by the engine when a fit starts.
+    def _start(self, components):
+        self._components = components
+        self._last = time.time()
+
+    # called by the engine with the full (tied parameters resolved)
+    # parameter vector, at each model evaluation.
+    def __call__(self, params):
+        if self._cancelled.is_set():
+            raise FitCancelled("Fit cancelled after %i evaluations." % self.nfev)
+        self.nfev += 1
+        now = time.time()
+        if self.callback is not None and now - self._last >= self.interval:
+            self._last = now
+            self.callback(_set_parameters(self._components, params))
+
+
+# Returns copies of a list of components, with their parameters
+# set from the values in a single parameter vector.
+def _set_parameters(components, params):
+    result = []
+    i = 0
+    for m in components:
+        n = len(m.param_names)
+        m = m.copy()
+        m.parameters = params[i:i + n]
+        i += n
+        result.append(m)
+    return result
+
+
+# Gets the list of components in a model. Lists are passed through,
+# single components are taken as a sum with one term, and compound
+# models must be sums of their components.
+def _components(model):
+    if isinstance(model, (list, tuple)):
+        return list(model)
+    if not sp_eval.is_summed(model):
+        raise ValueError("Only models that are a sum of components can be fitted.")
+    if hasattr(model, '_submodels'):
+        return list(model)
+    return [model]
+
+
+# Flux errors are turned into fitting weights only when they
+# are all positive. Otherwise the fit is unweighted.
+def _weights(dy):
+    if dy is None:
+        return None
+    dy = np.asarray(dy, dtype=np.float64)
+    if np.all(dy > 0.):
+        return 1. / dy
+    return None
+
+
+def fit(model, x, y, dy=None, fitter=None, maxiter=None, sparse=False, nwidths=SPARSE_NWIDTHS,
+        progress=None):
+    """ Fits a sum of spectral components to a spectrum.
+
+    The input components are not modified; the fitted values are
+    returned in copies of them.
+
+    Parameters
+    ----------
+    model: list or astropy model
+      List with the spectral components to be fitted (as returned by
+      SpectralModelManager.components), or a compound model that is
+      a sum of components (as read by sp_model_io.buildModelFromFile),
+      or a single component.
+    x: numpy array
+      Array with spectral coordinates.
+    y: numpy array
+      Array with flux values.
+    dy: numpy array, optional
+      Array with flux errors. Used to weight the fit only if all
+      errors are positive.
+    fitter: astropy fitter, optional
+      The fitter instance. Default is LevMarLSQFitter.
+    maxiter: int, optional
+      Maximum number of iterations, passed to the fitter.
+    sparse: boolean, optional
+      If True, the Jacobian is built as a sparse matrix, with entries
+      only where each line profile is within its support window, and
+      the fit is done by a sparse-aware least-squares solver. Memory
+      and time then scale with the number of non-zero entries, which
+      pays off in fits with many, mostly non-overlapping, lines. The
+      'fitter' argument is ignored in this mode.
+    nwidths: float, optional
+      Half-width, in units of the component width, of the support
+      windows used in sparse mode. See sp_eval for the tolerances.
+    progress: FitProgress, optional
+      Receives the parameter values while the fit runs, and can be
+      used to cancel it. A cancelled fit raises FitCancelled.
+
+    Returns
+    -------
+    instance of FitResult
+
+    """
+    from astropy.modeling.fitting import LevMarLSQFitter
+
+    components = _components(model)
+    if len(components) == 0:
+        raise ValueError("There are no components to fit.")
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    weights = _weights(dy)
+
+    if progress is not None:
+        progress._start(components)
+
+    if sparse:
+        return _fit_sparse(components, x, y, weights, maxiter, nwidths, progress)
+
+    if fitter is None:
+        fitter = LevMarLSQFitter()
+
+    kwargs = {'weights': weights}
+    if maxiter is not None:
+        kwargs['maxiter'] = maxiter
+
+    superposition = superposition_model(*components)
+
+    # the monitor goes in the class, so it is not deep-copied
+    # along with the model instance by the astropy fitters.
+    type(superposition)._monitor = progress
+    fitted = fitter(superposition, x, y, **kwargs)
+
+    return FitResult(fitted.terms(), fitted, x, y, weights, dict(fitter.fit_info))
+
+
+# Fits with a sparse Jacobian. The model is evaluated with the same
+# support windows that define the sparsity pattern of the Jacobian,
+# so that both stay consistent with each other.
+def _fit_sparse(components, x, y, weights, maxiter, nwidths, progress):
+    from scipy.optimize import least_squares
+    from scipy.sparse import coo_matrix
+
+    superposition = superposition_model(*components)
+    terms = [m.copy() for m in components]
+    derivatives = [sp_derivs.derivative(m) for m in components]
+    offsets = np.cumsum([0] + [len(m.param_names) for m in components])
+
+    # with support windows, data points are fitted in the order given
+    # by sp_eval.sort_grid. The order of the points does not change
+    # the solution.
+    runs = None
+    data_x, data_y, data_weights = x, y, weights
+    if nwidths is not None:
+        data_x, runs, order = sp_eval.sort_grid(x)
+        if order is not None:
+            data_y = y[order]
+            if weights is not None:
+                data_weights = weights[order]
+
+    # free parameters are the ones that are neither fixed nor tied.
+    names = superposition.param_names
+    free = np.array([not superposition.fixed[name] for name in names])
+    columns = np.cumsum(free) - 1
+    lower = np.array([-np.inf if superposition.bounds[n][0] is None else superposition.bounds[n][0]
+                      for n in names])
+    upper = np.array([np.inf if superposition.bounds[n][1] is None else superposition.bounds[n][1]
+                      for n in names])
+
+    def expand(p):
+        params = superposition.parameters.copy()
+        params[free] = p
+        params = superposition._resolve(params)
+        for m, i, j in zip(terms, offsets[:-1], offsets[1:]):
+            m.parameters = params[i:j]
+        return params
+
+    def residuals(p):
+        params = expand(p)
+        if progress is not None:
+            progress(params)
+        result = -data_y
+        for m in terms:
+            for lo, hi, flux in sp_eval.evaluate_pieces(m, data_x, nwidths, runs):
+                result[lo:hi] += flux
+        if data_weights is not None:
+            result *= data_weights
+        return result
+
+    # derivatives with respect to tied parameters are folded, by the
+    # chain rule, into the parameters at the root of their chains.
+    # Duplicated (row, column) entries are summed up when converting
+    # to CSR.
+    chain = dict((tied, (factor, root)) for tied, factor, root in zip(*superposition._ties))
+
+    def jacobian(p):
+        params = expand(p)
+        rows, cols, values = [], [], []
+        for m, derivative, offset in zip(terms, derivatives, offsets[:-1]):
+            values_m = params[offset:offset + len(m.param_names)]
+            for lo, hi in sp_eval.support_ranges(m, data_x, nwidths, runs):
+                derivs = derivative(data_x[lo:hi], *values_m)
+                for j, deriv in enumerate(derivs):
+                    deriv = np.broadcast_to(deriv, (hi - lo,))
+                    if data_weights is not None:
+                        deriv = deriv * data_weights[lo:hi]
+                    index = offset + j
+                    factor = 1.
+                    if index in chain:
+                        factor, index = chain[index]
+                    if not free[index]:
+                        continue
+                    rows.append(np.arange(lo, hi))
+                    cols.append(np.full(hi - lo, columns[index], dtype=int))
+                    values.append(deriv * factor)
+        shape = (len(x), int(free.sum()))
+        if len(rows) == 0:
+            return coo_matrix(shape).tocsr()
+        return coo_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+                          shape=shape).tocsr()
+
+    p0 = np.clip(superposition.parameters[free], lower[free], upper[free])
+    kwargs = {}
+    if maxiter is not None:
+        kwargs['max_nfev'] = maxiter
+    solution = least_squares(residuals, p0, jac=jacobian, bounds=(lower[free], upper[free]),
+                             method='trf', tr_solver='lsmr', x_scale='jac', **kwargs)
+
+    superposition.parameters = expand(solution.x)
+    fit_info = {'nfev': solution.nfev,
+                'njev': solution.njev,
+                'message': solution.message,
+                'ierr': solution.status,
+                'optimality': solution.optimality}
+    return FitResult(superposition.terms(), superposition, x, y, weights, fit_info)
+
+
+class BatchFitResult(object):
+    """ Outcome of fitting one model template to many spectra.
+
+    Attributes
+    ----------
+    parameters: numpy array
+      Fitted parameter values, one row per spectrum. Columns follow
+      the order of the parameters in the template components.
+    chi2: numpy array
+      Sum of the squared (weighted) residuals of each fit.
+    dof: numpy array
+      Degrees of freedom of each fit.
+    nfev: numpy array
+      Number of function evaluations of each fit.
+    success: numpy array
+      True for each fit the fitter reported as converged.
+    messages: list
+      Message reported by the fitter (or the error raised) for each fit.
+
+    """
+    def __init__(self, template, parameters, stats):
+        self._template = template
+        self.parameters = parameters
+        self.chi2 = np.array([s[0] for s in stats])
+        self.dof = np.array([s[1] for s in stats])
+        self.nfev = np.array([s[2] for s in stats])
+        self.success = np.array([s[3] for s in stats])
+        self.messages = [s[4] for s in stats]
+
+    def __len__(self):
+        return len(self.parameters)
+
+    def components(self, index):
+        """ Returns copies of the template components, set
+        with the fitted parameter values for one spectrum."""
+        result = []
+        i = 0
+        for component in self._template:
+            component = component.copy()
+            n = len(component.parameters)
+            component.parameters = self.parameters[index, i:i + n]
+            result.append(component)
+            i += n
+        return result
+
+
+# State shared by the worker processes in fit_many. It is set by the
+# pool initializer, and inherited by the forked workers, so neither
+# the template nor the arrays get pickled on a per task basis. Only
+# the spectrum index travels to the workers, and only a few numbers
+# travel back; fitted parameters are written into shared memory.
+_worker = {}
+
+
+def _as_array(raw, shape):
+    return np.frombuffer(raw, dtype=np.float64).reshape(shape)
+
+
+def _init_worker(template, x, flux, dy, parameters, shape, kwargs):
+    _worker['template'] = template
+    _worker['x'] = x
+    _worker['flux'] = _as_array(flux, shape)
+    _worker['dy'] = _as_array(dy, shape) if dy is not None else None
+    _worker['parameters'] = _as_array(parameters, (shape[0], -1))
+    _worker['kwargs'] = kwargs
+
+
+def _fit_one(index):
+    dy = _worker['dy']
+    try:
+        result = fit(_worker['template'], _worker['x'], _worker['flux'][index],
+                     dy=dy[index] if dy is not None else None, **_worker['kwargs'])
+    except Exception as e:
+        _worker['parameters'][index] = np.nan
+        return float('nan'), 0, 0, False, str(e)
+
+    _worker['parameters'][index] = np.concatenate([c.parameters for c in result.components])
+    return result.chi2, result.dof, result.nfev, result.success, result.message
+
+
+# Copies an array into a new block of shared memory.
+def _shared(array):
+    array = np.asarray(array, dtype=np.float64)
+    raw = multiprocessing.RawArray('d', array.size)
+    _as_array(raw, array.shape)[...] = array
+    return raw
+
+
+def fit_many(model, x, fluxes, dy=None, processes=None, fitter=None, maxiter=None):
+    """ Fits one model template to many spectra in parallel.
+
+    The spectra must share a single array of spectral coordinates.
+    Fits are spread over a pool of worker processes. Fluxes, errors
+    and fitted parameters are exchanged through shared memory.
+
+    Workers are forked from the calling process, and inherit the
+    model template from it. This requires a platform where the
+    multiprocessing module forks (such as Linux or Mac OS).
+
+    Parameters
+    ----------
+    model: list or astropy model
+      The model template: a list with spectral components, or
+      anything else accepted by function fit. Each spectrum is
+      fitted starting from the template parameter values.
+    x: numpy array
+      Array with spectral coordinates.
+    fluxes: list or 2-D numpy array
+      Flux values, one spectrum per row.
+    dy: list or 2-D numpy array, optional
+      Flux errors, one spectrum per row.
+    processes: int, optional
+      Number of worker processes. Default is the number of CPUs.
+      With one process, all fits run in the calling process.
+    fitter: astropy fitter, optional
+      The fitter instance. Default is LevMarLSQFitter.
+    maxiter: int, optional
+      Maximum number of iterations, passed to the fitter.
+
+    Returns
+    -------
+    instance of BatchFitResult
+
+    """
+    template = _components(model)
+    x = np.asarray(x, dtype=np.float64)
+    fluxes = np.asarray(fluxes, dtype=np.float64)
+    if fluxes.ndim != 2 or fluxes.shape[1] != len(x):
+        raise ValueError("Fluxes must be a 2-D array with one spectrum of len(x) per row.")
+
+    shape = fluxes.shape
+    nparams = sum(len(c.parameters) for c in template)
+    shared_flux = _shared(fluxes)
+    shared_dy = _shared(np.broadcast_to(dy, shape)) if dy is not None else None
+    shared_parameters = multiprocessing.RawArray('d', shape[0] * nparams)
+    initargs = (template, x, shared_flux, shared_dy, shared_parameters, shape,
+                {'fitter': fitter, 'maxiter': maxiter})
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = min(processes, shape[0])
+
+    if processes <= 1:
+        _init_worker(*initargs)
+        stats = [_fit_one(i) for i in range(shape[0])]
+    else:
+        pool = multiprocessing.Pool(processes, initializer=_init_worker, initargs=initargs)
+        try:
+            chunksize = max(1, shape[0] // (processes * 4))
+            stats = pool.map(_fit_one, range(shape[0]), chunksize)
+        finally:
+            pool.close()
+            pool.join()
+    _worker.clear()
+
+    parameters = _as_array(shared_parameters, (shape[0], nparams)).copy()
+    return BatchFitResult(template, parameters, stats)
+
+
+# Checks if a model class implements a method as a static (or class)
+# method. Only then it can be called on behalf of many instances at
+# once, with parameter columns that broadcast against the input array.
+def _is_shared(cls, method_name):
+    for klass in cls.__mro__:
+        if method_name in klass.__dict__:
+            return isinstance(klass.__dict__[method_name], (staticmethod, classmethod))
+    return False
+
+
+class _TermGroup(object):
+    """ Terms of a superposition that belong to the same model class.
+
+    When the class evaluate and fit_deriv methods are static, all terms
+    in the group are evaluated in a single broadcasted numpy call, with
+    one row per term. Otherwise, terms are evaluated one at a time.
+
+    Parameters
+    ----------
+    models: list
+      models of the same class.
+    indices: numpy array
+      indices, in the superposition parameter vector, of the parameters
+      of each model; one row per model, one column per parameter name.
+
+    """
+    def __init__(self, models, indices):
+        self.models = models
+        self.cls = models[0].__class__
+        self.indices = indices
+        self.derivatives = [sp_derivs.derivative(m) for m in models]
+        self.broadcast = len(models) > 1 and \
+                         _is_shared(self.cls, 'evaluate') and \
+                         sp_derivs.is_shared(models[0])
+
+    def _columns(self, params):
+        values = params[self.indices]
+        return [values[:, j:j + 1] for j in range(values.shape[1])]
+
+    def evaluate(self, x, params):
+        if self.broadcast:
+            return np.sum(self.cls.evaluate(x, *self._columns(params)), axis=0)
+        result = 0.
+        for m, rows in zip(self.models, self.indices):
+            result = result + m.evaluate(x, *params[rows])
+        return result
+
+    # fills the group rows in a Jacobian (n_params, n_points) array.
+    def fill_deriv(self, x, params, jacobian):
+        if self.broadcast:
+            derivs = self.derivatives[0](x, *self._columns(params))
+            for j, deriv in enumerate(derivs):
+                jacobian[self.indices[:, j]] = deriv
+        else:
+            for derivative, rows in zip(self.derivatives, self.indices):
+                for row, deriv in zip(rows, derivative(x, *params[rows])):
+                    jacobian[row] = deriv
+
+
+class Superposition(Fittable1DModel):
+    """ Base class for fittable superpositions of astropy models.
+
+    The model parameters are declared in subclasses built on the fly
+    by superposition_model, one subclass per list of models. Terms of
+    the same class are grouped together and evaluated in one call.
+    The Jacobian is filled in place, in an array that is allocated
+    once and then re-used at every iteration of the fitter.
+
+    Tied parameters are resolved by the superposition itself, at each
+    evaluation. The fitter sees them as fixed parameters, and the
+    derivatives with respect to them are carried over, by the chain
+    rule, to the parameters they are tied to.
+
+    """
+    # set by superposition_model in each subclass.
+    _models = ()
+    _groups = ()
+    _ties = (np.zeros(0, dtype=int), np.zeros(0), np.zeros(0, dtype=int))
+    _monitor = None
+
+    def __init__(self, *args, **kwargs):
+        for i, a in enumerate(args):
+            kwargs['p_%i' % i] = a
+        super(Superposition, self).__init__(**kwargs)
+        self._jacobian = None
+
+    # sets tied parameters in a parameter vector from the values
+    # of the parameters at the root of their chains of ties.
+    def _resolve(self, params):
+        tied, factors, roots = self._ties
+        if len(tied) > 0:
+            params[tied] = factors * params[roots]
+        return params
+
+    def evaluate(self, x, *args):
+        params = self._resolve(np.concatenate([np.ravel(a) for a in args]))
+        if self._monitor is not None:
+            self._monitor(params)
+        result = 0.
+        for group in self._groups:
+            result = result + group.evaluate(x, params)
+        return result
+
+    # installed as fit_deriv by superposition_model when all
+    # terms provide a fit_deriv on their own.
+    def _fit_deriv(self, x, *args):
+        params = self._resolve(np.concatenate([np.ravel(a) for a in args]))
+        shape = (len(params), np.size(x))
+        if self._jacobian is None or self._jacobian.shape != shape:
+            self._jacobian = np.empty(shape)
+        x = np.ravel(x)
+        for group in self._groups:
+            group.fill_deriv(x, params, self._jacobian)
+
+        # chain rule. Derivatives with respect to tied parameters
+        # accumulate into the parameters at the root of their chains.
+        tied, factors, roots = self._ties
+        if len(tied) > 0:
+            np.add.at(self._jacobian, roots, factors[:, np.newaxis] * self._jacobian[tied])
+        return self._jacobian
+
+    def terms(self):
+        return _set_parameters(self._models, self._resolve(self.parameters.copy()))
+
+
+# Translates the ties in a list of models into arrays with the indices
+# of the tied parameters, their factors, and the indices of the
+# parameters at the root of their chains of ties. Indices refer to the
+# parameter vector of the superposition. Chains are collapsed, so all
+# ties can be resolved at once, by a single scale-and-gather.
+def _build_ties(models):
+    offsets = np.cumsum([0] + [len(m.param_names) for m in models])
+    positions = dict((id(m), k) for k, m in enumerate(models))
+
+    def index(component, param_name):
+        k = positions[id(component)]
+        return offsets[k] + list(component.param_names).index(param_name)
+
+    # ties are set on copies, so the graph can point
+    # them to the models in the list, as they are.
+    copies = []
+    for m in models:
+        copy = m.copy()
+        positions[id(copy)] = positions[id(m)]
+        copies.append(copy)
+    graph = sp_ties.TieGraph(copies)
+
+    tied, factors, roots = [], [], []
+    for component, param_name, factor, root, root_name in graph.roots():
+        tied.append(index(component, param_name))
+        factors.append(factor)
+        roots.append(index(root, root_name))
+    return np.array(tied, dtype=int), np.array(factors, dtype=np.float64), np.array(roots, dtype=int)
+
+
+def superposition_model(*models):
+    """ Creates a fittable superposition of astropy models.
+
+    Parameter constraints (fixed flags, bounds and ties) are carried
+    over from the models to the superposition. Use the terms() method of
+    the superposition to get back copies of the models, set with the
+    superposition parameter values.
+    """
+    params = {}
+    fixed = {}
+    bounds = {}
+    groups = {}
+    group_order = []
+    i = 0
+    for m in models:
+        rows = []
+        for p in m.param_names:
+            params['p_%i' % i] = Parameter()
+            fixed['p_%i' % i] = m.fixed[p]
+            bounds['p_%i' % i] = m.bounds[p]
+            rows.append(i)
+            i += 1
+        if m.__class__ not in groups:
+            groups[m.__class__] = ([], [])
+            group_order.append(m.__class__)
+        groups[m.__class__][0].append(m)
+        groups[m.__class__][1].append(rows)
+
+    # an explicit __init__ keeps astropy from generating one with
+    # a signature that lists every parameter, which breaks down
+    # beyond 255 parameters.
+    params['__init__'] = Superposition.__dict__['__init__']
+    params['_models'] = tuple(models)
+    params['_groups'] = tuple(_TermGroup(groups[c][0], np.array(groups[c][1], dtype=int))
+                              for c in group_order)
+
+    params['_ties'] = _build_ties(models)
+    for tied in params['_ties'][0]:
+        fixed['p_%i' % tied] = True
+
+    # without analytic derivatives in all models,
+    # the fitter estimates the Jacobian by itself.
+    if all(sp_derivs.derivative(m) is not None for m in models):
+        params['fit_deriv'] = Superposition._fit_deriv
+    else:
+        params['fit_deriv'] = None
+
+    result = type('Superposition', (Superposition,), params)
+
+    args = sum((m.parameters.tolist() for m in models), [])
+    return result(*args, fixed=fixed, bounds=bounds)
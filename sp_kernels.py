@@ -0,0 +1,228 @@
+import numpy as np
+from numpy.polynomial import chebyshev, legendre, polynomial
+
+import models_registry
+
+# Plain NumPy versions of the spectral components in the models
+# registry. Calling an astropy model goes through input validation,
+# unit handling and broadcasting setup before the model function gets
+# evaluated, and that overhead is paid by every component, at every
+# call. When the same components are evaluated over and over on fixed
+# grids, as when plotting or fitting, the kernels below skip all that.
+#
+# Each kernel takes the spectral coordinates, the parameter values of
+# the component (a slice of a parameter array, in the order of the
+# component's param_names), and an output buffer with the same shape
+# as the spectral coordinates. The component flux is added into the
+# buffer, which is returned. The formulas are the ones in astropy;
+# results agree with astropy to rounding error (see test_sp_kernels.py).
+
+
+def _box1d(x, p, out):
+    amplitude, x_0, width = p
+    inside = np.logical_and(x >= x_0 - width / 2., x <= x_0 + width / 2.)
+    out[inside] += amplitude
+    return out
+
+
+def _gaussian1d(x, p, out):
+    amplitude, mean, stddev = p
+    d = (x - mean) / stddev
+    out += amplitude * np.exp(-0.5 * d * d)
+    return out
+
+
+def _gaussian_absorption1d(x, p, out):
+    amplitude, mean, stddev = p
+    d = (x - mean) / stddev
+    out += 1. - amplitude * np.exp(-0.5 * d * d)
+    return out
+
+
+def _lorentz1d(x, p, out):
+    amplitude, x_0, fwhm = p
+    gamma2 = (fwhm / 2.) ** 2
+    d = x - x_0
+    out += amplitude * gamma2 / (d * d + gamma2)
+    return out
+
+
+def _mexican_hat1d(x, p, out):
+    amplitude, x_0, sigma = p
+    d = x - x_0
+    u = d * d / (2. * sigma * sigma)
+    out += amplitude * (1. - 2. * u) * np.exp(-u)
+    return out
+
+
+def _trapezoid1d(x, p, out):
+    amplitude, x_0, width, slope = p
+    x2 = x_0 - width / 2.
+    x3 = x_0 + width / 2.
+    x1 = x2 - amplitude / slope
+    x4 = x3 + amplitude / slope
+    out += np.select([np.logical_and(x >= x1, x < x2),
+                      np.logical_and(x >= x2, x < x3),
+                      np.logical_and(x >= x3, x < x4)],
+                     [slope * (x - x1), amplitude, slope * (x4 - x)])
+    return out
+
+
+def _power_law1d(x, p, out):
+    amplitude, x_0, alpha = p
+    out += amplitude * (x / x_0) ** (-alpha)
+    return out
+
+
+def _broken_power_law1d(x, p, out):
+    amplitude, x_break, alpha_1, alpha_2 = p
+    alpha = np.where(x < x_break, alpha_1, alpha_2)
+    out += amplitude * (x / x_break) ** (-alpha)
+    return out
+
+
+def _exponential_cutoff_power_law1d(x, p, out):
+    amplitude, x_0, alpha, x_cutoff = p
+    out += amplitude * (x / x_0) ** (-alpha) * np.exp(-x / x_cutoff)
+    return out
+
+
+def _log_parabola1d(x, p, out):
+    amplitude, x_0, alpha, beta = p
+    xx = x / x_0
+    out += amplitude * xx ** (-alpha - beta * np.log(xx))
+    return out
+
+
+def _linear1d(x, p, out):
+    slope, intercept = p
+    out += slope * x + intercept
+    return out
+
+
+def _const1d(x, p, out):
+    out += p[0]
+    return out
+
+
+# astropy versions before 1.1 have no phase parameter in Sine1D.
+def _sine1d(x, p, out):
+    phase = p[2] if len(p) > 2 else 0.
+    out += p[0] * np.sin(2. * np.pi * (p[1] * x + phase))
+    return out
+
+
+def _redshift(x, p, out):
+    out += (1. + p[0]) * x
+    return out
+
+
+def _scale(x, p, out):
+    out += p[0] * x
+    return out
+
+
+def _shift(x, p, out):
+    out += x + p[0]
+    return out
+
+
+_kernels = {
+    'Box1D':                      _box1d,
+    'Gaussian1D':                 _gaussian1d,
+    'GaussianAbsorption1D':       _gaussian_absorption1d,
+    'Lorentz1D':                  _lorentz1d,
+    'MexicanHat1D':               _mexican_hat1d,
+    'Trapezoid1D':                _trapezoid1d,
+    'ExponentialCutoffPowerLaw1D':_exponential_cutoff_power_law1d,
+    'BrokenPowerLaw1D':           _broken_power_law1d,
+    'LogParabola1D':              _log_parabola1d,
+    'PowerLaw1D':                 _power_law1d,
+    'Linear1D':                   _linear1d,
+    'Const1D':                    _const1d,
+    'Redshift':                   _redshift,
+    'Scale':                      _scale,
+    'Shift':                      _shift,
+    'Sine1D':                     _sine1d,
+}
+
+
+# Polynomials map the spectral coordinates from their domain to their
+# window before evaluating the series. Both are instance attributes,
+# so polynomial kernels are built for each instance, and read the
+# domain and window at each call.
+def _polynomial_kernel(component, series):
+    def kernel(x, p, out):
+        if component.domain is not None:
+            domain = np.asarray(component.domain, dtype=np.float64)
+            window = np.asarray(component.window, dtype=np.float64)
+            scale = (window[1] - window[0]) / (domain[1] - domain[0])
+            offset = (window[0] * domain[1] - window[1] * domain[0]) / (domain[1] - domain[0])
+            x = offset + scale * x
+        out += series(x, p)
+        return out
+    return kernel
+
+
+_series = {
+    'Chebyshev1D':  chebyshev.chebval,
+    'Legendre1D':   legendre.legval,
+    'Polynomial1D': polynomial.polyval,
+}
+
+
+def kernel(component):
+    """ Gets the NumPy kernel of a spectral component.
+
+    Parameters
+    ----------
+    component: astropy model
+      The spectral component.
+
+    Returns
+    -------
+    A function that takes the spectral coordinates, the component
+    parameter values, and an output buffer, and adds the component
+    flux into the buffer. None if no kernel is known for the component.
+
+    """
+    name = models_registry.get_component_name(component)
+    if name in _kernels:
+        return _kernels[name]
+    if name in _series:
+        return _polynomial_kernel(component, _series[name])
+    return None
+
+
+def evaluate(component, x, out=None):
+    """ Evaluates a spectral component with its kernel, or by calling
+    it if it has no kernel.
+
+    Parameters
+    ----------
+    component: astropy model
+      The spectral component.
+    x: numpy array
+      The spectral coordinates. Single precision coordinates are
+      used as they are, anything else is converted to float64.
+    out: numpy array, optional
+      Buffer the component flux gets added into. A new
+      zero-valued float64 buffer is used if not provided.
+
+    Returns
+    -------
+    The output buffer.
+
+    """
+    x = np.asarray(x)
+    if x.dtype != np.float32:
+        x = x.astype(np.float64, copy=False)
+    if out is None:
+        out = np.zeros(x.shape)
+    function = kernel(component)
+    if function is None:
+        out += component(x)
+    else:
+        function(x, component.parameters, out)
+    return out
+
@@ -1,58 +1,476 @@
-import os, sys, re, dis
+import os, re
+import ast
+import json
+import operator
+import importlib
+from weakref import WeakKeyDictionary
 
-from cStringIO import StringIO
-from PyQt4.QtGui import QFileDialog
+import numpy as np
+from astropy.modeling import Model
 
 import models_registry
+import sp_compound
+import sp_ties
 
 
-# Builds a compound model specified in a .py file
+# Builds a compound model specified in a .py, .json or .npz file. A .py
+# file is parsed, not imported, so reading it leaves sys.path and
+# sys.modules alone, and re-reading an edited file needs no reload.
 def buildModelFromFile(fname):
     directory = os.path.dirname(str(fname))
-    sys.path.append(directory)
-    f = os.path.basename(str(fname)).split('.')[0] # remove .py from end of file name so it can be imported
-
-    # if already defined, force a reload.
-    import_statement = "import " + f
-    if f in sys.modules.keys():
-        import_statement = "reload(sys.modules['" + f + "'])"
-
     try:
-        exec import_statement
-        module = sys.modules[f]
-
-        # this will pick up the first model defined in the file. A different
-        # mechanism is needed to handle files with multiple model definitions.
-        for variable in dir(module):
-            if not variable.startswith('__'):
-                # this assumes that the module contains only model definitions and
-                # imports for the functional types used in the model definitions.
-                # This 'if' statement skips the function types, everything that
-                # passes is assumed to be a valid compound model definition.
-                if (str(type(module.__dict__[variable]))).find('astropy.modeling.core._ModelMeta') < 0:
-                    compound_model = module.__dict__[variable]
-                    return compound_model, directory
-        return None,None
+        extension = os.path.splitext(str(fname))[1].lower()
+        if extension in _readers:
+            compound_model = _readers[extension](str(fname))
+        else:
+            with open(str(fname)) as f:
+                compound_model = parseModel(f.read(), str(fname))
+        if compound_model is None:
+            return None,None
+        return compound_model, directory
     except Exception as e:
         print("ERROR: " + str(e))
         return None,None
 
 
+# Model files can only import component classes from these modules.
+_allowed_module = re.compile(r'^astropy\.modeling(\.\w+)*$')
+
+# Operators allowed in model expressions.
+_operators = {
+    ast.Add:    operator.add,
+    ast.Sub:    operator.sub,
+    ast.Mult:   operator.mul,
+    ast.Div:    operator.truediv,
+    ast.Pow:    operator.pow,
+    ast.BitOr:  operator.or_,
+    ast.BitAnd: operator.and_,
+}
+
+
+def parseModel(text, fname='<model>'):
+    """ Builds a compound model from the text of a model file.
+
+    Model files are in the format written by saveModelToFile: a
+    sequence of 'from <module> import <class>' statements followed
+    by an assignment of an expression on spectral components to a
+    variable. The text is parsed into an abstract syntax tree, and the
+    model is built straight from the tree. Nothing in the file gets
+    executed; component arguments must be literals, and ties must be
+    lambda functions of the form 'lambda m: factor * m[index].name'.
+
+    The tree is walked with an explicit stack, so files with thousands
+    of components are parsed in time proportional to their size. Sums
+    of components are built flat, and returned as a balanced tree of
+    astropy compound models (see sp_compound.SummedCompoundModel).
+
+    Parameters
+    ----------
+    text: str
+      The contents of the model file.
+    fname: str, optional
+      The file name, used in error messages.
+
+    Returns
+    -------
+    The astropy model defined by the first assignment in the file, or
+    None if the file has no assignments.
+
+    Raises
+    ------
+    ValueError
+      If the file contains anything but the statements above.
+
+    """
+    tree = ast.parse(text, fname)
+    classes = {}
+    for statement in tree.body:
+        if isinstance(statement, ast.ImportFrom):
+            classes.update(_import_classes(statement, fname))
+        elif isinstance(statement, ast.Assign):
+            def component(node):
+                if not isinstance(node, ast.Call):
+                    raise _parse_error(node, fname, "expected a component or an operator")
+                return _build_component(node, classes, fname)
+            return _astropy_model(_build_expression(statement.value, component, fname))
+        else:
+            raise _parse_error(statement, fname, "only imports and one model assignment are allowed")
+    return None
+
+
+def _parse_error(node, fname, message):
+    return ValueError("%s, line %i: %s" % (fname, getattr(node, 'lineno', 0), message))
+
+
+# Gets the component classes named in a 'from ... import ...' statement.
+def _import_classes(statement, fname):
+    if statement.level != 0 or not _allowed_module.match(statement.module or ''):
+        raise _parse_error(statement, fname, "imports from module '%s' are not allowed" % statement.module)
+    module = importlib.import_module(statement.module)
+
+    result = {}
+    for alias in statement.names:
+        cls = getattr(module, alias.name, None)
+        if not (isinstance(cls, type) and issubclass(cls, Model)):
+            raise _parse_error(statement, fname, "'%s' is not a model class" % alias.name)
+        result[alias.asname or alias.name] = cls
+    return result
+
+
+# Models that are plain sums are built as a flat SummedCompoundModel,
+# which takes time proportional to the number of components. They are
+# handed to callers as astropy models, which fitters and other astropy
+# code can work with.
+def _astropy_model(model):
+    if isinstance(model, sp_compound.SummedCompoundModel):
+        return model.to_compound()
+    return model
+
+
+# Builds a model from an expression tree. This is a post-order walk:
+# operands (anything but a binary operator) are turned into components
+# by function 'component' as they are reached, and each operator is
+# applied once both of its operands are built. The explicit stack avoids
+# the recursion limit on the long chains of binary operators that
+# result from expressions with many components.
+def _build_expression(node, component, fname):
+    # plain sums are built as a flat SummedCompoundModel.
+    terms = _sum_terms(node)
+    if terms is not None and len(terms) > 1:
+        return sp_compound.SummedCompoundModel([component(term) for term in terms])
+
+    operands = []
+    stack = [(node, False)]
+    while stack:
+        node, visited = stack.pop()
+        if isinstance(node, ast.BinOp):
+            if type(node.op) not in _operators:
+                raise _parse_error(node, fname, "operator %s is not allowed" % type(node.op).__name__)
+            if visited:
+                right = operands.pop()
+                left = operands.pop()
+                operands.append(_operators[type(node.op)](left, right))
+            else:
+                stack.append((node, True))
+                stack.append((node.right, False))
+                stack.append((node.left, False))
+        else:
+            operands.append(component(node))
+    return operands[0]
+
+
+# Gets the terms of an expression that is a plain sum, in the
+# order they appear in the expression. None for other expressions.
+def _sum_terms(node):
+    terms = []
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, ast.BinOp):
+            if not isinstance(node.op, ast.Add):
+                return None
+            stack.append(node.right)
+            stack.append(node.left)
+        else:
+            terms.append(node)
+    return terms
+
+
+# Builds a component from a call to its class.
+def _build_component(call, classes, fname):
+    if not isinstance(call.func, ast.Name) or call.func.id not in classes:
+        raise _parse_error(call, fname, "call to a class that was not imported")
+    if call.starargs or call.kwargs:
+        raise _parse_error(call, fname, "* and ** arguments are not allowed")
+
+    args = [_literal(arg, fname) for arg in call.args]
+    kwargs = {}
+    for keyword in call.keywords:
+        if keyword.arg == 'tied':
+            kwargs['tied'] = _build_ties(keyword.value, fname)
+        else:
+            kwargs[keyword.arg] = _literal(keyword.value, fname)
+    return classes[call.func.id](*args, **kwargs)
+
+
+def _literal(node, fname):
+    try:
+        return ast.literal_eval(node)
+    except ValueError:
+        raise _parse_error(node, fname, "component arguments must be literals")
+
+
+def _build_ties(node, fname):
+    if not isinstance(node, ast.Dict):
+        raise _parse_error(node, fname, "ties must be given in a dictionary")
+    result = {}
+    for key, value in zip(node.keys, node.values):
+        if isinstance(value, ast.Lambda):
+            result[_literal(key, fname)] = _build_tie(value, fname)
+        else:
+            result[_literal(key, fname)] = _literal(value, fname)
+    return result
+
+
+# Builds a tie from a lambda node of the form 'lambda m: factor * m[index].name'.
+def _build_tie(node, fname):
+    args = node.args
+    body = node.body
+    valid = len(args.args) == 1 and isinstance(args.args[0], ast.Name) and \
+            not args.vararg and not args.kwarg and not args.defaults and \
+            isinstance(body, ast.BinOp) and isinstance(body.op, ast.Mult) and \
+            isinstance(body.right, ast.Attribute) and \
+            isinstance(body.right.value, ast.Subscript) and \
+            isinstance(body.right.value.value, ast.Name) and \
+            body.right.value.value.id == args.args[0].id and \
+            isinstance(body.right.value.slice, ast.Index)
+    if valid:
+        try:
+            factor = ast.literal_eval(body.left)
+            component = ast.literal_eval(body.right.value.slice.value)
+            valid = isinstance(factor, (int, long, float)) and \
+                    isinstance(component, (int, long, basestring))
+        except ValueError:
+            valid = False
+    if not valid:
+        raise _parse_error(node, fname, "ties must be of the form 'lambda m: factor * m[index].name'")
+
+    if isinstance(component, unicode):
+        component = str(component)
+    return sp_ties.Tie(factor, component, body.right.attr)
+
+
 # Builds a model expression inside a string, and dumps string to file.
+# PyQt is imported here and not at module level, so the functions that
+# read models from file can be used by code that runs with no display.
 def saveModelToFile(parent, model, model_directory):
+    from PyQt4.QtGui import QFileDialog
+
+    fname = QFileDialog.getSaveFileName(parent, 'Write to file', model_directory,
+                                        "Model files (*.py *.json *.npz)")
+    if len(fname) > 0:
+        saveModel(model, str(fname))
+
+
+def saveModel(model, fname):
+    """ Writes a model to file.
+
+    The file format is chosen by the file name extension. Files
+    ending in .json or .npz get the structured formats written by
+    writeJSON and writeNPZ. Any other file gets a Python expression
+    in the specfit format, which can be read by parseModel.
+
+    Parameters
+    ----------
+    model: astropy model
+      A single component, or a compound model.
+    fname: str
+      The file name.
+
+    """
+    extension = os.path.splitext(fname)[1].lower()
+    if extension in _writers:
+        _writers[extension](model, fname)
+        return
+
     if hasattr(model, '_format_expression'):
         expression_string, prolog = _buildCompoundModelExpression(model)
     else:
         expression_string, prolog = _buildSingleComponentExpression(model)
 
-    # Write to file.
-    fname = QFileDialog.getSaveFileName(parent, 'Write to file', model_directory)
+    with open(fname, 'w') as f:
+        f.write(prolog)
+        f.write(expression_string)
+
+
+# The structured formats store a model in columns. The header describes
+# the model: its expression (as in the _format_expression method of
+# compound models), and the class, name, parameter names, ties and
+# constructor arguments (see _ARGUMENTS) of each component. The parameter values, bounds and fixed flags of all
+# components are stored in flat arrays, in the order of the components
+# in the expression, and of the parameters in each component. Missing
+# bounds are stored as NaN.
+_FORMAT = 'sp_model'
+_VERSION = 1
+
+# Constructor arguments, other than parameters, that some components
+# can't be built without: the degree of polynomials, and the domain
+# and window they are evaluated on.
+_ARGUMENTS = ('degree', 'domain', 'window')
+
+
+# Gets the values of the constructor arguments of a component, as plain
+# Python numbers and lists. Arguments the component has no use for are
+# left out.
+def _component_arguments(component):
+    result = {}
+    for name in _ARGUMENTS:
+        value = getattr(component, name, None)
+        if value is None:
+            continue
+        if np.isscalar(value):
+            result[name] = int(value)
+        else:
+            result[name] = [float(v) for v in value]
+    return result
 
-    if len(fname) > 0:
-        f = os.open(fname, os.O_RDWR|os.O_CREAT)
-        os.write(f, prolog)
-        os.write(f, expression_string)
-        os.close(f)
+
+# Splits a model into its header and its arrays.
+def _model_columns(model):
+    if hasattr(model, '_submodels'):
+        components = list(model)
+        expression = model._format_expression()
+    else:
+        components = [model]
+        expression = "[0]"
+
+    header = {'format': _FORMAT, 'version': _VERSION, 'expression': expression, 'components': []}
+    bounds = []
+    fixed = []
+    for component in components:
+        ties = {}
+        for param_name in component.param_names:
+            if component.tied[param_name]:
+                ties[param_name] = get_tie_text(component.tied[param_name])
+            bounds.append(component.bounds[param_name])
+            fixed.append(component.fixed[param_name])
+        header['components'].append({
+            'class':       models_registry.get_component_name(component),
+            'module':      models_registry.get_component_path(component),
+            'name':        component.name,
+            'param_names': list(component.param_names),
+            'tied':        ties,
+            'arguments':   _component_arguments(component),
+        })
+
+    bounds = np.array(bounds, dtype=np.float64).reshape(-1, 2)
+    arrays = {
+        'parameters': np.concatenate([component.parameters for component in components]),
+        'min':        bounds[:,0],
+        'max':        bounds[:,1],
+        'fixed':      np.array(fixed, dtype=bool),
+    }
+    return header, arrays
+
+
+# Builds a model from its header and its arrays.
+def _model_from_columns(header, arrays, fname):
+    if header.get('format') != _FORMAT or header.get('version') != _VERSION:
+        raise ValueError("%s: not a model file, or unknown version." % fname)
+
+    parameters = np.asarray(arrays['parameters'], dtype=np.float64)
+    lower = np.asarray(arrays['min'], dtype=np.float64)
+    upper = np.asarray(arrays['max'], dtype=np.float64)
+    fixed = np.asarray(arrays['fixed'], dtype=bool)
+
+    components = []
+    i = 0
+    for spec in header['components']:
+        statement = ast.ImportFrom(module=spec['module'], names=[ast.alias(name=spec['class'], asname=None)], level=0)
+        cls = _import_classes(statement, fname)[spec['class']]
+
+        param_names = spec['param_names']
+        n = len(param_names)
+        bounds = {}
+        fixed_flags = {}
+        for j, param_name in enumerate(map(str, param_names)):
+            bounds[param_name] = tuple(None if np.isnan(b) else float(b) for b in (lower[i+j], upper[i+j]))
+            fixed_flags[param_name] = bool(fixed[i+j])
+        ties = {}
+        for param_name, text in spec['tied'].items():
+            ties[str(param_name)] = _build_tie(_parse_tie_text(str(text), fname), fname)
+
+        kwargs = dict(zip(map(str, param_names), parameters[i:i+n]))
+        for key, value in spec.get('arguments', {}).items():
+            kwargs[str(key)] = value
+        name = str(spec['name']) if spec['name'] is not None else None
+        components.append(cls(name=name, bounds=bounds, fixed=fixed_flags, tied=ties, **kwargs))
+        i += n
+
+    # operands in the expression are [0], [1], etc. Renamed to _0,
+    # _1, etc, they become valid Python names that can be parsed.
+    tree = ast.parse(re.sub(r'\[([0-9]+)\]', r'_\1', header['expression']), fname, 'eval')
+
+    def component(node):
+        if not isinstance(node, ast.Name) or not re.match(r'^_[0-9]+$', node.id):
+            raise _parse_error(node, fname, "expected a component or an operator")
+        return components[int(node.id[1:])]
+
+    return _astropy_model(_build_expression(tree.body, component, fname))
+
+
+def parse_tie(text):
+    """ Parses the text form of a tie, as written by get_tie_text.
+
+    Parameters
+    ----------
+    text: str
+      Either 'lambda m: factor * m[index].name', or 'False'
+      (or an empty string) for a parameter that is not tied.
+
+    Returns
+    -------
+    instance of sp_ties.Tie, or False
+
+    Raises
+    ------
+    ValueError
+      If the text is not a valid tie.
+
+    """
+    text = text.strip()
+    if text in ('', 'False'):
+        return False
+    try:
+        return _build_tie(_parse_tie_text(text, '<tie>'), '<tie>')
+    except SyntaxError as e:
+        raise ValueError("<tie>: %s" % e)
+
+
+def _parse_tie_text(text, fname):
+    node = ast.parse(text, fname, 'eval').body
+    if not isinstance(node, ast.Lambda):
+        raise _parse_error(node, fname, "ties must be lambda functions")
+    return node
+
+
+def writeJSON(model, fname):
+    ''' Writes a model to a JSON file. '''
+    header, arrays = _model_columns(model)
+    for key, array in arrays.items():
+        header[key] = [None if np.isnan(value) else value for value in array.tolist()] \
+                      if array.dtype.kind == 'f' else array.tolist()
+    with open(fname, 'w') as f:
+        json.dump(header, f, indent=1)
+
+
+def readJSON(fname):
+    ''' Reads a model from a JSON file. '''
+    with open(fname) as f:
+        header = json.load(f)
+    arrays = {}
+    for key in ('parameters', 'min', 'max'):
+        arrays[key] = np.array([np.nan if value is None else value for value in header[key]], dtype=np.float64)
+    arrays['fixed'] = np.array(header['fixed'], dtype=bool)
+    return _model_from_columns(header, arrays, fname)
+
+
+def writeNPZ(model, fname):
+    ''' Writes a model to a numpy .npz file. '''
+    header, arrays = _model_columns(model)
+    np.savez_compressed(fname, header=np.array(json.dumps(header)), **arrays)
+
+
+def readNPZ(fname):
+    ''' Reads a model from a numpy .npz file. '''
+    with np.load(fname) as data:
+        header = json.loads(str(data['header']))
+        arrays = dict((key, data[key]) for key in ('parameters', 'min', 'max', 'fixed'))
+    return _model_from_columns(header, arrays, fname)
+
+
+_writers = {'.json': writeJSON, '.npz': writeNPZ}
+_readers = {'.json': readJSON,  '.npz': readNPZ}
 
 
 def _buildSingleComponentExpression(model):
@@ -74,14 +492,15 @@ def _buildCompoundModelExpression(model):
     # this loop builds the main expression, and captures
     # information needed for building the file header (where
     # the import statements go).
-    expression_string = ""
+    expression_parts = []
     import_module_names = {}
     for token, component in zip(tokens, model):
         # clean up astropy-inserted characters
         token = token.replace('[', '')
         token = token.replace(']', '')
 
-        expression_string += str(token) + _assemble_component_spec(component)
+        expression_parts.append(str(token))
+        expression_parts.append(_assemble_component_spec(component))
 
         # here we store the module paths for each component. Using
         # a dictionary key ensures that we get only one of each.
@@ -92,107 +511,84 @@ def _buildCompoundModelExpression(model):
     # this loop now uses the captured information from above to
     # build a set of import statements that go at the beginning
     # of the file.
-    prolog = ""
-    for name, path in import_module_names.iteritems():
-        prolog += "from " + path + " import " + name + "\n"
-    prolog += "\n"
+    prolog = ["from " + path + " import " + name + "\n"
+              for name, path in import_module_names.iteritems()]
+    prolog.append("\n")
     # we need to add a reference to the model so it can actually
     # be used after imported. We just use 'model1' for the variable
     # name. This also implicitly assumes that only one model will be
     # stored in the file. It remains to be seen how useful this
     # assumption will be in practice.
-    prolog += "model1 = \\\n"
-    return expression_string, prolog
+    prolog.append("model1 = \\\n")
+    return "".join(expression_parts), "".join(prolog)
 
 
-# Disassembles a tie callable. Ties read from a model
-# file are not directly accessible in text form because
-# the model file is compiled at import time.
-def get_tie_text(tie):
-    if tie:
-        # dis() only outputs on standard output.....
-        keep = sys.stdout
-        sys.stdout = StringIO()
-        dis.dis(tie)
-        assembler_text = sys.stdout.getvalue()
-        sys.stdout.close()
-        sys.stdout = keep
-        result = _parse_assembler_text(assembler_text)
-    else:
-        result = 'False'
-    return result
+# Gets the text form of a tie. Ties that are not sp_ties.Tie instances
+# are lambda functions, which have to be decoded to get their text. The
+# text is cached by function, so each one is decoded only once.
+_tie_texts = WeakKeyDictionary()
 
-
-# This parses the text returned by the disassembler for
-# a lambda function that multiplies a constant by a
-# variable. That is, we are assuming that ties are coded
-# as lambda functions with multiplication by a constant,
-# as in STSDAS' specfit.
-parser = re.compile(r'\(([^)]+)\)') # picks up whatever is enclosed in parenthesis
-def _parse_assembler_text(text):
-    tokens = parser.findall(text)
-    factor = tokens[0]
-    lambda_variable_name = tokens[1]
-    function_id = tokens[2]
-    par_name = tokens[3]
-
-    return "lambda %s: %s *  %s[%s].%s" % \
-           (lambda_variable_name,
-            factor,
-            lambda_variable_name,
-            function_id,
-            par_name)
+def get_tie_text(tie):
+    if not tie:
+        return 'False'
+    if isinstance(tie, sp_ties.Tie):
+        return tie.text
+    try:
+        return _tie_texts[tie]
+    except KeyError:
+        result = sp_ties.from_function(tie).text
+        _tie_texts[tie] = result
+        return result
 
 
 # Builds an operand (a spectral component) for an astropy compound model.
+# The text is accumulated in a list and joined once at the end.
 def _assemble_component_spec(component):
-    result = ""
+    result = []
 
     # function name - Note that get_component_name works
     # pretty much independently of the models registry.
     # Any model will work because the function name is
     # derived from the component's __class__.
     name = models_registry.get_component_name(component)
-    result += name
+    result.append(name)
 
     # component name
     if component.name:
-        result += "(name = \'"
-        result += component.name + "\',\n"
+        result.append("(name = \'" + component.name + "\',\n")
     else:
-        result += "(\n"
+        result.append("(\n")
+
+    # constructor arguments, such as the degree of polynomials.
+    for key, value in sorted(_component_arguments(component).items()):
+        result.append("            " + key + " = " + repr(value) + ",\n")
 
     # parameter names and values
     for i, param_name in enumerate(component.param_names):
-        result += "            " + param_name
-        result += " = "
-        result += str(component.parameters[i]) + ",\n"
+        result.append("            " + param_name + " = " + str(component.parameters[i]) + ",\n")
 
     # parameter bounds
     bounds = component.bounds
-    result += "            bounds = {\n"
+    result.append("            bounds = {\n")
     for param_name in component.param_names:
-        result += "                     '" + param_name + "': " + str(bounds[param_name]) + ",\n"
-    result += "                     },\n"
+        result.append("                     '" + param_name + "': " + str(bounds[param_name]) + ",\n")
+    result.append("                     },\n")
 
     # parameter fixed flags
     fixed = component.fixed
-    result += "            fixed = {\n"
+    result.append("            fixed = {\n")
     for param_name in component.param_names:
-        result += "                     '" + param_name + "': " + str(fixed[param_name]) + ",\n"
-    result += "                    },\n"
+        result.append("                     '" + param_name + "': " + str(fixed[param_name]) + ",\n")
+    result.append("                    },\n")
 
     # parameter ties. Ties have to be disassembled and parsed
     # in order to become human-readable and writable to file.
     ties = component.tied
-    result += "            tied = {\n"
+    result.append("            tied = {\n")
     for param_name in component.param_names:
         tie_text = get_tie_text(ties[param_name])
-        result += "                    '" + param_name + "': " + tie_text + ",\n"
-    result += "                   },\n"
-
-    result += "            ) \\\n"
-    return result
-
-
+        result.append("                    '" + param_name + "': " + tie_text + ",\n")
+    result.append("                   },\n")
 
+    result.append("            ) \\\n")
+    return "".join(result)
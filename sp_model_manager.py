@@ -2,11 +2,12 @@ from __future__ import division
 
 import sys
 
+import numpy as np
+
 from pyqt_nonblock import pyqtapplication
 
-import models_registry
 import sp_widget
-from sp_widget import SpectralModelManager, SignalModelChanged
+from sp_widget import SpectralModelManager, SignalModelChanged, SignalChangeSummary
 
 from PyQt4.QtCore import *
 from PyQt4.QtGui import *
@@ -216,25 +217,9 @@ class _ModelManagerWidget(QTabWidget):
             # and layout sequence as implemented in module sp_widget.
             window = self.widget(k).layout().itemAt(0).widget().widget(0)
 
-            # it's not enough to send a generic signal to tell the model
-            # (as in MVC) that it changed. We have to resort to completely
-            # removing all rows from the tree, and then adding them back.
-            # This somehow may have to do with the Qt nonblock mechanism,
-            # because when in blocking mode, a direct, generic signal
-            # works as expected.
-            window.model.beginRemoveRows(window.treeView.rootIndex(),
-                                         0, window.model.rowCount()-1)
-            component_list = []
-            row_range = range(window.model.rowCount())
-            for k in row_range:
-                item = window.model.item(0).getDataItem()
-                component_list.append(item)
-                window.model.removeRow(0)
-            window.model.endRemoveRows()
-            for k in row_range:
-                component = component_list[k]
-                name = models_registry.get_component_name(component)
-                window.model.addToModel(name, component)
+            # the tree model reads the components on demand, so resetting
+            # it is enough to get the current parameter values on screen.
+            window.model.refresh()
 
     # Overrides the default behavior so as to ignore window closing
     # requests (such as from the platform-dependent red X button) and
@@ -326,6 +311,10 @@ class ModelManager(object):
 
     modelManagerInstance.changed.connect(handleSignal.....)
 
+    Handlers connected to the 'changeSummary' signal get, in addition,
+    an instance of sp_widget.ChangeSummary telling what changed. Bursts
+    of changes can be merged into a single signal with setCoalescing.
+
 
     Parameters
     ----------
@@ -385,10 +374,42 @@ class ModelManager(object):
         # the SpectralModelManager instance just created.
         self.changed = SignalModelChanged()
         self.manager.changed.connect(self._broadcastModelChange)
+        self.changeSummary = SignalChangeSummary()
+        self.manager.changeSummary.connect(self._broadcastChangeSummary)
 
     def _broadcastModelChange(self):
         self.changed()
 
+    def _broadcastChangeSummary(self, summary):
+        self.changeSummary(summary)
+
+    def setCoalescing(self, interval=0):
+        ''' Merges bursts of changes in the model into one notification.
+
+        See SpectralModelManager.setCoalescing.
+
+        Parameters
+        ----------
+        interval: int or None, optional
+          interval, in milliseconds, during which changes are
+          collected. None turns coalescing off.
+
+        '''
+        self.manager.setCoalescing(interval)
+
+    def setPrecision(self, dtype=np.float64):
+        ''' Sets the floating point precision of the computed spectra.
+
+        See SpectralModelManager.setPrecision.
+
+        Parameters
+        ----------
+        dtype: numpy dtype, optional
+          Either numpy.float32 or numpy.float64 (the default).
+
+        '''
+        self.manager.setPrecision(dtype)
+
     # Use delegation to decouple the ModelManager API from
     # the GUI model manager API.
 
@@ -471,6 +492,27 @@ class ModelManager(object):
         '''
         return self.manager.spectrum(wave)
 
+    def spectrum_many(self, waves, offsets=None):
+        ''' Computes the compound model flux values on many
+        arrays of spectral coordinate values at once.
+
+        Parameters
+        ----------
+        waves: list or numpy array
+          Either a list with arrays of spectral coordinate values,
+          or a single array with all of them concatenated.
+        offsets: list or numpy array, optional
+          When 'waves' is a concatenated array, the index at which
+          each array of spectral coordinate values starts in it.
+
+        Returns
+        -------
+        A list with numpy arrays of flux values, one for each
+        array of spectral coordinate values.
+
+        '''
+        return self.manager.spectrum_many(waves, offsets)
+
 
 if __name__ == "__main__":
     mm = ModelManager()
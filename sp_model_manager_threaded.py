@@ -77,11 +77,10 @@ class SpectralModelManager():
             nc = new_components[i]
             c.parameters = nc.parameters
 
-            # modify the tree model so the fit results
-            # show immediately on the display.
-            for j, value in enumerate(c.parameters):
-                item = self.models_gui.model.item(i).child(j).child(0)
-                item.setData("value: " + str(value), role=Qt.DisplayRole)
+        # tell the tree model so the fit results
+        # show immediately on the display.
+        if len(self.components) > 0:
+            self.models_gui.model.parametersChanged(0, len(self.components) - 1)
 
 
 # Derived app class that builds the QApplication and runs it as a modal dialog.
@@ -254,12 +253,15 @@ class _IPythonModelManagerWidget(_ModelManagerWidget, QtNonblock):
         super(_IPythonModelManagerWidget, self).__init__(manager, name)
 
 
-def _runGUIInThread(manager, name):
-    app = pyqt_thread_helper.getApplication()
+def _buildGUIInThread(manager, name):
+    pyqt_thread_helper.getApplication()
     global __dialog
     if not __dialog:
         __dialog = _ModelManagerWidget(manager.manager, name)
-    app.exec_()
+
+
+def _runGUIInThread():
+    pyqt_thread_helper.getApplication().exec_()
 
 
 def _runGUIDirectly(manager, name):
@@ -297,7 +299,10 @@ def _displayGUI(manager, name):
         global __threaded
         if __threaded:
             if not _is_running_from_ipython():
-                pyqt_thread_helper.queueCommand(_runGUIInThread, arguments=[manager, name])
+                # waits for the widget to be built, so signals can
+                # be sent to it as soon as this function returns.
+                pyqt_thread_helper.queueCommand(_buildGUIInThread, arguments=[manager, name]).result()
+                pyqt_thread_helper.queueCommand(_runGUIInThread)
             else:
                 _runGUIInIPython(manager, name)
         else:
@@ -0,0 +1,117 @@
+import collections
+
+import numpy as np
+
+# Astropy models keep their parameter values in a flat array of their
+# own (the _parameters attribute), and their fixed flags and bounds in
+# dicts. A ParameterStore holds the values, bounds and fixed flags of
+# all components in a model in four contiguous arrays, and points each
+# component to its slice of them. Astropy reads and writes parameters
+# through _parameters, so the components keep working as usual, while
+# code that handles the model as a whole can work with the arrays.
+
+
+# Fixed flags and bounds of a component, as a mapping from parameter
+# name to the component's slice of the arrays in a store. Copies of a
+# component (astropy copies models with deepcopy) get plain dicts, so
+# they are detached from the store, as their parameter values are.
+class _FixedView(collections.MutableMapping):
+    def __init__(self, fixed, names):
+        self._fixed = fixed
+        self._index = dict((name, i) for i, name in enumerate(names))
+
+    def __getitem__(self, name):
+        return bool(self._fixed[self._index[name]])
+
+    def __setitem__(self, name, value):
+        self._fixed[self._index[name]] = value
+
+    def __delitem__(self, name):
+        raise TypeError("Parameters cannot be removed.")
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __deepcopy__(self, memo):
+        return dict(self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class _BoundsView(_FixedView):
+    def __init__(self, lower, upper, names):
+        self._lower = lower
+        self._upper = upper
+        self._index = dict((name, i) for i, name in enumerate(names))
+
+    def __getitem__(self, name):
+        i = self._index[name]
+        return tuple(None if np.isnan(b) else float(b) for b in (self._lower[i], self._upper[i]))
+
+    def __setitem__(self, name, value):
+        i = self._index[name]
+        self._lower[i], self._upper[i] = (np.nan if b is None else b for b in value)
+
+
+class ParameterStore(object):
+    """ Contiguous storage for the parameters of a list of components.
+
+    Binding a list of components to the store copies their parameter
+    values, bounds and fixed flags into the store arrays, and makes
+    each component a view of its slice of the arrays. From then on,
+    parameters set through the components show in the arrays, and the
+    other way around. Missing bounds are stored as NaN.
+
+    Parameters
+    ----------
+    components: list, optional
+      The components to bind to the store.
+
+    """
+    def __init__(self, components=()):
+        self.bind(components)
+
+    def bind(self, components):
+        ''' Binds a list of components to the store, replacing
+        any components that were bound before. '''
+        self.components = list(components)
+        sizes = [len(c.parameters) for c in self.components]
+        self.offsets = np.concatenate(([0], np.cumsum(sizes))).astype(int)
+
+        size = self.offsets[-1]
+        self.values = np.empty(size, dtype=np.float64)
+        self.min = np.empty(size, dtype=np.float64)
+        self.max = np.empty(size, dtype=np.float64)
+        self.fixed = np.empty(size, dtype=bool)
+
+        for component, start, end in zip(self.components, self.offsets[:-1], self.offsets[1:]):
+            names = component.param_names
+            self.values[start:end] = component.parameters
+            for i, name in enumerate(names):
+                bounds = component.bounds[name]
+                self.min[start+i] = np.nan if bounds[0] is None else bounds[0]
+                self.max[start+i] = np.nan if bounds[1] is None else bounds[1]
+                self.fixed[start+i] = component.fixed[name]
+
+            component._parameters = self.values[start:end]
+            component._constraints['fixed'] = _FixedView(self.fixed[start:end], names)
+            component._constraints['bounds'] = _BoundsView(self.min[start:end], self.max[start:end], names)
+
+    def slice(self, index):
+        ''' Gets the slice of the arrays that belongs to a component. '''
+        return slice(self.offsets[index], self.offsets[index+1])
+
+    def snapshot(self):
+        ''' Gets a copy of all parameter values. '''
+        return self.values.copy()
+
+    def restore(self, snapshot):
+        ''' Sets all parameter values from a snapshot. '''
+        self.values[:] = snapshot
+
+    def __len__(self):
+        return len(self.values)
@@ -0,0 +1,330 @@
+import dis
+import warnings
+
+# Ties, as in STSDAS' specfit, make a parameter equal to a constant
+# factor times a parameter in another component of the same compound
+# model. Astropy takes ties to be callables that get the compound model
+# and return the tied value, so they used to be written as lambdas:
+#
+#   lambda m: 0.5 * m['g1'].amplitude
+#
+# Lambdas can only be brought back to text form by disassembling their
+# bytecode. A Tie holds the factor, component and parameter instead,
+# and builds its text form just once, when it is first needed.
+
+
+class Tie(object):
+    """ A tie of a parameter to a parameter in another component.
+
+    Tie instances are callables that can be set in the 'tied'
+    attribute of astropy models.
+
+    Parameters
+    ----------
+    factor: float
+      The constant factor.
+    component: int or str
+      The index or the name of the component in the compound model.
+    parameter: str
+      The parameter name.
+
+    """
+    def __init__(self, factor, component, parameter):
+        self.factor = factor
+        self.component = component
+        self.parameter = parameter
+        self._text = None
+
+    def __call__(self, model):
+        return self.factor * getattr(model[self.component], self.parameter)
+
+    @property
+    def text(self):
+        ''' The tie, written as a lambda function. '''
+        if self._text is None:
+            self._text = "lambda m: %r * m[%r].%s" % (self.factor, self.component, self.parameter)
+        return self._text
+
+    def renamed(self, old_name, new_name):
+        ''' Returns the tie with the component name changed. '''
+        if self.component == old_name:
+            return Tie(self.factor, new_name, self.parameter)
+        return self
+
+    def __eq__(self, other):
+        return isinstance(other, Tie) and \
+               (self.factor, self.component, self.parameter) == \
+               (other.factor, other.component, other.parameter)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.factor, self.component, self.parameter))
+
+    def __repr__(self):
+        return "Tie(%r, %r, %r)" % (self.factor, self.component, self.parameter)
+
+
+# The instructions in the bytecode of 'lambda m: factor * m[c].name'.
+_tie_instructions = ['LOAD_CONST', 'LOAD_FAST', 'LOAD_CONST', 'BINARY_SUBSCR',
+                     'LOAD_ATTR', 'BINARY_MULTIPLY', 'RETURN_VALUE']
+
+
+# Decodes the bytecode of a function into (instruction name, argument)
+# pairs. Arguments are looked up in the constants and names of the code
+# object, so this reads the bytecode without disassembling it to text.
+def _instructions(code):
+    result = []
+    bytecode = code.co_code
+    i = 0
+    while i < len(bytecode):
+        opcode = ord(bytecode[i])
+        argument = None
+        if opcode >= dis.HAVE_ARGUMENT:
+            argument = ord(bytecode[i+1]) + ord(bytecode[i+2]) * 256
+            i += 3
+        else:
+            i += 1
+        name = dis.opname[opcode]
+        if name == 'LOAD_CONST':
+            argument = code.co_consts[argument]
+        elif name == 'LOAD_ATTR':
+            argument = code.co_names[argument]
+        elif name == 'LOAD_FAST':
+            argument = code.co_varnames[argument]
+        result.append((name, argument))
+    return result
+
+
+def from_function(function):
+    """ Builds a Tie from a lambda function.
+
+    Parameters
+    ----------
+    function: function
+      A function of the form 'lambda m: factor * m[component].parameter'
+
+    Returns
+    -------
+    instance of Tie
+
+    Raises
+    ------
+    ValueError
+      If the function is not of the form above.
+
+    """
+    code = getattr(function, '__code__', None)
+    instructions = _instructions(code) if code is not None else []
+    if [name for name, argument in instructions] != _tie_instructions or \
+       code.co_argcount != 1 or instructions[1][1] != code.co_varnames[0]:
+        raise ValueError("Tie %s is not of the form 'lambda m: factor * m[component].parameter'" % function)
+    return Tie(instructions[0][1], instructions[2][1], instructions[4][1])
+
+
+def as_tie(tie):
+    ''' Returns a tie as a Tie instance, or None if there is no tie. '''
+    if not tie:
+        return None
+    if isinstance(tie, Tie):
+        return tie
+    return from_function(tie)
+
+
+class TieCycleError(ValueError):
+    ''' Raised when a tie would make a parameter depend on itself. '''
+
+
+class TieGraph(object):
+    """ Index of the ties among the components of a model.
+
+    The graph keeps the components in model order, an index from
+    component name to component, and an index from each component
+    reference (a name or an index, as found in ties) to the tied
+    parameters that refer to it. Renaming a component only touches
+    the ties that depend on it, and cycles are detected as soon as a
+    tie is added. Ties that are not of the specfit form are left out
+    of the graph, with a warning.
+
+    Parameters
+    ----------
+    components: list, optional
+      The components in the model, in model order.
+
+    """
+    def __init__(self, components=()):
+        self._components = []
+        self._names = {}
+        self._dependents = {}
+        for component in components:
+            self.add(component)
+
+    @property
+    def components(self):
+        return list(self._components)
+
+    def add(self, component, index=None):
+        ''' Adds a component and its ties. A tie that closes
+        a cycle is removed from the component, and TieCycleError
+        is raised after the component was added. '''
+        if index is None:
+            index = len(self._components)
+        self._components.insert(index, component)
+        if component.name:
+            self._names[component.name] = component
+
+        cycles = []
+        for param_name in component.param_names:
+            try:
+                tie = as_tie(component.tied[param_name])
+            except ValueError as e:
+                warnings.warn(str(e) + "; ignored.")
+                continue
+            if tie is not None:
+                try:
+                    self.tie(component, param_name, tie)
+                except TieCycleError as e:
+                    component.tied[param_name] = False
+                    cycles.append(str(e))
+        if cycles:
+            raise TieCycleError('\n'.join(cycles))
+
+    def remove(self, component):
+        ''' Removes a component and its ties. Ties in other
+        components that refer to it are kept, dangling. '''
+        for param_name in component.param_names:
+            self._unindex(component, param_name)
+        self._components.remove(component)
+        if component.name and self._names.get(component.name) is component:
+            del self._names[component.name]
+
+    def find(self, reference):
+        ''' Gets the component a tie refers to, or None. '''
+        if isinstance(reference, basestring):
+            return self._names.get(reference)
+        if -len(self._components) <= reference < len(self._components):
+            return self._components[reference]
+        return None
+
+    def target(self, component, param_name):
+        ''' Gets the (component, parameter name) a parameter is
+        tied to, or None if the parameter is not tied, or tied to
+        a component that is not in the graph. '''
+        tie = component.tied[param_name]
+        if not isinstance(tie, Tie):
+            return None
+        target = self.find(tie.component)
+        if target is None or tie.parameter not in target.param_names:
+            return None
+        return target, tie.parameter
+
+    def dependents(self, reference):
+        ''' Gets the (component, parameter name) pairs tied to
+        the component with the given name or index. '''
+        return list(self._dependents.get(reference, {}).values())
+
+    def tie(self, component, param_name, tie):
+        ''' Ties a parameter in a component of the graph.
+
+        Raises
+        ------
+        TieCycleError
+          If the tie would make the parameter depend on itself.
+          The parameter is left as it was.
+
+        '''
+        tie = as_tie(tie)
+
+        # the parameter closes a cycle if it is found when walking
+        # down the chain of ties that starts with its would-be target.
+        node = (self.find(tie.component), tie.parameter)
+        seen = set()
+        while node is not None and (id(node[0]), node[1]) not in seen:
+            if node[0] is component and node[1] == param_name:
+                raise TieCycleError("Tie %s in parameter %s of %r closes a cycle."
+                                    % (tie.text, param_name, component))
+            seen.add((id(node[0]), node[1]))
+            node = self.target(*node) if node[0] is not None else None
+
+        self._unindex(component, param_name)
+        component.tied[param_name] = tie
+        self._dependents.setdefault(tie.component, {})[(id(component), param_name)] = (component, param_name)
+
+    def untie(self, component, param_name):
+        self._unindex(component, param_name)
+        component.tied[param_name] = False
+
+    def rename(self, component, old_name, new_name):
+        ''' Updates the graph after a component name changed, and
+        points the ties that refer to the old name to the new name.
+
+        Returns
+        -------
+        A list with the (component, parameter name, tie) of the
+        ties that were changed.
+
+        '''
+        if old_name and self._names.get(old_name) is component:
+            del self._names[old_name]
+        if new_name:
+            self._names[new_name] = component
+
+        result = []
+        dependents = self._dependents.pop(old_name, {})
+        for key, (dependent, param_name) in dependents.items():
+            tie = dependent.tied[param_name].renamed(old_name, new_name)
+            dependent.tied[param_name] = tie
+            result.append((dependent, param_name, tie))
+        if dependents:
+            self._dependents.setdefault(new_name, {}).update(dependents)
+        return result
+
+    def roots(self):
+        ''' Follows every chain of ties down to its root.
+
+        Each tied parameter is equal to the product of the factors
+        along its chain times the parameter at the root of the chain,
+        which is not tied. Chains are walked once, in topological
+        order, so this takes time proportional to the number of ties.
+        Ties to components that are not in the graph are ignored.
+
+        Returns
+        -------
+        A list of (component, parameter name, factor, root component,
+        root parameter name) tuples, one per tied parameter.
+
+        '''
+        resolved = {}
+        result = []
+        for component in self._components:
+            for param_name in component.param_names:
+                # walks down the chain until a parameter that is
+                # either not tied (the root) or already resolved.
+                chain = []
+                seen = set()
+                node = (component, param_name)
+                while (id(node[0]), node[1]) not in resolved:
+                    target = self.target(*node)
+                    if target is None:
+                        break
+                    if (id(node[0]), node[1]) in seen:
+                        raise TieCycleError("Ties in %r form a cycle." % component)
+                    seen.add((id(node[0]), node[1]))
+                    chain.append(node)
+                    node = target
+
+                factor, root = resolved.get((id(node[0]), node[1]), (1., node))
+                for tied in reversed(chain):
+                    factor = tied[0].tied[tied[1]].factor * factor
+                    resolved[(id(tied[0]), tied[1])] = (factor, root)
+                    result.append((tied[0], tied[1], factor, root[0], root[1]))
+        return result
+
+    def _unindex(self, component, param_name):
+        tie = component.tied[param_name]
+        if isinstance(tie, Tie):
+            dependents = self._dependents.get(tie.component, {})
+            dependents.pop((id(component), param_name), None)
+            if not dependents:
+                self._dependents.pop(tie.component, None)
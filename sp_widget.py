@@ -1,16 +1,23 @@
 from __future__ import division
 
 import os
+import sys
+import warnings
 import math
 import re
 
 import numpy as np
-from astropy.modeling import Parameter, Fittable1DModel
+from astropy.modeling import Fittable1DModel
 
 import signal_slot
 import models_registry
 import sp_adjust
+import sp_compound
+import sp_eval
+import sp_fit
 import sp_model_io
+import sp_params
+import sp_ties
 
 from PyQt4.QtCore import *
 from PyQt4.QtGui import *
@@ -29,11 +36,9 @@ _model_directory = os.environ["HOME"]
 def _buildSummedCompoundModel(components):
     if len(components) < 1:
         return None
-    result = components[0]
-    if len(components) > 1:
-        for component in components[1:]:
-            result += component
-    return result
+    if len(components) == 1:
+        return components[0]
+    return sp_compound.SummedCompoundModel(components)
 
 
 # Finds the level at which a tree is being selected.
@@ -95,7 +100,7 @@ class _MyQTreeView(QTreeView):
     # when a Data object gets changed, such as when the user types in
     # a new value for a Parameter instance.
     def dataChanged(self, top, bottom):
-        self.emit(SIGNAL("dataChanged"), 0)
+        self.emit(SIGNAL("dataChanged"), top, bottom)
         super(_MyQTreeView, self).dataChanged(top, bottom)
 
     # Here is the logic to gray out buttons based on context.
@@ -239,11 +244,10 @@ class _SpectralModelsGUI(object):
     def updateModel(self, component):
         self._model.addOneElement(component)
 
-        # new components are added to existing compound model
-        if hasattr(self._model, 'compound_model'):
-            self._model.compound_model = self._model.compound_model + component
-        else:
-            self._model.compound_model = component
+        # new components are added to existing compound model. Sums
+        # are kept flat, so adding a component takes constant time.
+        compound_model = getattr(self._model, 'compound_model', None)
+        self._model.compound_model = sp_compound.add(compound_model, component)
         self.window.updateExpressionField(self._model.compound_model )
 
         self.window.emit(SIGNAL("treeChanged"), 0)
@@ -551,7 +555,7 @@ class _LibraryWindow(_BaseWindow):
 
     # Adds the selected spectral model component to the active model.
     def _addComponentToActive(self, component):
-        name = models_registry.get_component_name(component)
+        name = models_registry.registry.key_of(component)
 
         self.finalizeAddingComponent(name)
 
@@ -611,56 +615,10 @@ class SpectralComponentItem(QStandardItem):
         return self.item
 
 
-# Value item specializes the base item to make it editable.
-# or checkable. The slot connected to the tree model's
-# itemChanged signal must be able to differentiate among the
-# several possible items, using the 'type' attribute and the
-# 'isCheckable' property.
-
-class SpectralComponentValueItem(SpectralComponentItem):
-    def __init__(self, parameter, type, checkable=False, editable=True):
-        self.parameter = parameter
-        self.type = type
-        # boolean attributes display attribute
-        # value via a checkbox, not text.
-        id_str = type
-        if not checkable:
-            id_str = type + ": " + str(getattr(self.parameter, type))
-        SpectralComponentItem.__init__(self, id_str)
-        self.setEditable(editable)
-        self.setCheckable(checkable)
-        # checkbox setup.
-        if checkable and getattr(self.parameter, type):
-            self.setCheckState(Qt.Checked)
-
-
-# Tied item specializes the base item to handle the specifics
-# of a callable tie. The slot connected to the tree model's
-# itemChanged signal must be able to differentiate among the
-# several possible items, using the 'type' attribute and the
-# 'isCheckable' property. This is not necessary for now, since
-# this item type is being defined as non-editable. For now, the
-# only way for the user to modify a tie is to directly edit an
-# importable file with the model definition.
-
-class SpectralComponentTiedItem(SpectralComponentItem):
-    def __init__(self, parameter):
-        self.parameter = parameter
-        self.type = "tied"
-
-        tie = getattr(self.parameter, self.type)
-        id_str = self.type + ": " + sp_model_io.get_tie_text(tie)
-
-        SpectralComponentItem.__init__(self, id_str)
-        self.setEditable(False)  # for now!!
-        self.setCheckable(False)
-
-
 # Model classes
 
-# This class provides the base model for both the active
-# and the library windows. The base model handles the
-# tree's first level, where the component names are held.
+# This class provides the model for the library window. It
+# handles a single tree level, where the component names are held.
 
 class SpectralComponentsModel(QStandardItemModel):
     def __init__(self, name):
@@ -700,22 +658,117 @@ def _float_check(value):
         return False
 
 
-# This class adds to the base model class the ability to handle
-# two additional tree levels. These levels hold respectively
-# the parameter names of each component, and each parameter's
-# editable attributes.
+# The tree of active components is not built from QStandardItem
+# instances. Its model reads the component objects on demand, when
+# the view asks for the data in a given row, so there are no item
+# objects to build nor to keep in sync with the components.
+#
+# The tree has three levels: the components; the component name
+# followed by its parameters; and the attributes of each parameter.
+
+# Attributes of a parameter, in the order they show in the tree.
+_ATTRIBUTES = ('value', 'min', 'max', 'fixed', 'tied')
+
+
+# Nodes are the internal pointers of the model indices. A node is a
+# component (no parent), the name or a parameter of a component (the
+# component node is the parent), or an attribute of a parameter (the
+# parameter node is the parent). The children of a node are created
+# only when the view asks for them, that is, when the node is expanded.
+class _TreeNode(object):
+    __slots__ = ('parent', 'row', 'component', 'label', 'param_name', 'attribute', 'children')
+
+    def __init__(self, parent, row, component, label=None, param_name=None, attribute=None):
+        self.parent = parent
+        self.row = row
+        self.component = component
+        self.label = label
+        self.param_name = param_name
+        self.attribute = attribute
+        self.children = None
+
+    # nodes stand in for the tree items of former versions,
+    # which held the component in their 'item' attribute.
+    @property
+    def item(self):
+        return self.component
+
+    def getDataItem(self):
+        return self.component
 
-class ActiveComponentsModel(SpectralComponentsModel):
+    @property
+    def parameter(self):
+        return getattr(self.component, self.param_name)
+
+    def getChildren(self):
+        if self.children is None:
+            if self.parent is None:
+                self.children = [_TreeNode(self, 0, self.component, attribute='name')] + \
+                                [_TreeNode(self, i + 1, self.component, param_name=name)
+                                 for i, name in enumerate(self.component.param_names)]
+            elif self.param_name is not None and self.attribute is None:
+                self.children = [_TreeNode(self, i, self.component, param_name=self.param_name, attribute=a)
+                                 for i, a in enumerate(_ATTRIBUTES)]
+            else:
+                self.children = []
+        return self.children
+
+    def childCount(self):
+        if self.parent is None:
+            return len(self.component.param_names) + 1
+        elif self.param_name is not None and self.attribute is None:
+            return len(_ATTRIBUTES)
+        return 0
+
+    def text(self):
+        if self.parent is None:
+            if self.component.name:
+                return self.label + " (" + str(self.component.name) + ")"
+            return self.label
+        if self.attribute == 'name':
+            return "name: " + str(self.component.name)
+        if self.attribute is None:
+            return self.param_name + ": " + str(self.parameter.value)
+        if self.attribute == 'fixed':
+            return "fixed"
+        if self.attribute == 'tied':
+            return "tied: " + sp_model_io.get_tie_text(self.parameter.tied)
+        return self.attribute + ": " + str(getattr(self.parameter, self.attribute))
+
+
+# QVariant arguments come in as QVariant instances or as plain Python
+# objects, depending on the PyQt API version in use.
+def _variantText(value):
+    if hasattr(value, 'toString'):
+        value = value.toString()
+    return str(value)
+
+def _variantInt(value):
+    if hasattr(value, 'toInt'):
+        value = value.toInt()[0]
+    return int(value)
+
+
+class ActiveComponentsModel(QAbstractItemModel):
 
     def __init__(self, components, name):
-        SpectralComponentsModel.__init__(self, name)
+        QAbstractItemModel.__init__(self)
+        self._header = name
+
+        # one node per component, in tree order. Each node is made
+        # when its component is inserted, and holds its current row.
+        self._nodes = []
+
+        # ties among the components in the tree.
+        self.ties = sp_ties.TieGraph()
+
+        # no editing while a fit owns the parameter values.
+        self._read_only = False
 
         if components:
             self.compound_model = components
             self.addItems(self.compound_model)
 
-        self.itemChanged.connect(self._onItemChanged)
-
     # TODO use QDataWidgetMapper
     # this violation of MVC design principles is necessary
     # so our model manager class can work with the modified
@@ -724,132 +777,227 @@ class ActiveComponentsModel(SpectralComponentsModel):
     def setWindow(self, window):
         self._window = window
 
-    def addToModel(self, name, element):
-        # add component to tree root
-        if element.name:
-            item = SpectralComponentItem(name + " (" + str(element.name) + ")")
+    def addItems(self, elements):
+        if hasattr(elements, '__getitem__'):
+            for element in elements:
+                self.addOneElement(element)
         else:
-            item = SpectralComponentItem(name)
-        item.setDataItem(element)
-        parent = self.invisibleRootItem()
-        parent.appendRow(item)
+            self.addOneElement(elements)
+
+    def addOneElement(self, element):
+        name = models_registry.get_component_name(element)
+        self.addToModel(name, element)
+
+    def addToModel(self, name, element):
+        self.insertRow(len(self._nodes), [_TreeNode(None, 0, element, label=name)])
+
+    # rows are taken and inserted back when components are deleted
+    # or moved. The tie graph follows the order of the rows.
+    def takeRow(self, row):
+        if row < 0 or row >= len(self._nodes):
+            return []
+        self.beginRemoveRows(QModelIndex(), row, row)
+        node = self._nodes.pop(row)
+        self._reindex(row)
+        self.endRemoveRows()
+        self.ties.remove(node.component)
+        return [node]
+
+    def insertRow(self, row, items):
+        node = items[0]
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._nodes.insert(row, node)
+        self._reindex(row)
+        self.endInsertRows()
+        try:
+            self.ties.add(node.component, row)
+        except sp_ties.TieCycleError as e:
+            warnings.warn(str(e) + " The tie was removed.")
+
+    def item(self, row):
+        return self._nodes[row]
+
+    # Turns editing of names, parameter values, bounds, ties and fixed
+    # flags on and off. Views ask for the item flags before each edit.
+    def setReadOnly(self, read_only):
+        self._read_only = read_only
 
-        nameItem = SpectralComponentValueItem(element, "name")
-        nameItem.setDataItem(element.name)
-        # nameItem.setEditable(True)
-        item.appendRow(nameItem)
-
-        # now add parameters to component in tree.
-        for e in element.param_names:
-            par = element.__getattribute__(e)
-            if isinstance(par, Parameter):
-
-                # add parameter. Parameter name is followed
-                # by its value when displaying in tree.
-                parItem = SpectralComponentItem(par.name + ": " + str(par.value))
-                parItem.setDataItem(par)
-                item.appendRow(parItem)
-
-                # add parameter value and other attributes to parameter element.
-                valueItem = SpectralComponentValueItem(par, "value")
-                valueItem.setDataItem(par.value)
-                parItem.appendRow(valueItem)
-                minItem = SpectralComponentValueItem(par, "min")
-                minItem.setDataItem(par.min)
-                parItem.appendRow(minItem)
-                maxItem = SpectralComponentValueItem(par, "max")
-                maxItem.setDataItem(par.max)
-                parItem.appendRow(maxItem)
-                fixedItem = SpectralComponentValueItem(par, "fixed", checkable=True)
-                fixedItem.setDataItem(par.fixed)
-                parItem.appendRow(fixedItem)
-                tiedItem = SpectralComponentTiedItem(par)
-                tiedItem.setDataItem(par.tied)
-                parItem.appendRow(tiedItem)
+    # updates the row held by the nodes from a given row on,
+    # so appending a component to the tree takes constant time.
+    def _reindex(self, start=0):
+        for row in range(start, len(self._nodes)):
+            self._nodes[row].row = row
 
     @property
     def items(self):
-        result = []
-        for i in range(self.rowCount()):
-            result.append(self.item(i).item)
-        return result
-
-    def _floatItemChanged(self, item):
-        type = item.type
-        number = _float_check(item.text())
-        if number:
-            if hasattr(item, 'parameter'):
-                setattr(item.parameter, type, number)
-                item.setData(type + ": " + str(number), role=Qt.DisplayRole)
-                # parameter name is followed by its value when displaying in tree.
-                if type == 'value':
-                    item.parent().setData(item.parameter.name + ": " + str(number), role=Qt.DisplayRole)
+        return [node.component for node in self._nodes]
+
+    # Tells the views that all data changed. This is needed when
+    # components are modified by direct reference to them.
+    def refresh(self):
+        self.beginResetModel()
+        self.endResetModel()
+
+    # Tells the views that the parameter values of the components in
+    # rows first to last (inclusive) changed. A range of rows goes out
+    # as a single dataChanged signal; views repaint as a whole on a
+    # range, which takes care of any expanded parameter rows as well.
+    def parametersChanged(self, first, last=None):
+        if last is not None and last > first:
+            self.dataChanged.emit(self.index(first, 0), self.index(last, 0))
+            return
+        node = self._nodes[first]
+        index = self.createIndex(first, 0, node)
+        if node.children is None:
+            self.dataChanged.emit(index, index)
         else:
-            item.setData(type + ": " + str(getattr(item.parameter, type)), role=Qt.DisplayRole)
-
-    def _nameChanged(self, item):
-        old_name = item.item
-        new_name = str(item.text())
-        # remove actual new name from the "name:newname" in the tree display
-        index = new_name.find(":")
-        if index > -1:
-            new_name = new_name[index+2:]
-        if len(new_name) > 0:
-            setattr(item, "item", new_name)
-            if index <= -1:
-                item.setData("name: " + new_name, role=Qt.DisplayRole)
-            # function name is followed by component name when displaying on tree
-            item_parent = item.parent()
-            setattr(item_parent.item, "_name", new_name)
-            id_string = str(item_parent.text())
-            index = id_string.find("(")
-            function_name = id_string[:index-1]
-            item_parent.setData(function_name + " (" + new_name + ")", role=Qt.DisplayRole)
-
-            # name was successfully changed; now check to see if any tied parameters depend om it.
-            self._modify_tied_components(item, old_name, new_name)
+            self.dataChanged.emit(self.index(1, 0, index), self.index(node.childCount() - 1, 0, index))
 
+    # QAbstractItemModel interface.
+
+    def index(self, row, column, parent=QModelIndex()):
+        if not self.hasIndex(row, column, parent):
+            return QModelIndex()
+        if not parent.isValid():
+            node = self._nodes[row]
         else:
-            item.setData("name: " + old_name, role=Qt.DisplayRole)
-
-    def _booleanItemChecked(self, item):
-        setattr(item.parameter, item.type, (item.checkState() == Qt.Checked))
-
-    def _onItemChanged(self, item):
-        if item.isCheckable():
-            self._booleanItemChecked(item)
-        elif item.type == "name":
-            self._nameChanged(item)
-        elif item.type in ("value", "min", "max"):
-            self._floatItemChanged(item)
-
-    # scans all parameters in all components in the model, looking for
-    # tied parameters that point to the old name. Replace the old name
-    # with the new name in the tie. This assumes that we use the standard
-    # lambda form for ties.
-    def _modify_tied_components(self, reference_item, old_name, new_name):
-        for row, component in enumerate(self.items):
-            if component.tied:
-                row2 = 1
-                for key, tie in component.tied.items():
-                    row2 += 1
-                    if tie:
-                        tie_text = sp_model_io.get_tie_text(tie)
-                        if old_name in tie_text:
-
-                            # modify actual component
-                            new_tie_text = tie_text.replace(old_name, new_name)
-                            new_tie = eval(new_tie_text)
-                            component.tied[key] = new_tie
-
-                            # modify element in tree
-                            item = self.item(row)
-                            # sometimes the tree returns a None item.
-                            if item:
-                                tie_element = item.child(row2).child(4)
-                                text = tie_element.text()
-                                new_text = text.replace(old_name, new_name)
-                                tie_element.setData(new_text, role=Qt.DisplayRole)
+            node = parent.internalPointer().getChildren()[row]
+        return self.createIndex(row, column, node)
+
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        parent = index.internalPointer().parent
+        if parent is None:
+            return QModelIndex()
+        return self.createIndex(parent.row, 0, parent)
+
+    def rowCount(self, parent=QModelIndex()):
+        if not parent.isValid():
+            return len(self._nodes)
+        if parent.column() > 0:
+            return 0
+        return parent.internalPointer().childCount()
+
+    def columnCount(self, parent=QModelIndex()):
+        return 1
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole and section == 0:
+            return QVariant(self._header)
+        return QVariant()
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        result = Qt.ItemIsEnabled | Qt.ItemIsSelectable
+        if self._read_only:
+            return result
+        attribute = index.internalPointer().attribute
+        if attribute in ('name', 'value', 'min', 'max', 'tied'):
+            result |= Qt.ItemIsEditable
+        elif attribute == 'fixed':
+            result |= Qt.ItemIsUserCheckable
+        return result
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return QVariant()
+        node = index.internalPointer()
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            return QVariant(node.text())
+        if role == Qt.CheckStateRole and node.attribute == 'fixed':
+            return QVariant(Qt.Checked if node.parameter.fixed else Qt.Unchecked)
+        return QVariant()
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or self._read_only:
+            return False
+        node = index.internalPointer()
+
+        if node.attribute == 'fixed' and role == Qt.CheckStateRole:
+            setattr(node.parameter, 'fixed', _variantInt(value) == Qt.Checked)
+            self.dataChanged.emit(index, index)
+            return True
+
+        if role != Qt.EditRole:
+            return False
+
+        # ties have colons of their own, so only
+        # their "tied: " prefix is removed.
+        if node.attribute == 'tied':
+            text = _variantText(value).strip()
+            if text.startswith('tied:'):
+                text = text[len('tied:'):]
+            return self._setTie(index, text)
+
+        # edited text may or may not keep the "attribute: " prefix.
+        text = _variantText(value)
+        colon = text.find(":")
+        if colon > -1:
+            text = text[colon+1:]
+        text = text.strip()
+
+        if node.attribute == 'name':
+            if len(text) == 0:
+                return False
+            old_name = node.component.name
+            setattr(node.component, "_name", text)
+            component_index = self.parent(index)
+            self.dataChanged.emit(component_index, component_index)
+            self.dataChanged.emit(index, index)
+
+            # name was successfully changed; now check to see if any tied parameters depend on it.
+            self._modify_tied_components(node.component, old_name, text)
+            return True
+
+        if node.attribute in ('value', 'min', 'max'):
+            number = _float_check(text)
+            if number is False:
+                return False
+            setattr(node.parameter, node.attribute, number)
+            # parameter name is followed by its value when displaying in tree.
+            parameter_index = self.parent(index)
+            self.dataChanged.emit(index, index)
+            self.dataChanged.emit(parameter_index, parameter_index)
+            return True
+
+        return False
+
+    # ties are set through the tie graph, which rejects ties
+    # that would close a cycle.
+    def _setTie(self, index, text):
+        node = index.internalPointer()
+        try:
+            tie = sp_model_io.parse_tie(text)
+            if tie:
+                self.ties.tie(node.component, node.param_name, tie)
+            else:
+                self.ties.untie(node.component, node.param_name)
+        except sp_ties.TieCycleError as e:
+            warnings.warn(str(e) + " The tie was not set.")
+            return False
+        except ValueError:
+            return False
+        self.dataChanged.emit(index, index)
+        return True
+
+    # points the ties that refer to the old name to the new name.
+    # Only the parameters that depend on the renamed component are
+    # visited, via the tie graph.
+    def _modify_tied_components(self, component, old_name, new_name):
+        changed = {}
+        for dependent, param_name, tie in self.ties.rename(component, old_name, new_name):
+            changed.setdefault(id(dependent), []).append(param_name)
+        if not changed:
+            return
+        for row, node in enumerate(self._nodes):
+            for param_name in changed.get(id(node.component), []):
+                component_index = self.index(row, 0)
+                parameter_index = self.index(list(node.component.param_names).index(param_name) + 1,
+                                             0, component_index)
+                tie_index = self.index(_ATTRIBUTES.index('tied'), 0, parameter_index)
+                self.dataChanged.emit(tie_index, tie_index)
 
 
 class SpectralModelManager(QObject):
@@ -881,8 +1029,14 @@ class SpectralModelManager(QObject):
       components are accessed from a separate tree on a split pane
       window.
 
+    discover: boolean, optional
+      If True, the library of available components is complemented
+      with the Fittable1DModel subclasses found in astropy.modeling.models,
+      by calling models_registry.discover. Default is False, meaning
+      that the library holds the components in the models registry only.
+
     """
-    def __init__(self, model=None, drop_down=True):
+    def __init__(self, model=None, drop_down=True, discover=False):
         super(SpectralModelManager, self).__init__()
 
         # _init_compound_model is used just to hold a reference
@@ -896,17 +1050,68 @@ class SpectralModelManager(QObject):
             self._init_compound_model = _buildSummedCompoundModel(model)
         elif type(model) == type(""):
             global _model_directory
-            self._init_compound_model, _model_directory = sp_model_io.buildModelFromFile(model)
+            compound_model, _model_directory = sp_model_io.buildModelFromFile(model)
+            self._init_compound_model = sp_compound.flatten(compound_model)
         else:
             self._init_compound_model = model
 
         self._drop_down = drop_down
 
-        self.x = None
-        self.y = None
+        # discovered components are added to the registry before the
+        # library tree is built from it.
+        if discover:
+            models_registry.discover()
+
+        # data arrays as given to setArrays, and their copies in the
+        # precision set with setPrecision, made when first needed.
+        self._arrays = {'x': None, 'y': None}
+        self._cast_arrays = {}
+
+        # callable that evaluates the active model. It is built on
+        # demand by spectrum(), and discarded whenever the tree of
+        # active components signals a change.
+        self._compiled_spectrum = None
+
+        # fluxes of individual components, if enabled with setFluxCache.
+        # The cache outlives the compiled spectrum, so an edit in a single
+        # parameter only costs the evaluation of the component that was
+        # edited.
+        self._flux_cache = None
+
+        # half-width, in units of the component width, of the window
+        # where line profile components get evaluated. None means that
+        # all components are evaluated over the full wavelength range.
+        self._support_window = None
+
+        # precision of the spectral coordinates and fluxes handled by
+        # spectrum() and spectrum_many(), and of the data arrays.
+        self._dtype = np.float64
+
+        # contiguous arrays with the parameters of all active
+        # components. Built on demand by the parameterStore accessor,
+        # and discarded whenever components are added, removed or moved.
+        self._parameter_store = None
+
+        # worker thread running a background fit, if any, the
+        # components it fits, and copies of them as they were when
+        # the fit started.
+        self._fit_thread = None
+        self._fit_components = None
+        self._fit_start = None
+
+        # changes that were not notified yet. When coalescing is on,
+        # they accumulate until the timer fires. The components in the
+        # active tree, as they were at the last notification, are kept
+        # so added, removed and moved components can be told apart.
+        self._coalesce_interval = None
+        self._change_timer = None
+        self._pending = ChangeSummary()
+        self._notified_components = []
 
         self.changed = SignalModelChanged()
+        self.changeSummary = SignalChangeSummary()
         self.selected = SignalComponentSelected()
+        self.fitFinished = SignalFitFinished()
 
     def setArrays(self, x, y):
         ''' Defines the region in spectral coordinate vs. flux
@@ -932,12 +1137,35 @@ class SpectralModelManager(QObject):
           Array with flux values
 
         '''
-        self.x = x
-        self.y = y
+        self._arrays = {'x': x, 'y': y}
+        self._cast_arrays = {}
 
         if  hasattr(self, '_library_gui'):
             self._library_gui.setArrays(self.x, self.y)
 
+    # The arrays passed to setArrays are kept as they were given. In
+    # single precision, x and y are copies of them, made when first
+    # needed, so going back to double precision loses nothing.
+    def _array(self, name):
+        array = self._arrays[name]
+        if array is None or self._dtype == np.float64:
+            return array
+        if name not in self._cast_arrays:
+            self._cast_arrays[name] = np.asarray(array, dtype=self._dtype)
+        return self._cast_arrays[name]
+
+    @property
+    def x(self):
+        ''' The spectral coordinates set with setArrays, in
+        the precision set with setPrecision, or None. '''
+        return self._array('x')
+
+    @property
+    def y(self):
+        ''' The flux values set with setArrays, in the
+        precision set with setPrecision, or None. '''
+        return self._array('y')
+
     def buildMainPanel(self, model=None):
         """ Builds the main panel with the active and the library
         trees of spectral components.
@@ -965,7 +1193,8 @@ class SpectralModelManager(QObject):
             self._init_compound_model = _buildSummedCompoundModel(model)
         elif type(model) == type(""):
             global _model_directory
-            self._init_compound_model, _model_directory = sp_model_io.buildModelFromFile(model)
+            compound_model, _model_directory = sp_model_io.buildModelFromFile(model)
+            self._init_compound_model = sp_compound.flatten(compound_model)
         else:
             self._init_compound_model = model
 
@@ -994,15 +1223,92 @@ class SpectralModelManager(QObject):
             main_widget.setStretchFactor(0, 1)
             main_widget.setStretchFactor(1, 0)
 
+        # Any change in the tree makes the compiled spectrum obsolete. This
+        # must be connected first, so outside listeners that respond to
+        # the broadcast signals get to see a spectrum that is up to date.
+        self._invalidateSpectrum()
+        self.connect(self.models_gui.window, SIGNAL("treeChanged"), self._invalidateSpectrum)
+        self.connect(self.models_gui.window.treeView, SIGNAL("dataChanged"), self._invalidateSpectrum)
+        self._invalidateParameterStore()
+        self.connect(self.models_gui.window, SIGNAL("treeChanged"), self._invalidateParameterStore)
+
+        # A fit running in the background works on the components as
+        # they were when it started. It is cancelled when they change.
+        self.connect(self.models_gui.window, SIGNAL("treeChanged"), self._cancelFit)
+
         # Data change and click events must be propagated to the outside world.
-        self.connect(self.models_gui.window, SIGNAL("treeChanged"), self._broadcastChangedSignal)
-        self.connect(self.models_gui.window.treeView, SIGNAL("dataChanged"), self._broadcastChangedSignal)
+        self._notified_components = self.components
+        self.connect(self.models_gui.window, SIGNAL("treeChanged"), self._treeChanged)
+        self.connect(self.models_gui.window.treeView, SIGNAL("dataChanged"), self._dataChanged)
         self.models_gui.window.treeView.clicked.connect(self._broadcastSelectedSignal)
 
         return main_widget
 
+    def _invalidateSpectrum(self):
+        self._compiled_spectrum = None
+
+    def _invalidateParameterStore(self):
+        self._parameter_store = None
+
+    def setCoalescing(self, interval=0):
+        """ Merges bursts of changes in the model into one notification.
+
+        By default, the 'changed' and 'changeSummary' signals are emitted
+        once for every change, as soon as it happens. With coalescing on,
+        the changes that happen within a time interval are collected,
+        and notified at the end of the interval with a single emission
+        of each signal. The ChangeSummary instance passed with the
+        'changeSummary' signal tells what changed in the interval.
+
+        Parameters
+        ----------
+        interval: int or None, optional
+          interval, in milliseconds, starting with the first change
+          after the last notification. Zero (the default) merges the
+          changes made within a single turn of the Qt event loop. None
+          turns coalescing off, and notifies any pending changes.
+
+        """
+        self._coalesce_interval = interval
+        if interval is None:
+            if self._change_timer is not None:
+                self._change_timer.stop()
+            if self._pending.events > 0:
+                self._broadcastChangedSignal()
+        elif self._change_timer is None:
+            self._change_timer = QTimer(self)
+            self._change_timer.setSingleShot(True)
+            self.connect(self._change_timer, SIGNAL("timeout()"), self._broadcastChangedSignal)
+
+    def _treeChanged(self):
+        self._pending.events += 1
+        self._notifyChange()
+
+    def _dataChanged(self, top, bottom):
+        parent = top.parent()
+        for row in range(top.row(), bottom.row() + 1):
+            self._pending.record(self.models_gui.model.index(row, 0, parent).internalPointer())
+        self._pending.events += 1
+        self._notifyChange()
+
+    def _notifyChange(self):
+        if self._coalesce_interval is None:
+            self._broadcastChangedSignal()
+        elif not self._change_timer.isActive():
+            self._change_timer.start(self._coalesce_interval)
+
     def _broadcastChangedSignal(self):
+        summary = self._pending
+        self._pending = ChangeSummary()
+
+        # structural changes are found by comparing the components
+        # in the tree with the ones there were at the last notification.
+        components = self.components
+        summary.compare(self._notified_components, components)
+        self._notified_components = components
+
         self.changed()
+        self.changeSummary(summary)
 
     def _broadcastSelectedSignal(self):
         self.selected()
@@ -1029,7 +1335,27 @@ class SpectralModelManager(QObject):
         """
         return self.models_gui.model.items
 
-    def spectrum(self, wave):
+    @property
+    def parameterStore(self):
+        """ Accessor to the parameters of all active spectral components.
+
+        The store holds the parameter values, bounds and fixed flags
+        of all active components in contiguous arrays, in tree order.
+        The components are views of the store, so the arrays can be
+        read and written directly, and a snapshot of the whole model
+        is a single array copy. The store is rebuilt when components
+        are added, removed or moved.
+
+        Returns
+        -------
+          instance of sp_params.ParameterStore
+
+        """
+        if self._parameter_store is None:
+            self._parameter_store = sp_params.ParameterStore(self.components)
+        return self._parameter_store
+
+    def spectrum(self, wave, fast=False):
         ''' Computes the compound model flux values,
         given an array of spectral coordinate values.
 
@@ -1037,26 +1363,149 @@ class SpectralModelManager(QObject):
         ----------
         wave: numpy array
           Array with spectral coordinate values.
+        fast: boolean, optional
+          If True, components are evaluated with plain NumPy kernels
+          (see module sp_kernels) instead of being called as astropy
+          models. This skips astropy's input validation, and the
+          results agree with astropy's to rounding error.
 
         Returns
         -------
-        A numpy array with flux values. If no components exist in
-        the model, a zero-valued array is returned instead.
+        A numpy array with flux values, in the precision set with
+        setPrecision. If no components exist in the model, a
+        zero-valued array is returned instead.
 
         '''
-        # The compound_model can be either a list of components
-        # or a compound model instance. In the case of a
-        # list, we just add the components sequentially.
-        if len(self.components) > 0:
-            if not type(self.models_gui.model.compound_model) == type([]):
-                compound_model = self.models_gui.model.compound_model
-            else:
-                compound_model = _buildSummedCompoundModel(self.components)
+        # The compiled spectrum is re-used until the tree signals a
+        # structural or data change, so repeated calls on an unchanged
+        # model do not have to rebuild the compound model.
+        if self._compiled_spectrum is None:
+            compound_model = getattr(self.models_gui.model, 'compound_model', None)
+            if self._flux_cache is not None:
+                self._flux_cache.retain(self.components)
+            self._compiled_spectrum = sp_eval.CompiledSpectrum(self.components, compound_model,
+                                                               cache=self._flux_cache,
+                                                               nwidths=self._support_window,
+                                                               dtype=self._dtype)
+
+        return self._compiled_spectrum(wave, fast)
+
+    def setSupportWindow(self, nwidths=None):
+        ''' Restricts the evaluation of line profile components
+        to a window around their center.
+
+        Line profiles (Gaussian1D, Lorentz1D, MexicanHat1D, Box1D and
+        Trapezoid1D) are effectively zero away from their center. With
+        a support window set, each one of them is evaluated only where
+        the spectral coordinates fall within N widths of its center;
+        the width being the stddev, fwhm or sigma parameter. Box1D and
+        Trapezoid1D are truncated exactly at their edges. The relative
+        truncation error is about exp(-N**2/2) for Gaussian1D and
+        1/(1+4*N**2) for Lorentz1D; module sp_eval has the full table.
+
+        Arrays of spectral coordinates are searched for the window
+        limits with a binary search. Arrays made of a few pieces sorted
+        in increasing order are searched piece by piece. Any other
+        array, such as one sorted in decreasing order, is sorted first.
 
-            return compound_model(wave)
+        Parameters
+        ----------
+        nwidths: float, optional
+          Half-width of the window, in units of the component's width.
+          If not provided, all components are evaluated over the full
+          range of spectral coordinates.
 
-        else:
-            return np.zeros(len(wave))
+        '''
+        self._support_window = nwidths
+        self._invalidateSpectrum()
+
+    def setFluxCache(self, maxbytes=None):
+        ''' Keeps the fluxes of individual components in a cache.
+
+        With the cache on, an edit in a single parameter only costs
+        the evaluation of the component that owns it. Fluxes are
+        evicted, least recently used first, when they take more than
+        the given size. Calls to spectrum() with more components than
+        fit in the cache bypass it. Entries of components removed from
+        the model are dropped.
+
+        Parameters
+        ----------
+        maxbytes: int, optional
+          Maximum size, in bytes, of the cached flux values. If not
+          provided, the cache is turned off.
+
+        '''
+        self._flux_cache = sp_eval.FluxCache(maxbytes) if maxbytes is not None else None
+        self._invalidateSpectrum()
+
+    def setPrecision(self, dtype=np.float64):
+        ''' Sets the floating point precision of the spectra computed
+        by the manager.
+
+        In single precision (numpy.float32), spectral coordinates are
+        rounded to float32 before the components are evaluated on them,
+        the fluxes of individual components are cached in float32, and
+        spectrum() and spectrum_many() return float32 arrays. This halves
+        the memory taken by large spectra and by the cache. The fluxes
+        are still added up in float64, and rounded to float32 once, at
+        the end, so the sum does not lose accuracy with the number of
+        components. The x and y attributes give the data arrays passed
+        to setArrays in the same precision. The arrays as given are kept
+        too, so going back to double precision restores them exactly.
+        Parameter values are always float64.
+
+        Results agree with double precision to about 6e-8, relative to
+        the sum of the absolute values of the component fluxes, except
+        where rounding the spectral coordinates matters: narrow line
+        profiles far from zero (2*eps*|x|/width relative to the peak,
+        6e-4 for a width of 1 at x = 5000), the edges of Box1D and
+        Trapezoid1D, and Sine1D at large phases. Module sp_eval has the
+        table of tolerances for every component type.
+
+        Parameters
+        ----------
+        dtype: numpy dtype, optional
+          Either numpy.float32 or numpy.float64 (the default).
+
+        '''
+        dtype = np.dtype(dtype)
+        if dtype not in sp_eval._precisions:
+            raise ValueError("Precision must be float32 or float64, not %s." % dtype)
+        self._dtype = dtype.type
+        self._invalidateSpectrum()
+        if self._flux_cache is not None:
+            self._flux_cache.clear()
+        self.setArrays(self._arrays['x'], self._arrays['y'])
+
+    def spectrum_many(self, waves, offsets=None, fast=False):
+        ''' Computes the compound model flux values on many
+        arrays of spectral coordinate values at once.
+
+        The arrays are packed together and evaluated in a single
+        pass, so the per-call overhead of spectrum() is paid just
+        once. The results are views into one single output buffer.
+
+        Parameters
+        ----------
+        waves: list or numpy array
+          Either a list with arrays of spectral coordinate values,
+          or a single array with all of them concatenated.
+        offsets: list or numpy array, optional
+          When 'waves' is a concatenated array, the index at which
+          each array of spectral coordinate values starts in it.
+        fast: boolean, optional
+          If True, components are evaluated with plain NumPy kernels,
+          as in spectrum().
+
+        Returns
+        -------
+        A list with numpy arrays of flux values, one for each
+        array of spectral coordinate values.
+
+        '''
+        packed, bounds = sp_eval.pack_grids(waves, offsets, self._dtype)
+        return sp_eval.unpack_grids(self.spectrum(packed, fast), bounds)
 
     def addComponent(self, component):
         ''' Adds a new spectral component to the manager.
@@ -1108,22 +1557,246 @@ class SpectralModelManager(QObject):
           to be added to the manager.
 
         '''
-        for i, c in enumerate(self.components):
-            nc = new_components[i]
-            c.parameters = nc.parameters
+        # all parameter values are copied at once into the store.
+        store = self.parameterStore
+        if len(store.components) == 0:
+            return
+        store.values[:] = np.concatenate([np.ravel(nc.parameters)
+                                          for nc in new_components[:len(store.components)]])
+
+        # tell the tree model so the fit results show immediately on
+        # the display. The tree view would turn the model signal into
+        # a 'changed' signal of its own; that is held back, so a single
+        # 'changed' signal goes out for the whole update.
+        view = self.models_gui.window.treeView
+        blocked = view.blockSignals(True)
+        try:
+            self.models_gui.model.parametersChanged(0, len(store.components) - 1)
+        finally:
+            view.blockSignals(blocked)
+
+        self._invalidateSpectrum()
+        for component in store.components:
+            self._pending.recordComponent(component)
+        self._pending.events += 1
+        self._notifyChange()
+
+    def startFit(self, x, y, dy=None, interval=0.25):
+        ''' Fits the active model to a spectrum, in a background thread.
+
+        The GUI stays responsive while the fit runs. The parameter
+        values reached by the fitter are sent back to the GUI thread
+        at a throttled rate, and passed to modifyModel, so the tree
+        (and any listener to the 'changed' signal) follows the fit as
+        it progresses. The final parameter values are delivered the
+        same way, after which the 'fitFinished' signal is emitted with
+        the sp_fit.FitResult instance, or None if the fit was cancelled
+        or failed. A cancelled or failed fit leaves the components with
+        the parameter values they had when the fit started.
+
+        The tree is read-only while the fit runs, so edits made there
+        can't be overwritten by the fit, nor by the values restored
+        when it is cancelled.
+
+        Adding, removing or moving components while the fit runs
+        cancels the fit. Parameter values are always written back to
+        the components the fit started with, never by position.
+
+        Parameters
+        ----------
+        x: numpy array
+          Array with spectral coordinates
+        y: numpy array
+          Array with flux values
+        dy: numpy array, optional
+          Array with flux errors
+        interval: float, optional
+          Minimum time, in seconds, between updates of the parameter
+          values while the fit progresses.
+
+        Returns
+        -------
+        instance of sp_fit.FitProgress, the handle to cancel the fit.
+
+        '''
+        if self._fit_thread is not None:
+            raise RuntimeError("A fit is already running.")
+
+        self._fit_components = list(self.components)
+        self._fit_start = [c.copy() for c in self._fit_components]
+        components = [c.copy() for c in self._fit_components]
+        self._fit_thread = _FitThread(components, x, y, dy, interval)
+        self.connect(self._fit_thread, SIGNAL("fitProgress"), self._fitProgress)
+        self.connect(self._fit_thread, SIGNAL("finished()"), self._fitFinished)
+        self.models_gui.model.setReadOnly(True)
+        self._fit_thread.start()
+
+        return self._fit_thread.progress
+
+    def _cancelFit(self):
+        if self._fit_thread is not None:
+            self._fit_thread.progress.cancel()
+
+    # Pairs the components in the model with the ones coming from a fit,
+    # by identity with the components the fit started with. Components
+    # that were not part of the fit are paired with themselves.
+    def _fittedComponents(self, fitted):
+        pairs = dict((id(c), f) for c, f in zip(self._fit_components, fitted))
+        return [pairs.get(id(c), c) for c in self.components]
+
+    def _fitProgress(self, components):
+        # updates may still be queued after a fit was cancelled.
+        if self._fit_thread is not None and not self._fit_thread.progress.cancelled:
+            self.modifyModel(self._fittedComponents(components))
+
+    def _fitFinished(self):
+        thread = self._fit_thread
+        self._fit_thread = None
+
+        # a fit can finish before it gets to see the cancellation
+        # caused by a change in the model, so results are dropped
+        # whenever the fit was cancelled.
+        if thread.result is not None and not thread.progress.cancelled:
+            self.modifyModel(self._fittedComponents(thread.result.components))
+        else:
+            thread.result = None
+            self.modifyModel(self._fittedComponents(self._fit_start))
+        self._fit_components = self._fit_start = None
+        self.models_gui.model.setReadOnly(False)
+
+        self.fitFinished(thread.result)
 
-            # modify the tree model so the fit results
-            # show immediately on the display.
-            for j, value in enumerate(c.parameters):
-                item = self.models_gui.model.item(i).child(j).child(0)
-                item.setData("value: " + str(value), role=Qt.DisplayRole)
+        if thread.exc_info is not None:
+            sys.excepthook(*thread.exc_info)
 
 
+class ChangeSummary(object):
+    """ Summary of the changes in the active model between two
+    notifications of the 'changed' signal.
+
+    Attributes
+    ----------
+    added: list
+      components added to the model.
+    removed: list
+      components removed from the model.
+    moved: bool
+      True if components changed places in the model.
+    modified: list
+      components already in the model whose name or
+      parameters changed, in the order they changed.
+    renamed: list
+      components whose name changed.
+    parameters: list
+      (component, parameter name) pairs with the parameters whose
+      value, bounds, fixed flag or tie changed.
+    events: int
+      number of changes merged in this summary.
+
+    """
+    def __init__(self):
+        self.added = []
+        self.removed = []
+        self.moved = False
+        self.modified = []
+        self.renamed = []
+        self.parameters = []
+        self.events = 0
+        self._seen = set()
+
+    # Records a change reported by the tree model, as the tree
+    # node that changed: a component, its name, one of its
+    # parameters, or an attribute of one of its parameters.
+    def record(self, node):
+        if node is None:
+            return
+        if node.parent is None:
+            self.recordComponent(node.component)
+        elif node.attribute == 'name':
+            self._add(self.renamed, 'renamed', node.component)
+            self._add(self.modified, 'modified', node.component)
+        else:
+            self.recordParameter(node.component, node.param_name)
+
+    def recordComponent(self, component):
+        for param_name in component.param_names:
+            self.recordParameter(component, param_name)
+
+    def recordParameter(self, component, param_name):
+        self._add(self.modified, 'modified', component)
+        key = ('parameters', id(component), param_name)
+        if key not in self._seen:
+            self._seen.add(key)
+            self.parameters.append((component, param_name))
+
+    def _add(self, changes, kind, component):
+        key = (kind, id(component))
+        if key not in self._seen:
+            self._seen.add(key)
+            changes.append(component)
+
+    # Finds the components that were added, removed or moved
+    # by comparing the component lists before and after.
+    def compare(self, before, after):
+        ids_before = set(id(c) for c in before)
+        ids_after = set(id(c) for c in after)
+        self.added = [c for c in after if id(c) not in ids_before]
+        self.removed = [c for c in before if id(c) not in ids_after]
+        kept_before = [id(c) for c in before if id(c) in ids_after]
+        kept_after = [id(c) for c in after if id(c) in ids_before]
+        self.moved = kept_before != kept_after
+
+        # changes in components that are no longer in the
+        # model are of no interest to listeners.
+        self.modified = [c for c in self.modified if id(c) in ids_after]
+        self.renamed = [c for c in self.renamed if id(c) in ids_after]
+        self.parameters = [p for p in self.parameters if id(p[0]) in ids_after]
+
+    def __nonzero__(self):
+        return bool(self.added or self.removed or self.moved or self.modified)
+
+    def __repr__(self):
+        return "ChangeSummary(added=%d, removed=%d, moved=%s, modified=%d, parameters=%d, events=%d)" % \
+               (len(self.added), len(self.removed), self.moved,
+                len(self.modified), len(self.parameters), self.events)
+
+
+# Runs a fit in a worker thread. The parameter values reached while the
+# fit progresses are sent to the GUI thread with a queued "fitProgress"
+# signal; the sp_fit.FitProgress instance takes care of the throttling.
+class _FitThread(QThread):
+    def __init__(self, components, x, y, dy, interval):
+        super(_FitThread, self).__init__()
+        self.components = components
+        self.x = x
+        self.y = y
+        self.dy = dy
+        self.progress = sp_fit.FitProgress(self._report, interval)
+        self.result = None
+        self.exc_info = None
+
+    def _report(self, components):
+        self.emit(SIGNAL("fitProgress"), components)
+
+    def run(self):
+        try:
+            self.result = sp_fit.fit(self.components, self.x, self.y, self.dy,
+                                     progress=self.progress)
+        except sp_fit.FitCancelled:
+            pass
+        except Exception:
+            self.exc_info = sys.exc_info()
 
 
 class SignalModelChanged(signal_slot.Signal):
     ''' Signals that a change in the model took place. '''
 
+class SignalChangeSummary(signal_slot.Signal):
+    ''' Signals a change in the model, with a ChangeSummary. '''
+
 class SignalComponentSelected(signal_slot.Signal):
     ''' Signals that a component has been selected. '''
 
+class SignalFitFinished(signal_slot.Signal):
+    ''' Signals that a background fit has finished. '''
+
@@ -0,0 +1,93 @@
+import json
+
+import astropy
+import pytest
+from astropy.modeling import models
+
+import models_registry
+
+
+# registry with counting factories, to tell which prototypes get built.
+def _registry(built):
+    def factory(name):
+        def build():
+            built.append(name)
+            return getattr(models, name)()
+        return build
+
+    registry = models_registry.LazyRegistry()
+    for name in ('Gaussian1D', 'Lorentz1D', 'Const1D'):
+        registry.register(name, factory(name))
+    registry.register('Line', factory('Linear1D'), class_name='Linear1D')
+    return registry
+
+
+def test_lazy():
+    built = []
+    registry = _registry(built)
+    assert len(registry) == 4
+    assert 'Lorentz1D' in registry
+    assert built == []
+
+    prototype = registry['Lorentz1D']
+    assert registry['Lorentz1D'] is prototype
+    assert built == ['Lorentz1D']
+
+
+def test_key_of():
+    built = []
+    registry = _registry(built)
+
+    # only the prototype of the component class is built.
+    assert registry.key_of(models.Const1D(3.)) == 'Const1D'
+    assert built == ['Const1D']
+    assert registry.key_of(models.Linear1D(1., 2.)) == 'Line'
+    assert built == ['Const1D', 'Linear1D']
+    assert registry.key_of(models.Sine1D()) is None
+    assert built == ['Const1D', 'Linear1D']
+
+    # a class with the same name, from another module.
+    class Gaussian1D(models.Gaussian1D):
+        pass
+    assert registry.key_of(Gaussian1D()) is None
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = models_registry.LazyRegistry()
+    registry.register('Gaussian1D', lambda: models.Gaussian1D())
+    monkeypatch.setattr(models_registry, 'registry', registry)
+    return registry
+
+
+def test_discover(registry, tmpdir, monkeypatch):
+    fname = str(tmpdir.join('modelgui', 'catalog.json'))
+    added = models_registry.discover(fname)
+    assert 'Lorentz1D' in added
+    assert 'Gaussian1D' not in added
+    assert 'Gaussian1D' in registry
+    assert isinstance(registry['Lorentz1D'], models.Lorentz1D)
+
+    with open(fname) as f:
+        cached = json.load(f)
+    assert cached['astropy'] == astropy.__version__
+    assert ['Lorentz1D', 'astropy.modeling.functional_models'] in cached['components']
+
+    # the second time around, the catalog comes from the file.
+    def introspect():
+        raise AssertionError("introspection ran with a valid cache")
+    monkeypatch.setattr(models_registry, '_introspect', introspect)
+    monkeypatch.setattr(models_registry, 'registry', models_registry.LazyRegistry())
+    assert sorted(models_registry.discover(fname)) == sorted(added + ['Gaussian1D'])
+
+
+def test_discover_stale_cache(registry, tmpdir, monkeypatch):
+    fname = str(tmpdir.join('catalog.json'))
+    with open(fname, 'w') as f:
+        json.dump({'astropy': '0.0', 'components': [['Lorentz1D', 'nowhere']]}, f)
+    monkeypatch.setattr(models_registry, '_introspect',
+                        lambda: [('Lorentz1D', 'astropy.modeling.functional_models')])
+    assert models_registry.discover(fname) == ['Lorentz1D']
+    assert isinstance(registry['Lorentz1D'], models.Lorentz1D)
+    with open(fname) as f:
+        assert json.load(f)['astropy'] == astropy.__version__
@@ -0,0 +1,50 @@
+import gc
+import logging
+
+import pytest
+
+import pyqt_thread_helper
+
+
+def _fail():
+    raise ValueError("failed")
+
+
+def _interrupt():
+    raise KeyboardInterrupt()
+
+
+def test_exception_kept():
+    future = pyqt_thread_helper.CommandFuture()
+    future._run(_fail, ())
+    assert future.done()
+    assert isinstance(future.exception(), ValueError)
+    with pytest.raises(ValueError):
+        future.result()
+
+
+def test_base_exception_wakes_waiters():
+    future = pyqt_thread_helper.CommandFuture()
+    with pytest.raises(KeyboardInterrupt):
+        future._run(_interrupt, ())
+    assert future.done()
+    assert isinstance(future.exception(timeout=0.), KeyboardInterrupt)
+
+
+def test_unretrieved_exception_logged(caplog):
+    future = pyqt_thread_helper.CommandFuture()
+    future._run(_fail, ())
+    with caplog.at_level(logging.ERROR, logger='pyqt_thread_helper'):
+        del future
+        gc.collect()
+    assert 'ValueError: failed' in caplog.text
+
+
+def test_retrieved_exception_not_logged(caplog):
+    future = pyqt_thread_helper.CommandFuture()
+    future._run(_fail, ())
+    future.exception()
+    with caplog.at_level(logging.ERROR, logger='pyqt_thread_helper'):
+        del future
+        gc.collect()
+    assert caplog.text == ''
@@ -0,0 +1,90 @@
+import gc
+import threading
+
+import signal_slot
+
+
+class _Listener(object):
+    def __init__(self, calls, name):
+        self.calls = calls
+        self.name = name
+
+    def handler(self, value):
+        self.calls.append((self.name, value))
+
+
+def test_emit():
+    calls = []
+    signal = signal_slot.Signal()
+    listener = _Listener(calls, 'method')
+    function = lambda value: calls.append(('function', value))
+    signal.connect(listener.handler)
+    signal.connect(function)
+    signal.connect(listener.handler)
+
+    signal(1)
+    assert sorted(calls) == [('function', 1), ('method', 1)]
+
+    signal.disconnect(function)
+    signal(2)
+    assert sorted(calls[2:]) == [('method', 2)]
+
+
+def test_disconnect_during_emit():
+    calls = []
+    signal = signal_slot.Signal()
+    listeners = [_Listener(calls, i) for i in range(5)]
+    for listener in listeners:
+        signal.connect(listener.handler)
+
+    def once(value):
+        calls.append(('once', value))
+        signal.disconnect(once)
+    signal.connect(once)
+
+    # every slot is called once, whatever its place
+    # relative to the one that disconnects.
+    signal(1)
+    assert sorted(calls) == sorted([(i, 1) for i in range(5)] + [('once', 1)])
+
+    del calls[:]
+    signal(2)
+    assert sorted(calls) == [(i, 2) for i in range(5)]
+
+
+def test_collected_slot_dropped():
+    calls = []
+    signal = signal_slot.Signal()
+    kept = _Listener(calls, 'kept')
+    dropped = _Listener(calls, 'dropped')
+    signal.connect(kept.handler)
+    signal.connect(dropped.handler)
+    assert len(signal._snapshot) == 2
+
+    del dropped
+    gc.collect()
+    assert len(signal._slots) == 1
+    assert len(signal._snapshot) == 1
+    signal(1)
+    assert calls == [('kept', 1)]
+
+
+def test_queued_delivery():
+    queue = signal_slot.WorkerQueue()
+    signal = signal_slot.Signal(queue=queue)
+    threads = []
+    calls = []
+    def slot(value):
+        threads.append(threading.current_thread().name)
+        calls.append(value)
+    signal.connect(slot)
+
+    for i in range(10):
+        signal(i)
+    # slots connected after an emission don't get it.
+    late = lambda value: calls.append(-1)
+    signal.connect(late)
+    queue.join()
+
+    assert calls == list(range(10))
+    assert set(threads) == set(['signal_worker'])
@@ -0,0 +1,104 @@
+import numpy as np
+from astropy.modeling import Model, fitting, models
+
+import sp_compound
+import sp_model_io
+import sp_ties
+
+
+def _components(n=5):
+    return [models.Gaussian1D(1. + i, 2. + i, 0.3, name='g%d' % i) for i in range(n)]
+
+
+def test_terms():
+    components = _components()
+    model = sp_compound.SummedCompoundModel(components[:3])
+    model.append(sp_compound.SummedCompoundModel(components[3:]))
+
+    # components are held as they are, in a flat list.
+    assert list(model) == components
+    assert all(a is b for a, b in zip(model, components))
+    assert model[1] is components[1]
+    assert model['g3'] is components[3]
+    assert model._format_expression() == '[0] + [1] + [2] + [3] + [4]'
+    assert model.param_names[:4] == ('amplitude_0', 'mean_0', 'stddev_0', 'amplitude_1')
+
+    # parameters are read from, and written to, the components.
+    model.mean_2 = 7.
+    model.fixed['stddev_4'] = True
+    assert components[2].mean.value == 7.
+    assert components[4].fixed['stddev']
+    model.parameters = np.arange(15.)
+    assert np.array_equal(components[1].parameters, [3., 4., 5.])
+
+    # renamed components are found by their new name.
+    components[0]._name = 'line'
+    assert model['line'] is components[0]
+
+
+def test_add():
+    components = _components(3)
+    assert sp_compound.add(None, components[0]) is components[0]
+
+    model = sp_compound.add(components[:2], components[2])
+    assert isinstance(model, sp_compound.SummedCompoundModel)
+    assert list(model) == components
+
+    extra = models.Const1D(0.5)
+    assert sp_compound.add(model, extra) is model
+    assert list(model) == components + [extra]
+
+    # astropy sums become flat, other compound models don't.
+    model = sp_compound.add(components[0] + components[1], extra)
+    assert isinstance(model, sp_compound.SummedCompoundModel)
+    assert [c.name for c in model] == ['g0', 'g1', None]
+    model = sp_compound.add(components[0] * extra, components[1])
+    assert not isinstance(model, sp_compound.SummedCompoundModel)
+    assert model._format_expression() == '[0] * [1] + [2]'
+
+
+def test_to_compound():
+    components = _components(7)
+    components[3].tied['amplitude'] = sp_ties.Tie(0.5, 'g1', 'amplitude')
+    components[5].fixed['mean'] = True
+    model = sp_compound.SummedCompoundModel(components)
+    compound = model.to_compound()
+
+    assert isinstance(compound, Model)
+    assert compound.param_names == model.param_names
+    assert np.array_equal(compound.parameters, model.parameters)
+    assert [c.name for c in compound] == [c.name for c in model]
+    assert compound.fixed['mean_5']
+    assert compound.tied['amplitude_3'] == components[3].tied['amplitude']
+
+    x = np.linspace(1., 10., 500)
+    assert np.allclose(compound(x), model(x), rtol=1.e-14, atol=0.)
+
+    assert sp_compound.SummedCompoundModel([components[0]]).to_compound() is components[0]
+    assert sp_compound.SummedCompoundModel().to_compound() is None
+
+
+def test_flatten():
+    components = _components(3)
+    model = sp_compound.flatten(components[0] + components[1] + components[2])
+    assert isinstance(model, sp_compound.SummedCompoundModel)
+    assert [c.name for c in model] == ['g0', 'g1', 'g2']
+    assert sp_compound.flatten(components[0]) is components[0]
+    product = components[0] * components[1]
+    assert sp_compound.flatten(product) is product
+
+
+def test_fit_model_from_file(tmpdir):
+    x = np.linspace(1., 10., 500)
+    y = models.Gaussian1D(2., 4., 0.3)(x) + models.Gaussian1D(1., 6.5, 0.5)(x) + 0.5
+    start = models.Gaussian1D(1.5, 4.1, 0.4, name='g1') + \
+            models.Gaussian1D(1., 6.4, 0.4, name='g2', tied={'amplitude': sp_ties.Tie(0.5, 'g1', 'amplitude')}) + \
+            models.Const1D(0.3)
+    fname = str(tmpdir.join('model.py'))
+    sp_model_io.saveModel(start, fname)
+
+    # models read from file are astropy models, that fitters can use.
+    model, directory = sp_model_io.buildModelFromFile(fname)
+    assert isinstance(model, Model)
+    fitted = fitting.LevMarLSQFitter()(model, x, y)
+    assert np.allclose(fitted.parameters, [2., 4., 0.3, 1., 6.5, 0.5, 0.5], rtol=1.e-6, atol=1.e-6)
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+import models_registry
+import sp_derivs
+
+
+x = np.linspace(1., 10., 901)
+
+
+# centered finite difference of a component's flux with
+# respect to the i-th parameter, at the given values.
+def _finite_difference(component, values, i):
+    step = 1.e-6 * max(1., abs(values[i]))
+    up = values.copy()
+    down = values.copy()
+    up[i] += step
+    down[i] -= step
+    component.parameters = up
+    f_up = component(x)
+    component.parameters = down
+    f_down = component(x)
+    component.parameters = values
+    return (f_up - f_down) / (2. * step)
+
+
+@pytest.mark.parametrize('name', sorted(models_registry.registry))
+def test_derivative(name, sample_component):
+    component = sample_component(name)
+    values = component.parameters.copy()
+
+    derivative = sp_derivs.derivative(component)
+    assert derivative is not None
+    analytic = derivative(x, *values)
+    assert len(analytic) == len(component.param_names)
+
+    for i, param_name in enumerate(component.param_names):
+        numeric = _finite_difference(component, values, i)
+        assert np.allclose(np.broadcast_to(analytic[i], x.shape), numeric, rtol=1.e-5, atol=1.e-6), \
+            "%s: wrong derivative with respect to %s" % (name, param_name)
+
+
+def test_wrong_derivative_fails(sample_component):
+    component = sample_component('Gaussian1D')
+    values = component.parameters.copy()
+    analytic = sp_derivs.derivative(component)(x, *values)
+    numeric = _finite_difference(component, values, 2)
+    assert not np.allclose(1.01 * analytic[2], numeric, rtol=1.e-5, atol=1.e-6)
@@ -0,0 +1,144 @@
+import numpy as np
+
+import models_registry
+import sp_eval
+from astropy.modeling import models
+
+
+def _gaussians(n):
+    return [models.Gaussian1D(1., 5. + 0.01 * i, 0.5) for i in range(n)]
+
+
+# counts the calls to CompiledSpectrum's evaluation of components.
+class _Counter(object):
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, component, *args, **kwargs):
+        self.calls += 1
+        return self.evaluate_pieces(component, *args, **kwargs)
+
+
+def _count(monkeypatch):
+    counter = _Counter()
+    counter.evaluate_pieces = sp_eval.evaluate_pieces
+    monkeypatch.setattr(sp_eval, 'evaluate_pieces', counter)
+    return counter
+
+
+def test_cache_hits(monkeypatch):
+    counter = _count(monkeypatch)
+    components = _gaussians(10)
+    wave = np.linspace(1., 10., 1000)
+    cache = sp_eval.FluxCache()
+    spectrum = sp_eval.CompiledSpectrum(components, cache=cache)
+
+    expected = spectrum(wave)
+    assert counter.calls == 10
+    components[3].amplitude = 2.
+    result = spectrum(wave)
+    assert counter.calls == 11
+    assert np.allclose(result - expected, components[3](wave) / 2.)
+
+
+def test_cache_bound_in_bytes():
+    components = _gaussians(10)
+    wave = np.linspace(1., 10., 1000)
+    cache = sp_eval.FluxCache(maxbytes=5 * wave.nbytes)
+    spectrum = sp_eval.CompiledSpectrum(components[:5], cache=cache)
+    spectrum(wave)
+    assert cache.nbytes == 5 * wave.nbytes
+
+    # a second spectrum evicts the least recently used entries.
+    sp_eval.CompiledSpectrum(components[5:8], cache=cache)(wave)
+    assert len(cache) == 5
+    assert cache.nbytes <= cache.maxbytes
+
+
+def test_cache_bypassed_when_too_small(monkeypatch):
+    counter = _count(monkeypatch)
+    components = _gaussians(10)
+    wave = np.linspace(1., 10., 1000)
+    cache = sp_eval.FluxCache(maxbytes=9 * wave.nbytes)
+    spectrum = sp_eval.CompiledSpectrum(components, cache=cache)
+    expected = sp_eval.CompiledSpectrum(components)(wave)
+
+    assert np.allclose(spectrum(wave), expected)
+    assert np.allclose(spectrum(wave, fast=True), expected)
+    assert len(cache) == 0
+    assert cache.nbytes == 0
+
+
+def test_cache_retain():
+    components = _gaussians(10)
+    wave = np.linspace(1., 10., 1000)
+    cache = sp_eval.FluxCache()
+    sp_eval.CompiledSpectrum(components, cache=cache)(wave)
+    cache.retain(components[:4])
+    assert len(cache) == 4
+    assert cache.nbytes == 4 * wave.nbytes
+
+
+def test_descending_grid():
+    components = _gaussians(10) + [models.Lorentz1D(1., 4., 0.3), models.Const1D(0.5)]
+    wave = np.linspace(10., 1., 20000)
+    wave_, runs, order = sp_eval.sort_grid(wave)
+    assert runs == [(0, len(wave))]
+    assert np.all(np.diff(wave_) >= 0)
+
+    expected = sp_eval.CompiledSpectrum(components)(wave)
+    for fast in (False, True):
+        for cache in (None, sp_eval.FluxCache()):
+            spectrum = sp_eval.CompiledSpectrum(components, cache=cache, nwidths=50.)
+            assert np.allclose(spectrum(wave, fast), expected, rtol=0., atol=2.e-4)
+
+
+def test_unsorted_grid():
+    components = _gaussians(10)
+    wave = np.random.RandomState(1).uniform(1., 10., 5000)
+    expected = sp_eval.CompiledSpectrum(components)(wave)
+    spectrum = sp_eval.CompiledSpectrum(components, nwidths=8.)
+    assert np.allclose(spectrum(wave), expected, rtol=0., atol=1.e-12)
+
+
+def test_packed_grids_not_sorted():
+    wave = np.concatenate([np.linspace(1., 10., 100)] * 3)
+    wave_, runs, order = sp_eval.sort_grid(wave)
+    assert wave_ is wave
+    assert order is None
+    assert runs == [(0, 100), (100, 200), (200, 300)]
+
+
+def test_fast_spectrum(sample_component):
+    components = [sample_component(name) for name in sorted(models_registry.registry)]
+    wave = np.linspace(1., 10., 901)
+
+    for nwidths in (None, 8.):
+        for cache in (None, sp_eval.FluxCache()):
+            spectrum = sp_eval.CompiledSpectrum(components, cache=cache, nwidths=nwidths)
+            assert np.allclose(spectrum(wave, fast=True), spectrum(wave, fast=False),
+                               rtol=1.e-12, atol=1.e-12)
+
+
+def test_pack_grids():
+    waves = [np.linspace(1., 10., 10), np.linspace(2., 3., 3), np.linspace(5., 9., 7)]
+    packed, bounds = sp_eval.pack_grids(waves)
+    assert list(bounds) == [0, 10, 13, 20]
+    for wave, view in zip(waves, sp_eval.unpack_grids(packed, bounds)):
+        assert np.array_equal(view, wave)
+
+    # the same grids, already concatenated.
+    packed_, bounds_ = sp_eval.pack_grids(packed, offsets=[0, 10, 13])
+    assert list(bounds_) == [0, 10, 13, 20]
+    assert np.array_equal(packed_, packed)
+
+
+def test_packed_spectrum():
+    components = _gaussians(10) + [models.Const1D(0.5)]
+    waves = [np.linspace(1., 10., 1000), np.linspace(4., 6., 17), np.linspace(9., 2., 300)]
+    packed, bounds = sp_eval.pack_grids(waves)
+    for nwidths in (None, 8.):
+        spectrum = sp_eval.CompiledSpectrum(components, nwidths=nwidths)
+        results = sp_eval.unpack_grids(spectrum(packed), bounds)
+        for wave, result in zip(waves, results):
+            assert np.allclose(result, spectrum(wave), rtol=1.e-12, atol=1.e-12)
@@ -0,0 +1,51 @@
+import numpy as np
+
+import sp_fit
+from astropy.modeling import models
+
+
+def _data(x):
+    true = [models.Gaussian1D(2., 4., 0.3), models.Gaussian1D(1., 6.5, 0.5), models.Const1D(0.5)]
+    y = sum(m(x) for m in true) + np.random.RandomState(2).normal(0., 0.01, len(x))
+    start = [models.Gaussian1D(1.5, 4.1, 0.4), models.Gaussian1D(1.2, 6.4, 0.4), models.Const1D(0.3)]
+    return y, start
+
+
+def _parameters(result):
+    return np.concatenate([m.parameters for m in result.components])
+
+
+def test_sparse_descending():
+    x = np.linspace(10., 1., 2000)
+    y, start = _data(x)
+    dy = np.full(len(x), 0.01)
+
+    dense = sp_fit.fit([m.copy() for m in start], x, y, dy)
+    sparse = sp_fit.fit([m.copy() for m in start], x, y, dy, sparse=True)
+    assert np.allclose(_parameters(sparse), _parameters(dense), rtol=1.e-4, atol=1.e-6)
+    assert np.isclose(sparse.chi2, dense.chi2, rtol=1.e-4)
+
+    # same solution as with the data in increasing order.
+    ascending = sp_fit.fit([m.copy() for m in start], x[::-1], y[::-1], dy, sparse=True)
+    assert np.allclose(_parameters(sparse), _parameters(ascending), rtol=1.e-6, atol=1.e-9)
+
+
+def test_fit_many():
+    x = np.linspace(1., 10., 500)
+    y, start = _data(x)
+    fluxes = np.array([y * scale for scale in (1., 1.2, 0.8, 1.5)])
+    dy = np.full(len(x), 0.01)
+
+    # two worker processes, sharing the arrays through the pool initializer.
+    batch = sp_fit.fit_many(start, x, fluxes, dy=dy, processes=2)
+    assert len(batch) == len(fluxes)
+    assert np.all(batch.success)
+    for i, flux in enumerate(fluxes):
+        serial = sp_fit.fit([m.copy() for m in start], x, flux, dy)
+        assert np.allclose(batch.parameters[i], _parameters(serial), rtol=1.e-8, atol=1.e-10)
+        assert np.isclose(batch.chi2[i], serial.chi2, rtol=1.e-8)
+        parameters = np.concatenate([m.parameters for m in batch.components(i)])
+        assert np.array_equal(parameters, batch.parameters[i])
+
+    # the template is left untouched.
+    assert start[0].amplitude.value == 1.5
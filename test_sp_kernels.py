@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+import models_registry
+import sp_kernels
+
+
+x = np.linspace(1., 10., 901)
+
+
+# adding into a non-zero buffer checks that the
+# kernel accumulates, rather than overwrites.
+def _check(component):
+    assert sp_kernels.kernel(component) is not None
+    result = sp_kernels.evaluate(component, x, np.ones_like(x)) - 1.
+    assert np.allclose(result, component(x), rtol=1.e-12, atol=1.e-12)
+
+
+@pytest.mark.parametrize('name', sorted(models_registry.registry))
+def test_kernel(name, sample_component):
+    _check(sample_component(name))
+
+
+@pytest.mark.parametrize('name', ['Chebyshev1D', 'Legendre1D', 'Polynomial1D'])
+def test_polynomial_domain(name, sample_component):
+    component = sample_component(name)
+    component.domain = [1., 10.]
+    _check(component)
+
+
+# edges that fall right on grid points.
+@pytest.mark.parametrize('name, values', [('Box1D', (1.5, 5., 2.)),
+                                          ('Trapezoid1D', (1.5, 5., 2., 1.5))])
+def test_edges(name, values):
+    component = models_registry.registry[name].copy()
+    component.parameters = np.array(values)
+    _check(component)
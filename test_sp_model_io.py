@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+from astropy.modeling import models
+
+import sp_model_io
+import sp_ties
+
+
+def test_parse_tie():
+    tie = sp_ties.Tie(0.5, 'g1', 'amplitude')
+    assert sp_model_io.parse_tie(sp_model_io.get_tie_text(tie)) == tie
+    assert sp_model_io.parse_tie("lambda m: 2 * m[0].mean") == sp_ties.Tie(2, 0, 'mean')
+    assert sp_model_io.parse_tie("False") is False
+    assert sp_model_io.parse_tie("") is False
+
+
+@pytest.mark.parametrize('text', ["lambda m: m[0].mean", "lambda m: 2 * m[0]", "0.5 * m[0].mean",
+                                  "lambda m: 2 * m[0].mean +", "lambda m: x * m[0].mean"])
+def test_parse_tie_invalid(text):
+    with pytest.raises(ValueError):
+        sp_model_io.parse_tie(text)
+
+
+def _model():
+    return models.Polynomial1D(2, domain=[1., 10.], c0=0.5, c1=0.2, c2=-0.01, name='continuum') + \
+           models.Gaussian1D(2., 4., 0.3, name='g1', bounds={'stddev': (0.1, None)}) + \
+           models.Gaussian1D(1., 6.5, 0.5, name='g2', fixed={'mean': True},
+                             tied={'amplitude': sp_ties.Tie(0.5, 'g1', 'amplitude')}) + \
+           models.Legendre1D(1, c0=0.1, c1=0.)
+
+
+@pytest.mark.parametrize('extension', ['.json', '.npz', '.py'])
+def test_round_trip(tmpdir, extension):
+    model = _model()
+    fname = str(tmpdir.join('model' + extension))
+    sp_model_io.saveModel(model, fname)
+    result, directory = sp_model_io.buildModelFromFile(fname)
+    assert result is not None
+    assert directory == str(tmpdir)
+
+    assert np.array_equal(result.parameters, model.parameters)
+    for component, expected in zip(result, model):
+        assert type(component) is type(expected)
+        assert component.name == expected.name
+        for name in sp_model_io._ARGUMENTS:
+            assert np.array_equal(getattr(component, name, None), getattr(expected, name, None))
+        for param_name in expected.param_names:
+            assert component.bounds[param_name] == expected.bounds[param_name]
+            assert component.fixed[param_name] == expected.fixed[param_name]
+            assert sp_model_io.get_tie_text(component.tied[param_name]) == \
+                   sp_model_io.get_tie_text(expected.tied[param_name])
+
+    x = np.linspace(1., 10., 100)
+    assert np.allclose(result(x), model(x))
@@ -0,0 +1,91 @@
+import numpy as np
+from astropy.modeling import models
+
+import sp_params
+
+
+def _components():
+    return [models.Gaussian1D(2., 4., 0.3, name='g1'),
+            models.Lorentz1D(1., 6., 0.4, name='l1', bounds={'fwhm': (0.1, None)}),
+            models.Const1D(0.5, name='c1', fixed={'amplitude': True})]
+
+
+def test_bind():
+    components = _components()
+    store = sp_params.ParameterStore(components)
+    assert list(store.offsets) == [0, 3, 6, 7]
+    assert np.array_equal(store.values, [2., 4., 0.3, 1., 6., 0.4, 0.5])
+    assert store.min[5] == 0.1
+    assert np.isnan(store.max[5])
+    assert list(store.fixed) == [False] * 6 + [True]
+    assert np.array_equal(store.values[store.slice(1)], components[1].parameters)
+
+
+def test_component_setters():
+    components = _components()
+    store = sp_params.ParameterStore(components)
+
+    # components write through to the store.
+    components[1].x_0 = 7.
+    components[0].parameters = [3., 5., 0.2]
+    components[0].fixed['mean'] = True
+    components[1].bounds['amplitude'] = (0., 10.)
+    components[1].amplitude.min = -1.
+    assert np.array_equal(store.values[:5], [3., 5., 0.2, 1., 7.])
+    assert store.fixed[1]
+    assert (store.min[3], store.max[3]) == (-1., 10.)
+
+    # and read from it.
+    store.values[2] = 0.6
+    store.fixed[6] = False
+    store.max[5] = 2.
+    assert components[0].stddev.value == 0.6
+    assert components[0].parameters[2] == 0.6
+    assert not components[2].fixed['amplitude']
+    assert components[1].bounds['fwhm'] == (0.1, 2.)
+
+    snapshot = store.snapshot()
+    components[0].amplitude = 9.
+    store.restore(snapshot)
+    assert components[0].amplitude.value == 3.
+
+
+def test_copy_detached():
+    components = _components()
+    store = sp_params.ParameterStore(components)
+    copies = [c.copy() for c in components]
+
+    copies[0].amplitude = 5.
+    copies[0].fixed['mean'] = True
+    copies[1].bounds['fwhm'] = (1., 2.)
+    assert store.values[0] == 2.
+    assert not store.fixed[1]
+    assert store.min[5] == 0.1
+
+    store.values[0] = 7.
+    assert copies[0].amplitude.value == 5.
+    assert components[0].amplitude.value == 7.
+
+
+def test_remove_component():
+    components = _components()
+    store = sp_params.ParameterStore(components)
+    removed = components.pop(1)
+    store.bind(components)
+    assert list(store.offsets) == [0, 3, 4]
+    assert np.array_equal(store.values, [2., 4., 0.3, 0.5])
+
+    # the components left in the store are views of the new arrays.
+    components[1].amplitude = 0.7
+    components[0].bounds['stddev'] = (0.1, 1.)
+    assert store.values[3] == 0.7
+    assert store.min[2] == 0.1
+    assert store.fixed[3]
+
+    # and the removed component still works, detached from the store.
+    removed.x_0 = 8.
+    assert removed.x_0.value == 8.
+    assert removed.bounds['fwhm'] == (0.1, None)
+    assert not np.any(store.values == 8.)
+    x = np.linspace(1., 10., 10)
+    assert np.allclose(removed(x), models.Lorentz1D(1., 8., 0.4)(x))
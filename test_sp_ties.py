@@ -0,0 +1,102 @@
+import pytest
+from astropy.modeling import models
+
+import sp_ties
+
+
+def _gaussian(name, tie=None):
+    component = models.Gaussian1D(1., 5., 0.5, name=name)
+    if tie is not None:
+        component.tied['amplitude'] = tie
+    return component
+
+
+def test_text():
+    tie = sp_ties.Tie(0.5, 'g1', 'amplitude')
+    assert tie.text == "lambda m: 0.5 * m['g1'].amplitude"
+    assert sp_ties.Tie(2, 0, 'mean').text == "lambda m: 2 * m[0].mean"
+
+
+def test_from_function():
+    assert sp_ties.from_function(lambda m: 0.5 * m['g1'].amplitude) == sp_ties.Tie(0.5, 'g1', 'amplitude')
+    assert sp_ties.from_function(lambda m: 2 * m[0].mean) == sp_ties.Tie(2, 0, 'mean')
+
+    # the decoded tie computes the same value as the function.
+    model = _gaussian('g1') + _gaussian('g2')
+    function = lambda m: 0.25 * m['g1'].amplitude
+    assert sp_ties.from_function(function)(model) == function(model)
+
+
+@pytest.mark.parametrize('function', [lambda m: m['g1'].amplitude,
+                                      lambda m: 0.5 * m['g1'].amplitude + 1.,
+                                      lambda m, n: 0.5 * n['g1'].amplitude,
+                                      lambda m: 0.5 * m.amplitude,
+                                      abs])
+def test_from_function_invalid(function):
+    with pytest.raises(ValueError):
+        sp_ties.from_function(function)
+
+
+def test_cycle_rejected():
+    g1 = _gaussian('g1')
+    g2 = _gaussian('g2', sp_ties.Tie(0.5, 'g1', 'amplitude'))
+    graph = sp_ties.TieGraph([g1, g2])
+
+    with pytest.raises(sp_ties.TieCycleError):
+        graph.tie(g1, 'amplitude', sp_ties.Tie(2., 'g2', 'amplitude'))
+    assert not g1.tied['amplitude']
+    with pytest.raises(sp_ties.TieCycleError):
+        graph.tie(g1, 'amplitude', sp_ties.Tie(1., 'g1', 'amplitude'))
+
+    # a component added with a tie that closes a cycle gets in
+    # the graph, without the offending tie.
+    g3 = _gaussian('g3', sp_ties.Tie(0.5, 'g4', 'amplitude'))
+    graph.add(g3)
+    g4 = _gaussian('g4', sp_ties.Tie(2., 'g3', 'amplitude'))
+    with pytest.raises(sp_ties.TieCycleError):
+        graph.add(g4)
+    assert graph.find('g4') is g4
+    assert not g4.tied['amplitude']
+    assert graph.target(g3, 'amplitude') == (g4, 'amplitude')
+
+
+def test_rename():
+    g1 = _gaussian('g1')
+    g2 = _gaussian('g2', sp_ties.Tie(0.5, 'g1', 'amplitude'))
+    g3 = _gaussian('g3', sp_ties.Tie(0.25, 'g1', 'amplitude'))
+    graph = sp_ties.TieGraph([g1, g2, g3])
+
+    g1._name = 'line'
+    changed = graph.rename(g1, 'g1', 'line')
+    assert sorted((c.name, p, t) for c, p, t in changed) == \
+           [('g2', 'amplitude', sp_ties.Tie(0.5, 'line', 'amplitude')),
+            ('g3', 'amplitude', sp_ties.Tie(0.25, 'line', 'amplitude'))]
+    assert g2.tied['amplitude'] == sp_ties.Tie(0.5, 'line', 'amplitude')
+    assert graph.find('line') is g1
+    assert graph.find('g1') is None
+    assert graph.dependents('g1') == []
+    assert len(graph.dependents('line')) == 2
+
+    # ties that don't refer to the renamed component are left alone.
+    assert graph.rename(g2, 'g2', 'other') == []
+
+
+def test_roots():
+    # chain g4 -> g3 -> g2 -> g1, added out of order.
+    g1 = _gaussian('g1')
+    g2 = _gaussian('g2', sp_ties.Tie(2., 'g1', 'amplitude'))
+    g3 = _gaussian('g3', sp_ties.Tie(3., 'g2', 'amplitude'))
+    g4 = _gaussian('g4', sp_ties.Tie(0.5, 'g3', 'amplitude'))
+    graph = sp_ties.TieGraph([g4, g2, g1, g3])
+
+    roots = dict(((c.name, p), (f, r.name, rp)) for c, p, f, r, rp in graph.roots())
+    assert roots == {('g2', 'amplitude'): (2., 'g1', 'amplitude'),
+                     ('g3', 'amplitude'): (6., 'g1', 'amplitude'),
+                     ('g4', 'amplitude'): (3., 'g1', 'amplitude')}
+
+    # ties to components that are not in the graph are ignored,
+    # so g2 becomes the root of the chain.
+    graph.remove(g1)
+    roots = dict(((c.name, p), (f, r.name, rp)) for c, p, f, r, rp in graph.roots())
+    assert roots == {('g3', 'amplitude'): (3., 'g2', 'amplitude'),
+                     ('g4', 'amplitude'): (1.5, 'g2', 'amplitude')}
@@ -0,0 +1,113 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('PyQt4')
+
+from PyQt4.QtGui import QApplication
+from astropy.modeling import models
+
+import models_registry
+import sp_widget
+
+
+@pytest.fixture(scope='module')
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+def _manager(components):
+    manager = sp_widget.SpectralModelManager()
+    manager.buildMainPanel(components)
+    return manager
+
+
+def test_spectrum_many(app):
+    manager = _manager([models.Gaussian1D(1., 5., 0.7), models.Lorentz1D(2., 3., 0.4),
+                        models.Const1D(0.5)])
+    waves = [np.linspace(1., 10., 1000), np.linspace(4., 6., 17), np.linspace(9., 2., 300)]
+    expected = [manager.spectrum(wave) for wave in waves]
+
+    results = manager.spectrum_many(waves)
+    assert [len(r) for r in results] == [1000, 17, 300]
+    for result, e in zip(results, expected):
+        assert np.allclose(result, e, rtol=1.e-12, atol=1.e-12)
+
+    # the same grids, concatenated, with their offsets.
+    results = manager.spectrum_many(np.concatenate(waves), offsets=[0, 1000, 1017])
+    for result, e in zip(results, expected):
+        assert np.allclose(result, e, rtol=1.e-12, atol=1.e-12)
+
+    # results are views into one single buffer.
+    assert results[1].base is results[0].base
+
+
+def test_discover(app, tmpdir, monkeypatch):
+    registry = models_registry.LazyRegistry()
+    monkeypatch.setattr(models_registry, 'registry', registry)
+    monkeypatch.setattr(models_registry, 'catalog_file', str(tmpdir.join('catalog.json')))
+
+    sp_widget.SpectralModelManager()
+    assert len(registry) == 0
+    sp_widget.SpectralModelManager(discover=True)
+    assert 'Gaussian1D' in registry
+    assert tmpdir.join('catalog.json').check()
+
+
+# index of the 'value' row of the first parameter of a component.
+def _value_index(model, row):
+    component = model.index(row, 0)
+    parameter = model.index(1, 0, component)
+    return model.index(0, 0, parameter)
+
+
+def test_read_only_during_fit(app):
+    x = np.linspace(1., 10., 200)
+    y = models.Gaussian1D(2., 5., 0.5)(x)
+    manager = _manager([models.Gaussian1D(1., 5.2, 0.7)])
+    model = manager.models_gui.model
+    index = _value_index(model, 0)
+    assert model.setData(index, "amplitude: 1.5")
+    assert manager.components[0].amplitude.value == 1.5
+
+    progress = manager.startFit(x, y)
+    try:
+        assert not model.flags(index) & sp_widget.Qt.ItemIsEditable
+        assert not model.setData(index, "amplitude: 3.")
+    finally:
+        progress.cancel()
+        manager._fit_thread.wait()
+        app.processEvents()
+
+    # cancelling restores the values the fit started from.
+    assert manager.components[0].amplitude.value == 1.5
+    assert model.flags(index) & sp_widget.Qt.ItemIsEditable
+    assert model.setData(index, "amplitude: 3.")
+    assert manager.components[0].amplitude.value == 3.
+
+
+def test_precision_round_trip():
+    x = np.linspace(1., 10., 1001) + 1.e-9
+    y = np.sin(x)
+    manager = sp_widget.SpectralModelManager()
+    manager.setArrays(x, y)
+
+    manager.setPrecision(np.float32)
+    assert manager.x.dtype == np.float32
+    assert manager.y.dtype == np.float32
+
+    manager.setPrecision('float64')
+    assert manager.x is x
+    assert manager.y is y
+
+    # arrays set while in single precision are kept as given too.
+    manager.setPrecision(np.float32)
+    manager.setArrays(x, y)
+    assert manager.x.dtype == np.float32
+    manager.setPrecision(np.float64)
+    assert manager.x is x
+
+
+def test_precision_invalid():
+    manager = sp_widget.SpectralModelManager()
+    with pytest.raises(ValueError):
+        manager.setPrecision(np.float16)